@@ -1,74 +1,360 @@
-from datetime import datetime
+from datetime import datetime, timezone
+import argparse
+import signal
+import time
+import traceback
 import pytz
 
-from src.config import load_settings, resolve_thresholds
-from src.data_sources import get_top100_markets_coingecko, get_coinbase_products, pick_usd_pairs, fetch_coinbase_ohlcv, timeframe_to_granularity_seconds
-from src.strategy_rotator import filter_and_rank, load_prev_top, diff_labels, save_top, compute_entry_sl_tp
+from src.config import load_settings, load_profiles, resolve_thresholds
+from src.data_sources import get_symbol_to_product, timeframe_to_granularity_seconds, get_client, close_client
+from src.pipeline import make_http_cache, make_candle_store, make_candle_source, make_candle_cache, make_history, make_market_feed
+from src.indicators import IndicatorBook, indicator_state_path
+from src.strategy_rotator import filter_and_rank, load_prev_top, diff_labels, save_top, compute_entry_sl_tp, timeframe_state_file
 from src.formatter import build_message_lv
 from src.notifier import send_telegram_message
+from src.replay import install_from_env
+from src.metrics import METRICS
+from src.ratelimit import LIMITER, parse_limits
+from src.profiler import profiled
+from src.shard import parse_shard, write_partial, load_partials, merge_partials
 
-def main():
-    cfg = load_settings()
-    eff = resolve_thresholds(cfg)
-
-    print(f"Using TF={cfg.TIMEFRAME}; effective thresholds: {eff}")
-
-    # 1) CoinGecko Top-100
-    markets = get_top100_markets_coingecko(cfg.COINGECKO_BASE)
-
-    # 2) Coinbase USD pairs
-    products = get_coinbase_products(cfg.COINBASE_BASE)
-    symbol_to_product = pick_usd_pairs(products)
-
-    # 3) Filter & Rank
-    ranked, skipped = filter_and_rank(
-        markets=markets,
-        symbol_to_product=symbol_to_product,
-        ohlcv_fetcher=lambda pid, gran, lim: fetch_coinbase_ohlcv(cfg.COINBASE_BASE, pid, gran, lim),
-        timeframe=cfg.TIMEFRAME,
-        ma_period=eff["MA_PERIOD"],
-        rsi_threshold=eff["RSI_THRESHOLD"],
-        atr_pct_min=eff["ATR_PCT_MIN"],
-        min_24h_volume_usd=eff["MIN_24H_VOLUME_USD"],
-        min_24h_pct=eff["MIN_24H_PCT"],
-        top_n=cfg.TOP_N
-    )
+def run_label(profile, timeframe) -> str:
+    return f"{profile}:{timeframe}" if profile else timeframe
+
+def run_timeframe(cfg, timeframe, markets, symbol_to_product, candles, book, state_file, now_riga, history=None,
+                  profile="", memo=None):
+    """3)–6) solis vienam TF (un profilam). Atgriež (ziņas teksts, skipped)."""
+    ranked, skipped, ranking = rank_timeframe(cfg, timeframe, markets, symbol_to_product, candles, book,
+                                              profile, memo, keep_ranking=history is not None)
+    text = publish_timeframe(cfg, timeframe, ranked, skipped, ranking, state_file, now_riga, history, profile)
+    return text, skipped
+
+def rank_timeframe(cfg, timeframe, markets, symbol_to_product, candles, book, profile="", memo=None,
+                   keep_ranking=False, shard=None):
+    """3)–4) solis: rangs un padomi (tikai savai daļai, ja dots `shard`). Atgriež (ranked, skipped, ranking)."""
+    eff = resolve_thresholds(cfg, timeframe)
+    ranking = [] if keep_ranking else None
+    label = run_label(profile, timeframe)
+    print(f"Using TF={label}; effective thresholds: {eff}")
+
+    # 3) Filter & Rank (sveces caur skrējiena kešu, ko izmanto arī 4. solis)
+    with METRICS.stage(f"filter_and_rank[{label}]"):
+        ranked, skipped = filter_and_rank(
+            markets=markets,
+            symbol_to_product=symbol_to_product,
+            ohlcv_fetcher=candles,
+            timeframe=timeframe,
+            ma_period=eff["MA_PERIOD"],
+            rsi_threshold=eff["RSI_THRESHOLD"],
+            atr_pct_min=eff["ATR_PCT_MIN"],
+            min_24h_volume_usd=eff["MIN_24H_VOLUME_USD"],
+            min_24h_pct=eff["MIN_24H_PCT"],
+            top_n=cfg.TOP_N,
+            max_workers=cfg.FETCH_CONCURRENCY,
+            indicator_book=book,
+            atr_score_cap=cfg.ATR_SCORE_CAP,
+            best_first=cfg.BEST_FIRST,
+            ranking=ranking,
+            indicator_memo=memo,
+            shard=shard
+        )
+    METRICS.count_skips(skipped)
 
     # 4) Advice (optional)
     if cfg.ADVICE_ENABLED:
-        for r in ranked:
-            df = fetch_coinbase_ohlcv(cfg.COINBASE_BASE, r["product_id"], timeframe_to_granularity_seconds(cfg.TIMEFRAME), 300)
-            if df is not None and len(df) > 50:
-                r["advice"] = compute_entry_sl_tp(r, df)
+        with METRICS.stage(f"advice[{label}]"):
+            for r in ranked:
+                df = candles(r["product_id"], timeframe_to_granularity_seconds(timeframe), 300)
+                if df is not None and len(df) > 50:
+                    r["advice"] = compute_entry_sl_tp(r, df)
+    return ranked, skipped, ranking
+
+def publish_timeframe(cfg, timeframe, ranked, skipped, ranking, state_file, now_riga, history=None, profile=""):
+    """5)–6) solis: NEW/KEEP/DROP pret state/vēsturi, saglabāšana un ziņas teksts."""
+    label = run_label(profile, timeframe)
 
     # 5) Labels & prev ranks
-    prev_syms, prev_ranks = load_prev_top(cfg.STATE_FILE)
-    cur_syms = [r["symbol"] for r in ranked]
-    labels = diff_labels(cur_syms, prev_syms)
-    changed = save_top(cfg.STATE_FILE, ranked)
+    with METRICS.stage(f"state[{label}]"):
+        if history is not None:
+            prev_syms, prev_ranks = history.prev_top(label, legacy_state_file=state_file)
+        else:
+            prev_syms, prev_ranks = load_prev_top(state_file)
+        cur_syms = [r["symbol"] for r in ranked]
+        labels = diff_labels(cur_syms, prev_syms)
+        if history is not None:
+            changed = history.append(label, ranked, cfg.TOP_N, ranking, skipped, ts=now_riga.timestamp())
+        else:
+            changed = save_top(state_file, ranked)
 
     # 6) Build message
+    with METRICS.stage(f"format[{label}]"):
+        text = build_message_lv(
+            now_riga=now_riga,
+            timeframe=timeframe,
+            top_rows=ranked,
+            labels=labels,
+            short_format=cfg.SHORT_FORMAT,
+            include_advice=cfg.ADVICE_ENABLED,
+            detail_emoji=cfg.DETAIL_EMOJI,
+            long_format=cfg.LONG_FORMAT,
+            prev_ranks=prev_ranks
+        )
+    return text
+
+def run_cycle(cfg, timeframes, multi, markets, symbol_to_product, candles, book, history=None,
+              profile="", memo=None):
+    """3)–7) solis dotajiem TF: rangs, state faili, ziņa un sūtīšana. Atgriež (text, skipped, delivery)."""
+    now_riga = datetime.now(pytz.timezone("Europe/Riga"))
+
+    # 3)–6) katram TF (vairāku TF režīmā katram savs state fails)
+    texts, skipped = [], []
+    for tf in timeframes:
+        state_file = timeframe_state_file(cfg.STATE_FILE, tf) if multi else cfg.STATE_FILE
+        t, s = run_timeframe(cfg, tf, markets, symbol_to_product, candles, book, state_file, now_riga, history,
+                             profile, memo)
+        texts.append(t)
+        skipped.extend(s)
+    if book is not None:
+        book.save()
+    text = "\n\n".join(texts)
+    return text, skipped, send(cfg, text, profile)
+
+def send(cfg, text, profile=""):
+    """7) solis: ziņa visiem profila čatiem. Atgriež piegādes atskaiti."""
+    print(f"Found {len(cfg.TELEGRAM_CHAT_IDS)} Telegram chat IDs." + (f" (profile {profile})" if profile else ""))
+    with METRICS.stage(f"send[{profile}]" if profile else "send"):
+        return send_telegram_message(cfg.TELEGRAM_BOT_TOKEN, cfg.TELEGRAM_CHAT_IDS, text,
+                                     max_workers=cfg.TELEGRAM_CONCURRENCY)
+
+def profile_timeframes(cfg):
+    return cfg.TIMEFRAMES or [cfg.TIMEFRAME]
+
+def run_profiles(profiles, markets, symbol_to_product, candles, book, history=None, due=None):
+    """
+    Visi profili no vienas datu ielādes: tirgi (MarketFeed atkārto), produktu karte un
+    sveču kešs kopīgi, indikatori vienreiz katram (produkts, TF, MA_PERIOD).
+    `due` — tikai šie TF (daemon). Atgriež [(profils, text, skipped, delivery)].
+    """
+    memo = {}
+    out = []
+    for name, cfg in profiles:
+        tfs = profile_timeframes(cfg)
+        run_tfs = [tf for tf in tfs if due is None or tf in due]
+        if not run_tfs:
+            continue
+        text, skipped, delivery = run_cycle(cfg, run_tfs, len(tfs) > 1, markets, symbol_to_product, candles, book,
+                                            history, name, memo)
+        out.append((name, text, skipped, delivery))
+    return out
+
+def write_metrics(cfg, candles) -> None:
+    for k, v in candles.stats().items():
+        METRICS.inc(f"candle_cache_{k}", v)
+    if cfg.METRICS_DIR:
+        METRICS.write(cfg.METRICS_DIR)
+
+def run_shard(cfg, profiles, timeframes, shard, partial_path):
+    """
+    --shard i/N: tirgi un produktu karte visi, sveces un indikatori tikai savai daļai;
+    state, vēsture un Telegram netiek aiztikti — rezultāts iet daļējā failā.
+    """
+    i, n = shard
+    http_cache = make_http_cache(cfg)
+    with METRICS.stage("market_feed"):
+        markets = make_market_feed(cfg, http_cache)
+    with METRICS.stage("product_map"):
+        symbol_to_product = get_symbol_to_product(cfg.COINBASE_BASE, http_cache, cfg.PRODUCTS_TTL_S)
+    candles = make_candle_cache(cfg, timeframes)
+    # katrai daļai savs indikatoru stāvoklis (tie paši produkti katrā skrējienā)
+    book_file = timeframe_state_file(cfg.STATE_FILE, f"shard{i + 1}of{n}")
+    book = IndicatorBook(indicator_state_path(book_file)) if cfg.STREAMING_INDICATORS else None
+    memo = {}
+    results = {}
+    for name, p in profiles:
+        for tf in profile_timeframes(p):
+            ranked, skipped, ranking = rank_timeframe(p, tf, markets, symbol_to_product, candles, book, name, memo,
+                                                      keep_ranking=bool(p.HISTORY_DB), shard=shard)
+            results[run_label(name, tf)] = {"top": ranked, "skipped": skipped, "ranking": ranking}
+    if book is not None:
+        book.save()
+    with METRICS.stage("write_partial"):
+        write_partial(partial_path, shard, results, {"ts": time.time(), "candle_cache": candles.stats()})
+    print(f"[shard {i + 1}/{n}] wrote {partial_path}: "
+          + ", ".join(f"{k}: top {len(v['top'])}, skipped {len(v['skipped'])}" for k, v in results.items()))
+    return candles
+
+def run_merge(cfg, profiles, paths):
+    """
+    --merge: daļējos failus apvieno (k-ceļu Top-N), tad kā parasti — NEW/KEEP/DROP pret
+    state/vēsturi, ziņa un viena sūtīšana katram profilam. Atgriež kā run_profiles.
+    """
+    with METRICS.stage("load_partials"):
+        parts = load_partials(paths)
+    top_n = {run_label(name, tf): p.TOP_N for name, p in profiles for tf in profile_timeframes(p)}
+    if set(top_n) != set(parts[0]["results"]):
+        raise SystemExit(f"--merge: partials have {sorted(parts[0]['results'])}, profiles expect {sorted(top_n)}")
+    with METRICS.stage("merge"):
+        merged = merge_partials(parts, top_n)
+    for res in merged.values():
+        for c in res["top"] + (res["ranking"] or []):
+            c.pop("rank_key", None)
+    for part in parts:
+        print(f"[merge] shard {part['shard'][0] + 1}/{part['shard'][1]}: candle cache {part['meta'].get('candle_cache')}")
+
+    history = make_history(cfg)
     now_riga = datetime.now(pytz.timezone("Europe/Riga"))
-    text = build_message_lv(
-        now_riga=now_riga,
-        timeframe=cfg.TIMEFRAME,
-        top_rows=ranked,
-        labels=labels,
-        short_format=cfg.SHORT_FORMAT,
-        include_advice=cfg.ADVICE_ENABLED,
-        detail_emoji=cfg.DETAIL_EMOJI,
-        long_format=cfg.LONG_FORMAT,
-        prev_ranks=prev_ranks
-    )
-
-    print(f"Found {len(cfg.TELEGRAM_CHAT_IDS)} Telegram chat IDs.")
-    # 7) Send
-    send_telegram_message(cfg.TELEGRAM_BOT_TOKEN, cfg.TELEGRAM_CHAT_IDS, text)
+    out = []
+    for name, p in profiles:
+        tfs = profile_timeframes(p)
+        texts, skipped = [], []
+        for tf in tfs:
+            res = merged[run_label(name, tf)]
+            METRICS.count_skips(res["skipped"])
+            state_file = timeframe_state_file(p.STATE_FILE, tf) if len(tfs) > 1 else p.STATE_FILE
+            texts.append(publish_timeframe(p, tf, res["top"], res["skipped"], res["ranking"], state_file, now_riga,
+                                           history, name))
+            skipped.extend(res["skipped"])
+        text = "\n\n".join(texts)
+        out.append((name, text, skipped, send(p, text, name)))
+    if history is not None:
+        history.close()
+    return out
+
+def print_summary(results) -> None:
+    for name, text, skipped, delivery in results:
+        print("\n=== SUMMARY ===" if not name else f"\n=== SUMMARY [{name}] ===")
+        print(text)
+        print("\nSkipped count:", len(skipped))
+        failed = [r["chat_id"] for r in delivery if not r["ok"]]
+        print(f"Telegram: {len(delivery) - len(failed)}/{len(delivery)} delivered" + (f", failed: {failed}" if failed else ""))
+
+def next_close(granularities, now: float) -> int:
+    """Tuvākā sveces aizvēršanās (unix s) starp dotajām granularitātēm (UTC spaiņi)."""
+    return min((int(now) // g + 1) * g for g in granularities)
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def run_daemon(cfg, profiles, timeframes, save_recording):
+    """
+    Pastāvīgs režīms: HTTP pūls, symbol->product karte un sveču vēsture paliek
+    atmiņā; pamostas DAEMON_SETTLE_S sekundes pēc katras sveces aizvēršanās un
+    pārrēķina tikai tos TF, kuru svece tikko aizvērās (sveces — delta ielāde).
+    """
+    grans = {tf: timeframe_to_granularity_seconds(tf) for tf in timeframes}
+    http_cache = make_http_cache(cfg)
+    store = make_candle_store(cfg, timeframes, in_memory=True)
+    book = IndicatorBook(indicator_state_path(cfg.STATE_FILE)) if cfg.STREAMING_INDICATORS else None
+    history = make_history(cfg)
+    source = make_candle_source(cfg)
+    symbol_to_product, mapped_at = None, 0.0
+    signal.signal(signal.SIGTERM, _stop)
+    print(f"[daemon] timeframes={timeframes}, settle={cfg.DAEMON_SETTLE_S}s")
+    try:
+        while True:
+            boundary = next_close(grans.values(), time.time())
+            delay = boundary + cfg.DAEMON_SETTLE_S - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            due = [tf for tf in timeframes if boundary % grans[tf] == 0]
+            print(f"\n[daemon] {datetime.fromtimestamp(boundary, timezone.utc):%Y-%m-%d %H:%M} UTC close: {due}")
+            METRICS.reset()
+            t0 = time.perf_counter()
+            try:
+                with METRICS.stage("market_feed"):
+                    markets = make_market_feed(cfg, http_cache)
+                if symbol_to_product is None or time.time() - mapped_at >= cfg.PRODUCTS_TTL_S:
+                    with METRICS.stage("product_map"):
+                        symbol_to_product = get_symbol_to_product(cfg.COINBASE_BASE, http_cache, cfg.PRODUCTS_TTL_S)
+                    mapped_at = time.time()
+                candles = make_candle_cache(cfg, timeframes, store, source)
+                results = run_profiles(profiles, markets, symbol_to_product, candles, book, history, due)
+                write_metrics(cfg, candles)
+                delivery = [r for *_, d in results for r in d]
+                sent = sum(r["ok"] for r in delivery)
+                print(f"[daemon] done in {time.perf_counter() - t0:.1f}s; profiles={len(results)}; "
+                      f"skipped={sum(len(s) for _, _, s, _ in results)}; "
+                      f"telegram {sent}/{len(delivery)}; candles {candles.stats()}")
+            except Exception:
+                traceback.print_exc()  # nākamā svece mēģinās vēlreiz
+    except KeyboardInterrupt:
+        print("[daemon] stopping")
+    finally:
+        if book is not None:
+            book.save()
+        if history is not None:
+            history.close()
+        close_client()
+        save_recording()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Relative Strength Rotator")
+    ap.add_argument("--daemon", action="store_true", help="pastāvīgs režīms, pamostas pēc katras sveces aizvēršanās")
+    ap.add_argument("--shard", metavar="i/N", help="apstrādāt tikai i-to no N tirgu daļām un rakstīt daļējo failu")
+    ap.add_argument("--partial", metavar="PATH", help="daļējā faila ceļš (noklusēti partial_<i>of<N>.json.gz)")
+    ap.add_argument("--merge", metavar="PATH", nargs="+", help="apvienot daļējos failus, saglabāt state un sūtīt")
+    ap.add_argument("--profile", metavar="DIR", nargs="?", const="profile",
+                    help="CPU paraugi un tracemalloc katram posmam -> DIR (noklusēti profile/)")
+    ap.add_argument("--profile-memory", action=argparse.BooleanOptionalAction, default=True,
+                    help="--no-profile-memory: bez tracemalloc (tas palēnina alokāciju bagātu kodu)")
+    args = ap.parse_args(argv)
+    if args.profile:
+        with profiled(args.profile, trace_memory=args.profile_memory):
+            return run(args)
+    return run(args)
+
+def run(args):
+    shard = parse_shard(args.shard) if args.shard else None
+    METRICS.reset()
+    with METRICS.stage("load_settings"):
+        cfg = load_settings()
+        profiles = load_profiles(cfg)
+    # visu profilu TF: sveces ielādē vienreiz smalkākajā no tiem
+    timeframes = list(dict.fromkeys(tf for _, p in profiles for tf in profile_timeframes(p)))
+    save_recording = install_from_env()
+    if args.merge:
+        results = run_merge(cfg, profiles, args.merge)
+        close_client()
+        save_recording()
+        if cfg.METRICS_DIR:
+            METRICS.write(cfg.METRICS_DIR)
+        return print_summary(results)
+    if cfg.RATE_LIMITS:
+        LIMITER.configure(parse_limits(cfg.RATE_LIMITS))
+    get_client(max_connections=max(cfg.FETCH_CONCURRENCY, 1))
+    if args.daemon:
+        return run_daemon(cfg, profiles, timeframes, save_recording)
+    if shard is not None:
+        candles = run_shard(cfg, profiles, timeframes, shard, args.partial or f"partial_{shard[0] + 1}of{shard[1]}.json.gz")
+        close_client()
+        save_recording()
+        return write_metrics(cfg, candles)
+    http_cache = make_http_cache(cfg)
+
+    # 1) CoinGecko tirgi (Top-N vai MANUAL); lapas lādējas fonā un plūst 3. solī —
+    #    "market_feed" ir tikai plūsmas izveide, lapu laiku mēra "market_fetch" (_stream_pages)
+    with METRICS.stage("market_feed"):
+        markets = make_market_feed(cfg, http_cache)
+
+    # 2) Coinbase USD pairs (ar kešu — gatavā karte, katalogs tikai pēc TTL)
+    with METRICS.stage("product_map"):
+        symbol_to_product = get_symbol_to_product(cfg.COINBASE_BASE, http_cache, cfg.PRODUCTS_TTL_S)
+
+    candles = make_candle_cache(cfg, timeframes)
+    book = IndicatorBook(indicator_state_path(cfg.STATE_FILE)) if cfg.STREAMING_INDICATORS else None
+    history = make_history(cfg)
+
+    # 3)–7) katram profilam
+    results = run_profiles(profiles, markets, symbol_to_product, candles, book, history)
+    if history is not None:
+        history.close()
+    close_client()
+    save_recording()
+    write_metrics(cfg, candles)
 
     # 8) Summary
-    print("\n=== SUMMARY ===")
-    print(text)
-    print("\nSkipped count:", len(skipped))
+    print_summary(results)
+    print("Candle cache:", candles.stats())
 
 if __name__ == "__main__":
     main()
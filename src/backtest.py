@@ -0,0 +1,237 @@
+"""
+Vēsturiskais rotatora backtests pār CandleStore svecēm.
+
+Tie paši filtri, punkti un entry/SL/TP heuristika kā filter_and_rank /
+compute_entry_sl_tp, bet aprēķināti visiem simboliem un visiem bāriem
+vienlaikus (simboli × laiks matricas), bez Python cikla pa laiku.
+
+    python -m src.backtest --store .candles --timeframe 1h --bars 8760 --download
+"""
+import argparse
+import json
+from typing import Dict, List, Optional
+import numpy as np
+
+from .candle_store import CandleStore, COLUMNS
+from .indicators import sma_2d, rsi_2d, atr_pct_2d
+from .strategy_rotator import STABLES, score_of
+
+def load_matrices(store: CandleStore, product_ids: List[str], granularity_s: int,
+                  bars: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Saliek saglabātās sveces kopējā laika asī: {"times": (T,), "products": [...],
+    "open"/"high"/"low"/"close"/"volume": (N, T)}; trūkstošās vietas ir NaN.
+    Ja krātuvē ir smalkāka granularitāte, to saliek `granularity_s` svecēs.
+    """
+    from .data_sources import fetch_granularity
+    from .candles import Candles, resample
+
+    base = fetch_granularity(granularity_s)
+    series = {}
+    for pid in product_ids:
+        arr = store.load(pid, base)
+        if arr is None or arr.shape[1] == 0:
+            continue
+        if base != granularity_s:
+            c = resample(Candles(arr), granularity_s)
+            if c is None:
+                continue
+            arr = c.data
+        series[pid] = np.asarray(arr)
+
+    products = list(series)
+    times = np.unique(np.concatenate([a[0] for a in series.values()])) if series else np.empty(0)
+    if bars is not None:
+        times = times[-bars:]
+    out = {"times": times, "products": products}
+    for name in COLUMNS[1:]:
+        out[name] = np.full((len(products), len(times)), np.nan)
+    for i, pid in enumerate(products):
+        a = series[pid]
+        pos = np.searchsorted(times, a[0])
+        ok = (pos < len(times)) & (times[np.minimum(pos, len(times) - 1)] == a[0])
+        for row, name in enumerate(COLUMNS[1:], 1):
+            out[name][i, pos[ok]] = a[row, ok]
+    return out
+
+def rolling_max_2d(x: np.ndarray, window: int) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    if x.shape[1] >= window:
+        out[:, window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window, axis=1).max(axis=2)
+    return out
+
+def compute_features(data: Dict[str, np.ndarray], granularity_s: int, ma_period: int) -> Dict[str, np.ndarray]:
+    """Visi filtriem vajadzīgie lielumi katram simbolam un bāram."""
+    close, high, low = data["close"], data["high"], data["low"]
+    bars_24h = max(1, 86400 // granularity_s)
+    prev = np.full_like(close, np.nan)
+    prev[:, bars_24h:] = close[:, :-bars_24h]
+    # 24h apjoms USD: slīdošā summa (volume × close) pēdējiem 24h bāriem
+    vusd = np.nan_to_num(data["volume"] * close)
+    csum = np.cumsum(vusd, axis=1)
+    vol24 = csum.copy()
+    vol24[:, bars_24h:] -= csum[:, :-bars_24h]
+    return {
+        "pct24h": (close / prev - 1.0) * 100.0,
+        "vol24h_usd": vol24,
+        "ma": sma_2d(close, ma_period),
+        "rsi": rsi_2d(close, 14),
+        "atrpct": atr_pct_2d(high, low, close, 14),
+        "swing_high": rolling_max_2d(high, 20),
+    }
+
+def score_matrix(data, features, ma, rsi_threshold: float, atr_pct_min: float,
+                 min_24h_volume_usd: float, min_24h_pct: float, atr_score_cap: Optional[float] = None) -> np.ndarray:
+    """filter_and_rank punkti (N, T) ar to pašu `score_of`; bāriem, kas neiziet filtrus, -inf."""
+    close, pct, rsi_v, atrp = data["close"], features["pct24h"], features["rsi"], features["atrpct"]
+    stable = np.array([p.split("-")[0].upper() in STABLES for p in data["products"]])[:, None]
+    with np.errstate(invalid="ignore"):
+        ok = (~stable & (features["vol24h_usd"] >= min_24h_volume_usd) & (pct >= min_24h_pct)
+              & (close > ma) & (rsi_v > rsi_threshold) & (atrp > atr_pct_min))
+    with np.errstate(invalid="ignore"):
+        score = score_of(pct, rsi_v, atrp, rsi_threshold, atr_pct_min, atr_score_cap)
+    return np.where(ok, score, -np.inf)
+
+def simulate(data, features, score: np.ndarray, top_n: int, hold_bars: int = 1,
+             warmup: int = 50, fee_pct: float = 0.1, take_profit: str = "tp2") -> Dict[str, float]:
+    """
+    Rotācija: ik pēc `hold_bars` bāriem nopērk top-N (vienādos svaros) par close,
+    tur līdz nākamajai rotācijai vai līdz SL/TP (ja abi vienā bārā — SL).
+    Komisija `fee_pct` % par katru pirkšanu un pārdošanu, ko prasa apgrozījums.
+    Trūkstošs izejas close: izeja pēdējā derīgajā logā (`early_exits`), ja tāda nav —
+    pozīcija izslēgta (`excluded_no_exit`), nevis skaitīta kā 0 %.
+    """
+    close, high, low = data["close"], data["high"], data["low"]
+    n_sym, n_t = close.shape
+    tk = np.arange(warmup, n_t - hold_bars, hold_bars)
+    if len(tk) == 0 or n_sym == 0:
+        return {"periods": 0, "trades": 0}
+
+    top_n = min(top_n, n_sym)
+    s = score[:, tk]                                     # (N, K)
+    top = np.argsort(-s, axis=0, kind="stable")[:top_n]  # (n, K)
+    held = np.isfinite(np.take_along_axis(s, top, axis=0))
+
+    k_idx = np.broadcast_to(tk, top.shape)
+    entry = close[top, k_idx]
+    atr_v = features["atrpct"][top, k_idx] / 100.0 * entry
+    sl = entry - 1.5 * atr_v
+    tp = entry + 1.0 * atr_v if take_profit == "tp1" else np.fmax(entry + 2.0 * atr_v, features["swing_high"][top, k_idx])
+
+    win = tk[:, None] + 1 + np.arange(hold_bars)         # (K, H)
+    hw, lw = high[top[:, :, None], win[None]], low[top[:, :, None], win[None]]
+    sl_hit, tp_hit = lw <= sl[..., None], hw >= tp[..., None]
+    first_sl = np.where(sl_hit.any(axis=2), sl_hit.argmax(axis=2), hold_bars)
+    first_tp = np.where(tp_hit.any(axis=2), tp_hit.argmax(axis=2), hold_bars)
+    # Izeja rotācijā: pēdējais derīgais close logā (robs / delistings -> agrāka svece);
+    # ja logā nav neviena un nebija SL/TP — pozīciju izslēdz un skaita atskaitē
+    cw = close[top[:, :, None], win[None]]
+    valid = np.isfinite(cw)
+    last_valid = hold_bars - 1 - valid[..., ::-1].argmax(axis=2)
+    exit_close = np.take_along_axis(cw, last_valid[..., None], axis=2)[..., 0]
+    stopped = (first_sl < hold_bars) & (first_sl <= first_tp)
+    took = (first_tp < hold_bars) & ~stopped
+    no_exit = held & ~valid.any(axis=2) & ~stopped & ~took
+    early_exit = held & valid.any(axis=2) & ~valid[..., -1] & ~stopped & ~took
+    held = held & ~no_exit
+    exit_px = np.where(stopped, sl, np.where(took, tp, exit_close))
+    ret = np.where(held, exit_px / entry - 1.0, 0.0)
+
+    # Apgrozījums: pirkumi = jaunas pozīcijas; pārdošanas = izkritušās no top-N + SL/TP izejas
+    k_all = np.broadcast_to(np.arange(len(tk)), top.shape)
+    member = np.zeros((n_sym, len(tk)), bool)
+    member[top[held], k_all[held]] = True
+    exited = np.zeros_like(member)
+    exited[top[held], k_all[held]] = (stopped | took)[held]
+    carried = np.zeros_like(member)
+    carried[:, 1:] = (member & ~exited)[:, :-1]
+    buys = (member & ~carried).sum(axis=0)
+    sells = (carried & ~member).sum(axis=0) + exited.sum(axis=0)
+    turnover = (buys + sells) / (2.0 * top_n)
+    period_ret = ret.sum(axis=0) / top_n - (buys + sells) / top_n * fee_pct / 100.0
+
+    equity = np.cumprod(1.0 + period_ret)
+    peak = np.maximum.accumulate(equity)
+    trades = held.sum()
+    years = float(data["times"][tk[-1] + hold_bars] - data["times"][tk[0]]) / (365.25 * 86400)
+    total = float(equity[-1] - 1.0)
+    return {
+        "periods": int(len(tk)),
+        "trades": int(trades),
+        "total_return_pct": round(total * 100.0, 2),
+        "annualized_pct": round(((1 + total) ** (1 / years) - 1) * 100.0, 2) if years > 0 and total > -1 else None,
+        "max_drawdown_pct": round(float((equity / peak - 1.0).min()) * 100.0, 2),
+        "hit_rate_pct": round(float((ret[held] > 0).mean()) * 100.0, 2) if trades else None,
+        "tp_rate_pct": round(float(took[held].mean()) * 100.0, 2) if trades else None,
+        "sl_rate_pct": round(float(stopped[held].mean()) * 100.0, 2) if trades else None,
+        "avg_trade_pct": round(float(ret[held].mean()) * 100.0, 3) if trades else None,
+        "avg_turnover": round(float(turnover.mean()), 3),
+        "avg_positions": round(float(held.sum(axis=0).mean()), 2),
+        "early_exits": int(early_exit.sum()),
+        "excluded_no_exit": int(no_exit.sum()),
+    }
+
+def run_backtest(data, granularity_s: int, ma_period: int, rsi_threshold: float, atr_pct_min: float,
+                 min_24h_volume_usd: float, min_24h_pct: float, top_n: int, hold_bars: int = 1,
+                 fee_pct: float = 0.1, take_profit: str = "tp2",
+                 atr_score_cap: Optional[float] = None) -> Dict[str, float]:
+    features = compute_features(data, granularity_s, ma_period)
+    score = score_matrix(data, features, features["ma"], rsi_threshold, atr_pct_min, min_24h_volume_usd, min_24h_pct,
+                         atr_score_cap)
+    warmup = max(ma_period, 50, 86400 // granularity_s)
+    return simulate(data, features, score, top_n, hold_bars, warmup, fee_pct, take_profit)
+
+def download_universe(cfg, store: CandleStore, granularity_s: int, bars: int) -> List[str]:
+    """Ielādē krātuvē pašreizējā universa (WATCHLIST_MODE: TOP<N> / MANUAL) sveču vēsturi (pa lapām)."""
+    from .data_sources import get_symbol_to_product, fetch_coinbase_ohlcv_stored, fetch_granularity
+    from .pipeline import make_http_cache, make_market_feed
+    from .strategy_rotator import prefetch_ohlcv
+
+    http_cache = make_http_cache(cfg)
+    s2p = get_symbol_to_product(cfg.COINBASE_BASE, http_cache, cfg.PRODUCTS_TTL_S)
+    pids = list(dict.fromkeys(s2p[m["symbol"].upper()] for m in make_market_feed(cfg, http_cache)
+                              if (m.get("symbol") or "").upper() in s2p))
+    base = fetch_granularity(granularity_s)
+    bars = bars * granularity_s // base
+    prefetch_ohlcv(lambda pid, gran, lim: fetch_coinbase_ohlcv_stored(cfg.COINBASE_BASE, store, pid, gran, lim),
+                   pids, base, bars, cfg.FETCH_CONCURRENCY)
+    return pids
+
+def stored_products(store: CandleStore, granularity_s: int) -> List[str]:
+    import os
+    from .data_sources import fetch_granularity
+    suffix = f"_{fetch_granularity(granularity_s)}.npy"
+    return sorted(f[:-len(suffix)] for f in os.listdir(store.root) if f.endswith(suffix))
+
+def main(argv=None):
+    from .config import load_settings, resolve_thresholds
+    from .data_sources import timeframe_to_granularity_seconds, fetch_granularity
+
+    ap = argparse.ArgumentParser(description="Relative Strength Rotator backtest")
+    ap.add_argument("--store", default=".candles")
+    ap.add_argument("--timeframe", default=None, help="15m | 1h | 4h (noklusēti TIMEFRAME)")
+    ap.add_argument("--bars", type=int, default=24 * 365)
+    ap.add_argument("--hold", type=int, default=1, help="bāri starp rotācijām")
+    ap.add_argument("--fee-pct", type=float, default=0.1)
+    ap.add_argument("--take-profit", choices=["tp1", "tp2"], default="tp2")
+    ap.add_argument("--download", action="store_true", help="vispirms ielādēt vēsturi no Coinbase")
+    args = ap.parse_args(argv)
+
+    cfg = load_settings(require_telegram=False)
+    tf = (args.timeframe or cfg.TIMEFRAME).lower()
+    eff = resolve_thresholds(cfg, tf)
+    gran = timeframe_to_granularity_seconds(tf)
+    store = CandleStore(args.store, history=max(cfg.CANDLE_HISTORY, args.bars * gran // fetch_granularity(gran)))
+    pids = download_universe(cfg, store, gran, args.bars) if args.download else stored_products(store, gran)
+
+    data = load_matrices(store, pids, gran, args.bars)
+    print(f"Backtest TF={tf}: {len(data['products'])} symbols × {len(data['times'])} bars; thresholds: {eff}")
+    report = run_backtest(data, gran, eff["MA_PERIOD"], eff["RSI_THRESHOLD"], eff["ATR_PCT_MIN"],
+                          eff["MIN_24H_VOLUME_USD"], eff["MIN_24H_PCT"], cfg.TOP_N,
+                          hold_bars=args.hold, fee_pct=args.fee_pct, take_profit=args.take_profit,
+                          atr_score_cap=cfg.ATR_SCORE_CAP)
+    print(json.dumps(report, indent=2))
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Bezsaistes benchmarki: main() no sākuma līdz beigām un katrs posms atsevišķi
+(market fetch, product map, filter_and_rank, advice, formatting, send) pie
+dažādiem universa izmēriem. HTTP nāk no SyntheticTransport vai ierakstīta arhīva.
+
+    python -m src.bench --sizes 100,500,2000 --out bench_results.json
+    python -m src.bench --fixture fixtures.json.gz --compare bench_results.json
+    python -m src.bench --sizes 500 --hedge        # + sveču latentums ar/bez hedžēšanas (lēna aste)
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+from .config import Settings, resolve_thresholds, universe_size
+from .candle_sources import make_source
+from .candles import to_candles
+from .data_sources import (set_transport, get_client, close_client, iter_top_markets,
+                           get_coinbase_products, pick_usd_pairs, fetch_coinbase_ohlcv, fetch_ohlcv, CandleCache,
+                           timeframe_to_granularity_seconds)
+from .metrics import METRICS, percentile
+from .strategy_rotator import filter_and_rank, compute_entry_sl_tp, load_prev_top, diff_labels, prefetch_ohlcv
+from .formatter import build_message_lv
+from .notifier import send_telegram_message
+from .replay import SyntheticTransport, ReplayTransport, LatencyTransport, load_archive
+from .ratelimit import LIMITER
+
+STAGES = ("market_fetch", "product_map", "filter_and_rank", "advice", "formatting", "send")
+
+def _timed(fn: Callable):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+def run_stages(cfg: Settings, n: Optional[int] = None) -> Dict[str, float]:
+    """Viens cauruļvada piegājiens ar laiku katram posmam (sekundēs); `n` — gaidītais tirgu skaits."""
+    eff = resolve_thresholds(cfg)
+    times = {}
+    markets, times["market_fetch"] = _timed(lambda: list(iter_top_markets(
+        cfg.COINGECKO_BASE, universe_size(cfg.WATCHLIST_MODE))))
+    if n is not None and len(markets) != n:
+        raise RuntimeError(f"bench: {len(markets)} markets, expected {n}")
+    s2p, times["product_map"] = _timed(lambda: pick_usd_pairs(get_coinbase_products(cfg.COINBASE_BASE)))
+    candles = CandleCache(lambda pid, gran, lim: fetch_coinbase_ohlcv(cfg.COINBASE_BASE, pid, gran, lim))
+    (ranked, _), times["filter_and_rank"] = _timed(lambda: filter_and_rank(
+        markets=markets, symbol_to_product=s2p, ohlcv_fetcher=candles, timeframe=cfg.TIMEFRAME,
+        ma_period=eff["MA_PERIOD"], rsi_threshold=eff["RSI_THRESHOLD"], atr_pct_min=eff["ATR_PCT_MIN"],
+        min_24h_volume_usd=eff["MIN_24H_VOLUME_USD"], min_24h_pct=eff["MIN_24H_PCT"], top_n=cfg.TOP_N,
+        max_workers=cfg.FETCH_CONCURRENCY))
+
+    def advice():
+        gran = timeframe_to_granularity_seconds(cfg.TIMEFRAME)
+        for r in ranked:
+            df = candles(r["product_id"], gran, 300)
+            if df is not None and len(df) > 50:
+                r["advice"] = compute_entry_sl_tp(r, df)
+    _, times["advice"] = _timed(advice)
+
+    def formatting():
+        prev_syms, prev_ranks = load_prev_top(cfg.STATE_FILE)
+        labels = diff_labels([r["symbol"] for r in ranked], prev_syms)
+        return build_message_lv(datetime.now(timezone.utc), cfg.TIMEFRAME, ranked, labels, cfg.SHORT_FORMAT,
+                                cfg.ADVICE_ENABLED, cfg.DETAIL_EMOJI, cfg.LONG_FORMAT, prev_ranks)
+    text, times["formatting"] = _timed(formatting)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, times["send"] = _timed(lambda: send_telegram_message(cfg.TELEGRAM_BOT_TOKEN, cfg.TELEGRAM_CHAT_IDS, text))
+    close_client()
+    return times
+
+def run_main_once(watchlist_mode: str = "TOP100", n: Optional[int] = None) -> float:
+    """main() no sākuma līdz beigām (pagaidu direktorijā, lai neaiztiktu state failu)."""
+    import main as app
+
+    env = {"TELEGRAM_BOT_TOKEN": "bench", "TELEGRAM_CHAT_IDS": "1", "WATCHLIST_MODE": watchlist_mode}
+    old_env = {k: os.environ.get(k) for k in env}
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="rotator-bench-") as tmp:
+        os.environ.update(env)
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, dt = _timed(lambda: app.main([]))
+        finally:
+            os.chdir(old_cwd)
+            for k, v in old_env.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+    seen = METRICS.counters.get("markets_fetched")
+    if n is not None and seen != n:
+        raise RuntimeError(f"bench: main() processed {seen} markets, expected {n}")
+    return dt
+
+_STARTUP_PROBE = (
+    "import json, resource, sys, time; t = time.perf_counter(); import main; "
+    "print(json.dumps({'import_s': time.perf_counter() - t, "
+    "'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "
+    "'pandas_loaded': 'pandas' in sys.modules}))"
+)
+
+def measure_startup(repeat: int = 5) -> Dict:
+    """`import main` svaigā procesā: importa laiks, maksimālais RSS un vai ielādēts pandas."""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {"import_median_s": round(statistics.median(r["import_s"] for r in runs), 4),
+            "max_rss_mb": round(max(r["max_rss_mb"] for r in runs), 1),
+            "pandas_loaded": any(r["pandas_loaded"] for r in runs)}
+
+def bench_size(transport_factory: Callable, repeat: int = 3, n: Optional[int] = None) -> Dict:
+    """`n` — sintētiskā universa izmērs (WATCHLIST_MODE=TOP<n>); None — ieraksts ar noklusēto TOP100."""
+    mode = f"TOP{n}" if n else "TOP100"
+    cfg = Settings(TELEGRAM_BOT_TOKEN="bench", TELEGRAM_CHAT_IDS=["1"], STATE_FILE=os.devnull, WATCHLIST_MODE=mode)
+    runs: List[Dict[str, float]] = []
+    main_runs: List[float] = []
+    for _ in range(repeat):
+        set_transport(transport_factory())
+        get_client(max_connections=max(cfg.FETCH_CONCURRENCY, 1))
+        runs.append(run_stages(cfg, n))
+        set_transport(transport_factory())
+        main_runs.append(run_main_once(mode, n))
+    set_transport(None)
+    stages = {s: {"median_s": round(statistics.median(r[s] for r in runs), 5),
+                  "min_s": round(min(r[s] for r in runs), 5)} for s in STAGES}
+    return {"stages": stages, "main": {"median_s": round(statistics.median(main_runs), 5),
+                                       "min_s": round(min(main_runs), 5)}}
+
+# Exchange: 20 ms, 3% pieprasījumu +1.5 s; Advanced: 30 ms, 3% +1.5 s (neatkarīgi)
+HEDGE_PROFILE = {"api.exchange.coinbase.com": (0.02, 0.03, 1.5), "api.coinbase.com": (0.03, 0.03, 1.5)}
+
+def bench_hedge(n: int, sources: List[str], profile=HEDGE_PROFILE, concurrency: int = 8) -> Dict:
+    """Visu `n` produktu sveces caur LatencyTransport: pieprasījuma latentuma sadalījums un kopējais laiks."""
+    cfg = Settings(TELEGRAM_BOT_TOKEN="bench", TELEGRAM_CHAT_IDS=["1"])
+    synth = SyntheticTransport(n)
+    set_transport(LatencyTransport(synth, profile, seed=1))
+    get_client(max_connections=4 * concurrency)
+    source = make_source(sources, {"exchange": cfg.COINBASE_BASE, "advanced": cfg.COINBASE_ADVANCED_BASE},
+                         quantile=cfg.HEDGE_QUANTILE, initial_delay_s=cfg.HEDGE_DELAY_S,
+                         max_ratio=cfg.HEDGE_MAX_RATIO)
+    lat: List[float] = []
+
+    def fetch(pid, gran, lim):
+        t0 = time.perf_counter()
+        out = fetch_ohlcv(source, pid, gran, lim)
+        lat.append(time.perf_counter() - t0)
+        return out
+    pids = [p["id"] for p in synth.products]
+    frames, total = _timed(lambda: prefetch_ohlcv(fetch, pids, 3600, 300, concurrency))
+    if hasattr(source, "close"):
+        source.close()
+    close_client()
+    set_transport(None)
+    same = all(frames[pid] is not None and
+               np.array_equal(frames[pid].data, to_candles(synth.candle_rows(pid, 3600)[::-1]).data) for pid in pids)
+    return {"sources": sources, "total_s": round(total, 3), "p50_s": round(percentile(lat, 0.5), 4),
+            "p99_s": round(percentile(lat, 0.99), 4), "max_s": round(max(lat), 4), "same_candles": same,
+            "stats": dict(getattr(source, "stats", {}))}
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(current: Dict, previous: Dict) -> None:
+    print(f"\n=== {previous.get('commit')} -> {current.get('commit')} (median, x = jauns/vecs) ===")
+    old_s, new_s = previous.get("startup"), current.get("startup")
+    if old_s and new_s:
+        print(f"{'startup':>23}  {old_s['import_median_s']:9.4f}s -> {new_s['import_median_s']:9.4f}s, "
+              f"RSS {old_s['max_rss_mb']:.0f} -> {new_s['max_rss_mb']:.0f} MB")
+    for size, res in current["results"].items():
+        old = previous.get("results", {}).get(size)
+        if not old or size == "hedge":
+            continue
+        for name in list(STAGES) + ["main"]:
+            new_v = res["main" if name == "main" else "stages"]
+            old_v = old["main" if name == "main" else "stages"]
+            n = new_v["median_s"] if name == "main" else new_v[name]["median_s"]
+            o = old_v["median_s"] if name == "main" else old_v[name]["median_s"]
+            ratio = f"{n / o:.2f}x" if o else "-"
+            print(f"{size:>6} {name:>16}  {o:9.4f}s -> {n:9.4f}s  {ratio}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Relative Strength Rotator offline benchmarks")
+    ap.add_argument("--sizes", default="100,500,2000", help="sintētiskā universa izmēri")
+    ap.add_argument("--fixture", default=None, help="ierakstīts arhīvs (HTTP_RECORD) sintētikas vietā")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", default=None, help="iepriekšējais rezultātu JSON")
+    ap.add_argument("--rate-limit", action="store_true", help="mērīt ar ieslēgtu LIMITER tempu")
+    ap.add_argument("--hedge", action="store_true", help="sveču latentums ar vienu avotu un ar hedžēšanu")
+    args = ap.parse_args(argv)
+    LIMITER.enabled = args.rate_limit
+
+    results = {}
+    if args.fixture:
+        entries = load_archive(args.fixture)
+        print(f"[bench] fixture {args.fixture}")
+        results["fixture"] = bench_size(lambda: ReplayTransport(entries), args.repeat)
+    else:
+        for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+            print(f"[bench] universe={n}")
+            synth = SyntheticTransport(n)  # ģenerētās sveces paliek kešā starp atkārtojumiem
+            results[str(n)] = bench_size(lambda: synth, args.repeat, n)
+
+    if args.hedge:
+        n = max(int(x) for x in args.sizes.split(",") if x.strip())
+        print(f"[bench] hedge, universe={n}")
+        results["hedge"] = {"single": bench_hedge(n, ["exchange"]), "hedged": bench_hedge(n, ["exchange", "advanced"])}
+
+    payload = {
+        "commit": _git_commit(),
+        "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "startup": measure_startup(),
+        "results": results,
+    }
+    prev = None
+    if args.compare and os.path.exists(args.compare):
+        with open(args.compare, "r", encoding="utf-8") as f:
+            prev = json.load(f)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    print(json.dumps(payload, indent=2))
+    if prev:
+        compare(payload, prev)
+
+if __name__ == "__main__":
+    main()
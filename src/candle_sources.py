@@ -0,0 +1,207 @@
+"""
+Sveču avoti aiz `ohlcv_fetcher` un hedžēti pieprasījumi starp tiem.
+
+CandleSource(product_id, granularity_s, start=None, end=None) atgriež hronoloģiskas
+rindas [time, low, high, open, close, volume] (Coinbase Exchange izkārtojums)
+neatkarīgi no avota, tāpēc der fetch_ohlcv / fetch_ohlcv_stored / CandleCache.
+
+HedgedSource: pieprasījums iet primārajam avotam; ja tas neatbild primārā
+latentuma `quantile` laikā (LatencyHistogram, līdz `min_samples` — `initial_delay_s`),
+to pašu pieprasījumu sūta sekundārajam un izmanto pirmo veiksmīgo atbildi.
+Primārā kļūda -> sekundārais uzreiz. Hedžu daļa ierobežota ar `max_ratio`, lai
+vispārējas lēnības laikā slodze nedubultojas; ja budžets beidzies, gaida primāro,
+bet tā kļūdas gadījumā tāpat pārslēdzas uz sekundāro. Zaudētāja latentums arī tiek
+pierakstīts, kad tas pabeidz, tāpēc slieksnis neslīd uz leju.
+"""
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from .data_sources import _get, fetch_coinbase_candles, get_client
+from .metrics import METRICS
+
+# Coinbase Advanced Trade publiskā tirgus API (bez autentifikācijas), tie paši produkti
+ADVANCED_CANDLES = "/products/{product_id}/candles"
+ADVANCED_GRANULARITY = {60: "ONE_MINUTE", 300: "FIVE_MINUTE", 900: "FIFTEEN_MINUTE", 1800: "THIRTY_MINUTE",
+                        3600: "ONE_HOUR", 7200: "TWO_HOUR", 21600: "SIX_HOUR", 86400: "ONE_DAY"}
+ADVANCED_MAX_CANDLES = 350
+
+class LatencyHistogram:
+    """
+    Logaritmiski spaiņi (solis `ratio`) no `min_s` līdz `max_s`; kad novērojumu
+    kļūst vairāk par `window`, skaitītāji tiek uz pusi samazināti — kvantile seko
+    pēdējiem ~`window` pieprasījumiem ar fiksētu atmiņu.
+    """
+
+    def __init__(self, min_s: float = 0.001, max_s: float = 60.0, ratio: float = 1.1, window: int = 512):
+        self.min_s, self.ratio, self.window = min_s, ratio, window
+        self.n_buckets = int(math.ceil(math.log(max_s / min_s, ratio))) + 1
+        self.counts = [0.0] * self.n_buckets
+        self.total = 0.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def _bucket(self, seconds: float) -> int:
+        if seconds <= self.min_s:
+            return 0
+        return min(self.n_buckets - 1, int(math.ceil(math.log(seconds / self.min_s, self.ratio))))
+
+    def upper(self, i: int) -> float:
+        return self.min_s * self.ratio ** i
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[self._bucket(seconds)] += 1.0
+            self.total += 1.0
+            self.samples += 1
+            if self.total > self.window:
+                self.counts = [c / 2 for c in self.counts]
+                self.total /= 2
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Spaiņa augšējā robeža, kurā ir q-tā kvantile (None, ja nav datu)."""
+        with self._lock:
+            if not self.total:
+                return None
+            target, acc = q * self.total, 0.0
+            for i, c in enumerate(self.counts):
+                acc += c
+                if acc >= target:
+                    return self.upper(i)
+            return self.upper(self.n_buckets - 1)
+
+class CandleSource:
+    name = "source"
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+
+    def candles(self, product_id: str, granularity_s: int, start: Optional[int] = None,
+                end: Optional[int] = None) -> List[list]:
+        raise NotImplementedError
+
+    __call__ = candles
+
+class ExchangeCandles(CandleSource):
+    """Coinbase Exchange /products/{id}/candles (noklusētais avots)."""
+    name = "exchange"
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def candles(self, product_id, granularity_s, start=None, end=None):
+        return fetch_coinbase_candles(self.base_url, product_id, granularity_s, start=start, end=end)
+
+    __call__ = candles
+
+class AdvancedTradeCandles(CandleSource):
+    """
+    Coinbase Advanced Trade publiskās sveces: {"candles": [{"start": "...", "low": "...", ...}]}
+    jaunākās pirmās, vērtības kā virknes; start/end obligāti (unix sekundes).
+    """
+    name = "advanced"
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def candles(self, product_id, granularity_s, start=None, end=None):
+        end = int(end if end is not None else time.time())
+        if start is None:
+            start = end - 300 * granularity_s
+        params = {"start": str(int(start)), "end": str(end), "granularity": ADVANCED_GRANULARITY[granularity_s],
+                  "limit": ADVANCED_MAX_CANDLES}
+        data = _get(get_client(), self.base_url + ADVANCED_CANDLES.format(product_id=product_id), params=params)
+        rows = [[int(c["start"]), float(c["low"]), float(c["high"]), float(c["open"]), float(c["close"]),
+                 float(c["volume"])] for c in (data or {}).get("candles", [])]
+        rows.sort(key=lambda r: r[0])
+        return rows
+
+    __call__ = candles
+
+class HedgedSource(CandleSource):
+    def __init__(self, primary: CandleSource, secondary: CandleSource, quantile: float = 0.95,
+                 initial_delay_s: float = 0.5, min_delay_s: float = 0.02, max_ratio: float = 0.1,
+                 min_samples: int = 20, max_workers: int = 32):
+        super().__init__()
+        self.primary, self.secondary = primary, secondary
+        self.name = f"{primary.name}+{secondary.name}"
+        self.quantile = quantile
+        self.initial_delay_s = initial_delay_s
+        self.min_delay_s = min_delay_s
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hedged": 0, "hedge_won": 0, "failover": 0, "budget_denied": 0}
+
+    def hedge_delay(self) -> float:
+        """Primārā latentuma `quantile` (p95) no LatencyHistogram; līdz `min_samples` — `initial_delay_s`."""
+        if self.primary.latency.samples < self.min_samples:
+            return self.initial_delay_s
+        return max(self.min_delay_s, self.primary.latency.quantile(self.quantile))
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+        METRICS.inc(f"candle_{key}")
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.stats["hedged"] + 1 > max(1.0, self.max_ratio * self.stats["requests"]):
+                self.stats["budget_denied"] += 1
+                return False
+            return True
+
+    def _submit(self, source: CandleSource, args: tuple):
+        def run():
+            t0 = time.perf_counter()
+            out = source(*args)
+            dt = time.perf_counter() - t0
+            source.latency.observe(dt)
+            METRICS.observe(f"candle_source_{source.name}_seconds", dt)
+            return out
+        return self._pool.submit(run)
+
+    def candles(self, product_id, granularity_s, start=None, end=None):
+        args = (product_id, granularity_s, start, end)
+        self._count("requests")
+        t0 = time.perf_counter()
+        primary = self._submit(self.primary, args)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if not done and not self._may_hedge():
+            done, _ = wait([primary])  # bez hedža gaida primāro; ja tas krīt — tomēr sekundārais
+        if done and primary.exception() is None:
+            self.latency.observe(time.perf_counter() - t0)
+            return primary.result()
+        self._count("failover" if done else "hedged")
+        secondary = self._submit(self.secondary, args)
+        pending = {primary, secondary}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is secondary and not primary.done():
+                        self._count("hedge_won")
+                    self.latency.observe(time.perf_counter() - t0)
+                    return f.result()
+                error = error or f.exception()
+        raise error
+
+    __call__ = candles
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+SOURCES = {"exchange": ExchangeCandles, "advanced": AdvancedTradeCandles}
+
+def make_source(names: List[str], base_urls: Dict[str, str], **hedge) -> CandleSource:
+    """["exchange"] -> ExchangeCandles; ["exchange", "advanced"] -> HedgedSource(primārais, sekundārais)."""
+    sources = [SOURCES[n](base_urls[n]) for n in names]
+    if len(sources) == 1:
+        return sources[0]
+    return HedgedSource(sources[0], sources[1], **hedge)
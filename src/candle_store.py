@@ -0,0 +1,89 @@
+import os
+import re
+import threading
+from typing import Dict, Optional
+import numpy as np
+
+# Kolonnas tādā pašā secībā kā Coinbase candles atbildē.
+COLUMNS = ("time", "low", "high", "open", "close", "volume")
+
+class CandleStore:
+    """
+    Diskā glabāta sveču vēsture: viens `.npy` fails uz (product_id, granularity).
+    Masīvs ir kolonnu formā (6, n), hronoloģiski, tāpēc katra kolonna ir
+    nepārtraukta un to var lasīt bez kopēšanas no memory-mapped faila.
+    """
+
+    def __init__(self, root: str, history: int = 1000):
+        self.root = root
+        self.history = history
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, product_id: str, granularity_s: int) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", product_id)
+        return os.path.join(self.root, f"{safe}_{granularity_s}.npy")
+
+    def load(self, product_id: str, granularity_s: int) -> Optional[np.ndarray]:
+        """Atgriež (6, n) memmap vai None, ja faila nav / tas ir bojāts."""
+        p = self.path(product_id, granularity_s)
+        if not os.path.exists(p):
+            return None
+        try:
+            arr = np.load(p, mmap_mode="r")
+        except Exception:
+            return None
+        if arr.ndim != 2 or arr.shape[0] != len(COLUMNS):
+            return None
+        return arr
+
+    def last_time(self, product_id: str, granularity_s: int) -> Optional[int]:
+        arr = self.load(product_id, granularity_s)
+        if arr is None or arr.shape[1] == 0:
+            return None
+        return int(arr[0, -1])
+
+    def append(self, product_id: str, granularity_s: int, rows, replace: bool = False) -> np.ndarray:
+        """
+        Pievieno hronoloģiskas rindas [time, low, high, open, close, volume].
+        Saglabātās sveces ar time >= pirmās jaunās tiek aizstātas (pēdējā
+        svece var būt bijusi vēl neaizvērta), rezultāts apgriezts līdz `history`.
+        `replace=True` pārraksta visu vēsturi (piem., ja starp skrējieniem ir robs).
+        """
+        new = np.asarray(rows, dtype=np.float64).reshape(-1, len(COLUMNS)).T
+        old = None if replace else self.load(product_id, granularity_s)
+        if old is not None and old.shape[1] and new.shape[1]:
+            keep = old[:, old[0] < new[0, 0]]
+            merged = np.concatenate([keep, new], axis=1)
+        elif old is not None and not new.shape[1]:
+            merged = np.asarray(old)
+        else:
+            merged = new
+        if merged.shape[1] > self.history:
+            merged = merged[:, -self.history:]
+        self._save(product_id, granularity_s, np.ascontiguousarray(merged))
+        return self.load(product_id, granularity_s)
+
+    def _save(self, product_id: str, granularity_s: int, arr: np.ndarray) -> None:
+        p = self.path(product_id, granularity_s)
+        tmp = p + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, p)
+
+class MemoryCandleStore(CandleStore):
+    """Tā pati saskarne bez diska (daemon režīmam, kad CANDLE_STORE_DIR nav iestatīts)."""
+
+    def __init__(self, history: int = 1000):
+        self.root = None
+        self.history = history
+        self._arrays: Dict[tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def load(self, product_id: str, granularity_s: int) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._arrays.get((product_id, granularity_s))
+
+    def _save(self, product_id: str, granularity_s: int, arr: np.ndarray) -> None:
+        arr.setflags(write=False)
+        with self._lock:
+            self._arrays[(product_id, granularity_s)] = arr
@@ -0,0 +1,106 @@
+"""
+Kompakta sveču partija bez pandas: viens (6, n) float64 masīvs kolonnu formā
+(time, low, high, open, close, volume), hronoloģiski — tāds pats kā CandleStore
+failos, tāpēc krātuves memmap un Coinbase rindas nonāk te bez kopēšanas pa kolonnām.
+pandas tiek ielādēts tikai `to_frame()` izsaukumā.
+"""
+from typing import Optional
+import numpy as np
+
+from .candle_store import COLUMNS
+
+_INDEX = {c: i for i, c in enumerate(COLUMNS)}
+
+class Candles:
+    __slots__ = ("data",)
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, rows) -> "Candles":
+        """Hronoloģiskas rindas [time, low, high, open, close, volume] -> Candles."""
+        return cls(np.ascontiguousarray(np.asarray(rows, dtype=np.float64).reshape(-1, len(COLUMNS)).T))
+
+    def __len__(self) -> int:
+        return self.data.shape[1]
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.data[_INDEX[column]]
+
+    @property
+    def empty(self) -> bool:
+        return self.data.shape[1] == 0
+
+    @property
+    def times(self) -> np.ndarray:
+        """Unix sekundes (int64)."""
+        return self.data[0].astype(np.int64)
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.data[1]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.data[2]
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.data[3]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.data[4]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.data[5]
+
+    def tail(self, n: int) -> "Candles":
+        return self if len(self) <= n else Candles(self.data[:, -n:])
+
+    def rows(self) -> np.ndarray:
+        """(n, 6) skats, rinda = viena svece."""
+        return self.data.T
+
+    def to_frame(self):
+        """pandas DataFrame (time kā UTC datetime) — tikai rīkiem, kam tas vajadzīgs."""
+        import pandas as pd
+
+        df = pd.DataFrame({c: np.array(self.data[i]) for i, c in enumerate(COLUMNS)})
+        df["time"] = pd.to_datetime(df["time"], unit="s", utc=True)
+        return df
+
+    def __repr__(self) -> str:
+        return f"Candles(n={len(self)})"
+
+def to_candles(data, limit: int = 300) -> Optional[Candles]:
+    """Rindas vai (6, n) kolonnu masīvs -> Candles ar pēdējām `limit` svecēm (None, ja tukšs)."""
+    if isinstance(data, np.ndarray) and data.ndim == 2 and data.shape[0] == len(COLUMNS):
+        c = Candles(data)
+    else:
+        if data is None or len(data) == 0:
+            return None
+        c = Candles.from_rows(data)
+    return None if c.empty else c.tail(limit)
+
+def resample(candles: Optional[Candles], granularity_s: int) -> Optional[Candles]:
+    """Saliek smalkākas sveces `granularity_s` svecēs (UTC spaiņi); nepilno pirmo spaini atmet."""
+    if candles is None or candles.empty:
+        return None
+    t = candles.times
+    bucket = t - t % granularity_s
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(t)] - 1
+    out = np.vstack([
+        bucket[starts].astype(np.float64),
+        np.minimum.reduceat(candles.low, starts),
+        np.maximum.reduceat(candles.high, starts),
+        candles.open[starts],
+        candles.close[ends],
+        np.add.reduceat(candles.volume, starts),
+    ])
+    if bucket[0] != t[0]:
+        out = out[:, 1:]
+    return Candles(np.ascontiguousarray(out)) if out.shape[1] else None
@@ -1,12 +1,15 @@
+import json
 import os
+import re
 from pydantic import BaseModel, Field, ValidationError
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 class Settings(BaseModel):
     # Primārie slēdži
-    WATCHLIST_MODE: str = Field(default="TOP100")  # TOP100 | MANUAL
+    WATCHLIST_MODE: str = Field(default="TOP100")  # TOP<N> (piem. TOP100, TOP1000) | MANUAL
     MANUAL_SYMBOLS: List[str] = Field(default_factory=list)
     TIMEFRAME: str = "1h"  # 15m | 1h | 4h
+    TIMEFRAMES: List[str] = Field(default_factory=list)  # piem. 15m,1h,4h -> visi vienā skrējienā
     TOP_N: int = 5
 
     # Formāts / valoda
@@ -22,6 +25,11 @@ class Settings(BaseModel):
     RSI_THRESHOLD: float = 55.0
     ATR_PCT_MIN: float = 1.5
 
+    # Rangošana: ATR% pārsnieguma griesti punktos (None = bez griestiem) un best-first
+    # režīms, kas pārtrauc sveču ielādi, kad atlikušie tirgi vairs nevar iekļūt Top-N
+    ATR_SCORE_CAP: float | None = None
+    BEST_FIRST: bool = False
+
     # Dinamiskie sliekšņi pēc TF (ja nav norādīti, izmantos bāzes)
     # 15m
     MIN_24H_VOLUME_USD_15M: float | None = None
@@ -52,18 +60,61 @@ class Settings(BaseModel):
     # Avoti
     COINGECKO_BASE: str = "https://api.coingecko.com/api/v3"
     COINBASE_BASE: str = "https://api.exchange.coinbase.com"
+    COINBASE_ADVANCED_BASE: str = "https://api.coinbase.com/api/v3/brokerage/market"
+    FETCH_CONCURRENCY: int = 8  # paralēlo sveču pieprasījumu skaits
+    TELEGRAM_CONCURRENCY: int = 16  # paralēlās Telegram piegādes (tempu tur RATE_LIMITS)
+    RATE_LIMITS: str = ""  # piem. "api.coingecko.com=0.5:3,api.exchange.coinbase.com=10:15" (req/s:burst)
+
+    # Sveču avoti: pirmais primārais; otrs = hedžēšana (skat. src/candle_sources.py)
+    CANDLE_SOURCES: List[str] = Field(default_factory=lambda: ["exchange"])  # piem. "exchange,advanced"
+    HEDGE_QUANTILE: float = 0.95  # primārā latentuma kvantile, pēc kuras sūta sekundārajam
+    HEDGE_DELAY_S: float = 0.5  # slieksnis, kamēr nav savākta latentuma statistika
+    HEDGE_MAX_RATIO: float = 0.1  # ne vairāk kā šāda daļa pieprasījumu tiek hedžēti
+
+    # Sveču krātuve diskā (tukšs = izslēgta) un glabājamās vēstures garums
+    CANDLE_STORE_DIR: str = ""
+    CANDLE_HISTORY: int = 1000
+
+    # References datu kešs diskā (tukšs = izslēgts): produktu katalogs / tirgi ar TTL + ETag
+    HTTP_CACHE_DIR: str = ""
+    HTTP_CACHE_MAX_MB: int = 50
+    PRODUCTS_TTL_S: int = 86400
+    MARKETS_TTL_S: int = 120
+
+    # Inkrementāli RSI/ATR/MA stāvokļi starp skrējieniem (fails blakus STATE_FILE)
+    STREAMING_INDICATORS: bool = False
+
+    # --daemon: cik sekundes pēc sveces aizvēršanās pamosties (birža publicē ar nelielu aizturi)
+    DAEMON_SETTLE_S: int = 5
+
+    # Live režīms (python -m src.live): pārrēķina intervāls un minimālais laiks starp ziņām (ziņu laikā)
+    LIVE_EVAL_S: float = 1.0
+    LIVE_NOTIFY_MIN_S: float = 60.0
+
+    # Metrikas: run_report.json + rotator.prom (tukšs = neraksta)
+    METRICS_DIR: str = "metrics"
 
     # State
     STATE_FILE: str = "last_top.json"  # saglabāsim rangu arī
 
+    # Profili (JSON {"nosaukums": {iestatījumi}}): viena datu ielāde, katram profilam savi
+    # sliekšņi / TOP_N / TF / formāts / čati / state fails (skat. PROFILE_KEYS)
+    PROFILES_FILE: str = ""
+
+    # Skrējienu vēsture SQLite (tukšs = tikai STATE_FILE): pilns rangs katrā skrējienā
+    HISTORY_DB: str = ""
+    HISTORY_DETAIL_DAYS: int = 30  # pēc tam paliek tikai Top-N rindas
+    HISTORY_RETENTION_DAYS: int = 1825  # pēc tam skrējiens tiek dzēsts (0 = nekad)
+
 def _env_list(name: str) -> List[str]:
     return [x.strip() for x in os.getenv(name, "").split(",") if x.strip()]
 
-def load_settings() -> Settings:
+def load_settings(require_telegram: bool = True) -> Settings:
     env = {
         "WATCHLIST_MODE": os.getenv("WATCHLIST_MODE", "TOP100").upper(),
         "MANUAL_SYMBOLS": [s.strip().upper() for s in os.getenv("MANUAL_SYMBOLS", "").split(",") if s.strip()],
         "TIMEFRAME": os.getenv("TIMEFRAME", "1h"),
+        "TIMEFRAMES": [t.lower() for t in _env_list("TIMEFRAMES")],
         "TOP_N": int(os.getenv("TOP_N", "5")),
         "LANGUAGE": os.getenv("LANGUAGE", "LV").upper(),
         "SHORT_FORMAT": os.getenv("SHORT_FORMAT", "true").lower() == "true",
@@ -74,6 +125,8 @@ def load_settings() -> Settings:
         "MA_PERIOD": int(os.getenv("MA_PERIOD", "20")),
         "RSI_THRESHOLD": float(os.getenv("RSI_THRESHOLD", "55")),
         "ATR_PCT_MIN": float(os.getenv("ATR_PCT_MIN", "1.5")),
+        "ATR_SCORE_CAP": _maybe_float("ATR_SCORE_CAP"),
+        "BEST_FIRST": os.getenv("BEST_FIRST", "false").lower() == "true",
         # TF dinamika
         "MIN_24H_VOLUME_USD_15M": _maybe_float("MIN_24H_VOLUME_USD_15M"),
         "MIN_24H_PCT_15M": _maybe_float("MIN_24H_PCT_15M"),
@@ -91,6 +144,28 @@ def load_settings() -> Settings:
         "RSI_THRESHOLD_4H": _maybe_float("RSI_THRESHOLD_4H"),
         "ATR_PCT_MIN_4H": _maybe_float("ATR_PCT_MIN_4H"),
         "ADVICE_ENABLED": os.getenv("ADVICE_ENABLED", "true").lower() == "true",
+        "FETCH_CONCURRENCY": int(os.getenv("FETCH_CONCURRENCY", "8")),
+        "TELEGRAM_CONCURRENCY": int(os.getenv("TELEGRAM_CONCURRENCY", "16")),
+        "RATE_LIMITS": os.getenv("RATE_LIMITS", "").strip(),
+        "CANDLE_SOURCES": [s.lower() for s in _env_list("CANDLE_SOURCES")] or ["exchange"],
+        "HEDGE_QUANTILE": float(os.getenv("HEDGE_QUANTILE", "0.95")),
+        "HEDGE_DELAY_S": float(os.getenv("HEDGE_DELAY_S", "0.5")),
+        "HEDGE_MAX_RATIO": float(os.getenv("HEDGE_MAX_RATIO", "0.1")),
+        "CANDLE_STORE_DIR": os.getenv("CANDLE_STORE_DIR", "").strip(),
+        "CANDLE_HISTORY": int(os.getenv("CANDLE_HISTORY", "1000")),
+        "HTTP_CACHE_DIR": os.getenv("HTTP_CACHE_DIR", "").strip(),
+        "HTTP_CACHE_MAX_MB": int(os.getenv("HTTP_CACHE_MAX_MB", "50")),
+        "PRODUCTS_TTL_S": int(os.getenv("PRODUCTS_TTL_S", "86400")),
+        "MARKETS_TTL_S": int(os.getenv("MARKETS_TTL_S", "120")),
+        "STREAMING_INDICATORS": os.getenv("STREAMING_INDICATORS", "false").lower() == "true",
+        "DAEMON_SETTLE_S": int(os.getenv("DAEMON_SETTLE_S", "5")),
+        "LIVE_EVAL_S": float(os.getenv("LIVE_EVAL_S", "1.0")),
+        "LIVE_NOTIFY_MIN_S": float(os.getenv("LIVE_NOTIFY_MIN_S", "60")),
+        "METRICS_DIR": os.getenv("METRICS_DIR", "metrics").strip(),
+        "PROFILES_FILE": os.getenv("PROFILES_FILE", "").strip(),
+        "HISTORY_DB": os.getenv("HISTORY_DB", "").strip(),
+        "HISTORY_DETAIL_DAYS": int(os.getenv("HISTORY_DETAIL_DAYS", "30")),
+        "HISTORY_RETENTION_DAYS": int(os.getenv("HISTORY_RETENTION_DAYS", "1825")),
         "TELEGRAM_BOT_TOKEN": os.getenv("TELEGRAM_BOT_TOKEN", "").strip(),
         "TELEGRAM_CHAT_IDS": _env_list("TELEGRAM_CHAT_IDS"),
     }
@@ -98,14 +173,81 @@ def load_settings() -> Settings:
         cfg = Settings(**env)
     except ValidationError as e:
         raise SystemExit(f"Config validation error: {e}")
+    # ar profiliem čati nāk no profila
+    return _validate(cfg, require_telegram, require_chats=require_telegram and not cfg.PROFILES_FILE)
 
-    if not cfg.TELEGRAM_BOT_TOKEN:
+def _validate(cfg: Settings, require_telegram: bool, require_chats: bool) -> Settings:
+    if require_telegram and not cfg.TELEGRAM_BOT_TOKEN:
         raise SystemExit("Config error: TELEGRAM_BOT_TOKEN is empty or missing.")
-    if not cfg.TELEGRAM_CHAT_IDS:
+    if cfg.WATCHLIST_MODE != "MANUAL" and universe_size(cfg.WATCHLIST_MODE) is None:
+        raise SystemExit(f"Config error: WATCHLIST_MODE={cfg.WATCHLIST_MODE!r} (TOP<N> | MANUAL).")
+    if cfg.WATCHLIST_MODE == "MANUAL" and not cfg.MANUAL_SYMBOLS:
+        raise SystemExit("Config error: WATCHLIST_MODE=MANUAL requires MANUAL_SYMBOLS.")
+    if cfg.BEST_FIRST and cfg.ATR_SCORE_CAP is None:
+        raise SystemExit("Config error: BEST_FIRST=true requires ATR_SCORE_CAP (bounds the ATR score term).")
+    bad_src = [s for s in cfg.CANDLE_SOURCES if s not in ("exchange", "advanced")]
+    if bad_src or not 1 <= len(cfg.CANDLE_SOURCES) <= 2:
+        raise SystemExit(f"Config error: CANDLE_SOURCES={cfg.CANDLE_SOURCES} (1–2 of exchange | advanced).")
+    bad_tf = [t for t in cfg.TIMEFRAMES + [cfg.TIMEFRAME] if t not in ("15m", "1h", "4h")]
+    if bad_tf:
+        raise SystemExit(f"Config error: unsupported timeframe(s) {bad_tf} (15m | 1h | 4h).")
+    if require_chats and not cfg.TELEGRAM_CHAT_IDS:
         raise SystemExit("Config error: TELEGRAM_CHAT_IDS is empty or missing (comma-separated numeric IDs).")
 
     return cfg
 
+# Profilā drīkst mainīt tikai to, kas neietekmē datu ielādi (tirgi, produkti, sveču avoti)
+PROFILE_KEYS = {
+    "TIMEFRAME", "TIMEFRAMES", "TOP_N", "LANGUAGE", "SHORT_FORMAT", "LONG_FORMAT", "DETAIL_EMOJI",
+    "MIN_24H_VOLUME_USD", "MIN_24H_PCT", "MA_PERIOD", "RSI_THRESHOLD", "ATR_PCT_MIN", "ATR_SCORE_CAP", "BEST_FIRST",
+    *(f"{k}_{tf}" for k in ("MIN_24H_VOLUME_USD", "MIN_24H_PCT", "MA_PERIOD", "RSI_THRESHOLD", "ATR_PCT_MIN")
+      for tf in ("15M", "1H", "4H")),
+    "ADVICE_ENABLED", "TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_IDS", "STATE_FILE",
+}
+
+def load_profiles(cfg: Settings, require_telegram: bool = True) -> List[Tuple[str, Settings]]:
+    """
+    PROFILES_FILE -> [(nosaukums, Settings)]; katrs profils = bāzes (env) iestatījumi +
+    profila vērtības. Bez PROFILES_FILE — viens nenosaukts profils [("", cfg)].
+    STATE_FILE pēc noklusējuma: last_top.json -> last_top_<nosaukums>.json.
+    """
+    if not cfg.PROFILES_FILE:
+        return [("", cfg)]
+    try:
+        with open(cfg.PROFILES_FILE, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Config error: PROFILES_FILE {cfg.PROFILES_FILE!r}: {e}")
+    if not isinstance(spec, dict) or not spec:
+        raise SystemExit("Config error: PROFILES_FILE must be a non-empty JSON object {name: {settings}}.")
+
+    base = cfg.model_dump()
+    stem, ext = os.path.splitext(cfg.STATE_FILE)
+    profiles = []
+    for name, overrides in spec.items():
+        bad = sorted(set(overrides) - PROFILE_KEYS)
+        if bad:
+            raise SystemExit(f"Config error: profile {name!r}: {bad} are shared settings (env only).")
+        values = dict(overrides)
+        for k in ("TELEGRAM_CHAT_IDS", "TIMEFRAMES"):
+            if isinstance(values.get(k), str):
+                values[k] = [x.strip() for x in values[k].split(",") if x.strip()]
+        values.setdefault("STATE_FILE", f"{stem}_{name}{ext or '.json'}")
+        try:
+            p = Settings(**{**base, **values})
+        except ValidationError as e:
+            raise SystemExit(f"Config validation error in profile {name!r}: {e}")
+        profiles.append((name, _validate(p, require_telegram, require_chats=require_telegram)))
+    states = [p.STATE_FILE for _, p in profiles]
+    if len(set(states)) != len(states):
+        raise SystemExit(f"Config error: profiles must use distinct STATE_FILE values ({states}).")
+    return profiles
+
+def universe_size(mode: str):
+    """"TOP100" -> 100, "TOP1000" -> 1000; citādi None."""
+    m = re.fullmatch(r"TOP(\d+)", mode.upper())
+    return int(m.group(1)) if m and int(m.group(1)) > 0 else None
+
 def _maybe_float(name: str):
     v = os.getenv(name)
     return float(v) if v not in (None, "",) else None
@@ -114,9 +256,9 @@ def _maybe_int(name: str):
     v = os.getenv(name)
     return int(v) if v not in (None, "",) else None
 
-def resolve_thresholds(cfg: Settings) -> Dict[str, float | int]:
+def resolve_thresholds(cfg: Settings, timeframe: str | None = None) -> Dict[str, float | int]:
     """Atgriež TF-konkrētus sliekšņus (ja nav iestatīti, krīt uz bāzi)."""
-    tf = cfg.TIMEFRAME.lower()
+    tf = (timeframe or cfg.TIMEFRAME).lower()
     pick = lambda base, v15, v1h, v4h: (
         v15 if tf == "15m" and v15 is not None else
         v1h if tf == "1h"  and v1h is not None else
@@ -1,47 +1,325 @@
+import json
+import os
 import time
-import pandas as pd
-from typing import List, Dict, Optional
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+from .candle_store import CandleStore
+from .candles import Candles, to_candles, resample
+from .http_cache import HttpCache
+from .metrics import METRICS
+from .ratelimit import LIMITER
+
 COINGECKO_MARKETS = "/coins/markets"
+COINGECKO_COINS_LIST = "/coins/list"
+COINGECKO_PAGE_MAX = 250  # CoinGecko per_page maksimums
 COINBASE_PRODUCTS = "/products"
 COINBASE_CANDLES = "/products/{product_id}/candles"
 
 class RateLimitError(Exception):
     pass
 
+# Viens koplietots keep-alive klients visam procesam (HTTP/2, savienojumu pūls),
+# lai katrs pieprasījums nemaksā savu TCP/TLS rokasspiedienu.
+_CLIENT: Optional[httpx.Client] = None
+_CLIENT_LOCK = threading.Lock()
+# Aizvietojams transports (ierakstīšana / atskaņošana, skat. src/replay.py)
+_TRANSPORT: Optional[httpx.BaseTransport] = None
+
+def set_transport(transport: Optional[httpx.BaseTransport]) -> None:
+    """Visi turpmākie klienti (arī notifier) ies caur `transport`; None = tīkls."""
+    global _TRANSPORT
+    close_client()
+    _TRANSPORT = transport
+
+def get_transport() -> Optional[httpx.BaseTransport]:
+    return _TRANSPORT
+
+def get_client(max_connections: int = 32) -> httpx.Client:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT.is_closed:
+            _CLIENT = httpx.Client(
+                http2=True,
+                timeout=30,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                transport=_TRANSPORT,
+            )
+        return _CLIENT
+
+def close_client() -> None:
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.close()
+            _CLIENT = None
+
+# Coinbase atbalstītās granularitātes; pārējās (piem., 4h) jāsaliek lokāli.
+NATIVE_GRANULARITIES = (60, 300, 900, 3600, 21600, 86400)
+
 def timeframe_to_granularity_seconds(tf: str) -> int:
     tf = tf.lower()
     return {"15m": 900, "1h": 3600, "4h": 14400}.get(tf, 3600)
 
+def fetch_granularity(granularity_s: int) -> int:
+    """Lielākā Coinbase granularitāte, no kuras var salikt `granularity_s` (4h -> 1h)."""
+    return max(g for g in NATIVE_GRANULARITIES if g <= granularity_s and granularity_s % g == 0)
+
+# tenacity mēģinājuma numurs pašreizējam pavedienam (metrikām)
+_ATTEMPT = threading.local()
+
+def _note_attempt(retry_state) -> None:
+    _ATTEMPT.n = retry_state.attempt_number
+
+_backoff = wait_exponential(multiplier=1, min=1, max=8)
+# 429: Retry-After un tempu nodrošina LIMITER; šis ir minimums arī tad, ja tas izslēgts (replay)
+_rate_backoff = wait_exponential(multiplier=0.25, min=0.25, max=4)
+
+def _wait(retry_state) -> float:
+    """429 — īss eksponenciāls minimums (pārējo gaida LIMITER); tīkla kļūdām — eksponenciāli."""
+    if isinstance(retry_state.outcome.exception(), RateLimitError):
+        return _rate_backoff(retry_state)
+    return _backoff(retry_state)
+
 @retry(reraise=True, stop=stop_after_attempt(4),
-       wait=wait_exponential(multiplier=1, min=1, max=8),
-       retry=retry_if_exception_type((httpx.ReadTimeout, httpx.ConnectError, RateLimitError)))
-def _get(client: httpx.Client, url: str, params: dict = None, headers: dict = None):
-    r = client.get(url, params=params, headers=headers, timeout=30)
+       wait=_wait,
+       retry=retry_if_exception_type((httpx.ReadTimeout, httpx.ConnectError, RateLimitError)),
+       before=_note_attempt)
+def _request(client: Optional[httpx.Client], url: str, params: dict = None, headers: dict = None) -> httpx.Response:
+    client = client or get_client()
+    attempt = getattr(_ATTEMPT, "n", 1)
+    LIMITER.acquire(url)
+    t0 = time.perf_counter()
+    try:
+        r = client.get(url, params=params, headers=headers, timeout=30)
+    except httpx.HTTPError as e:
+        METRICS.record_http(url, None, time.perf_counter() - t0, 0, attempt, error=type(e).__name__)
+        raise
+    METRICS.record_http(url, r.status_code, time.perf_counter() - t0, len(r.content), attempt)
+    retry_after = LIMITER.on_response(url, r.status_code, r.headers)
     if r.status_code == 429:
-        raise RateLimitError("429 from API")
+        raise RateLimitError(f"429 from API (Retry-After: {retry_after})")
+    return r
+
+def _get(client: Optional[httpx.Client], url: str, params: dict = None, headers: dict = None):
+    r = _request(client, url, params=params, headers=headers)
     r.raise_for_status()
     return r.json()
 
-def get_top100_markets_coingecko(base_url: str) -> List[Dict]:
+def cached_get(cache: Optional[HttpCache], url: str, params: dict = None, ttl_s: float = 0):
+    """
+    _get caur diska kešu: svaigs ieraksts bez tīkla, novecojis — nosacīta
+    pārbaude (ETag / Last-Modified), 304 gadījumā izmanto saglabāto ķermeni.
+    """
+    if cache is None:
+        return _get(get_client(), url, params=params)
+    key = HttpCache.key(url, params)
+    entry = cache.get(key)
+    if entry is not None and cache.age(entry) < ttl_s:
+        METRICS.inc("http_cache_hit")
+        return entry["body"]
+    headers = {}
+    if entry is not None and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    r = _request(get_client(), url, params=params, headers=headers or None)
+    if r.status_code == 304 and entry is not None:
+        METRICS.inc("http_cache_revalidated")
+        return cache.refresh(key, entry)["body"]
+    r.raise_for_status()
+    METRICS.inc("http_cache_miss")
+    body = r.json()
+    cache.put(key, body, r.headers.get("etag"), r.headers.get("last-modified"))
+    return body
+
+def get_markets_page(base_url: str, page: int = 1, per_page: int = 100, ids: Optional[List[str]] = None,
+                     cache: Optional[HttpCache] = None, ttl_s: float = 0) -> List[Dict]:
     params = {
         "vs_currency": "usd",
         "order": "market_cap_desc",
-        "per_page": 100,
-        "page": 1,
+        "per_page": per_page,
+        "page": page,
         "price_change_percentage": "24h",
         "sparkline": "false",
     }
-    with httpx.Client() as client:
-        data = _get(client, base_url + COINGECKO_MARKETS, params=params)
-    return data
+    if ids:
+        params["ids"] = ",".join(ids)
+    return cached_get(cache, base_url + COINGECKO_MARKETS, params=params, ttl_s=ttl_s) or []
 
-def get_coinbase_products(base_url: str) -> List[Dict]:
-    with httpx.Client() as client:
-        data = _get(client, base_url + COINBASE_PRODUCTS)
-    return data
+def get_top100_markets_coingecko(base_url: str, cache: Optional[HttpCache] = None, ttl_s: float = 0) -> List[Dict]:
+    return get_markets_page(base_url, 1, 100, cache=cache, ttl_s=ttl_s)
+
+# Ieraksta vieta avota secībā (lapa, indekss lapā): deterministiska ranga atslēga,
+# lai gan lapas ienāk `as_completed` secībā
+FEED_POS = "_feed_pos"
+
+def _stream_pages(fetch_page, jobs: list, max_workers: int) -> Iterator[Dict]:
+    """
+    Visas lapas pieprasa uzreiz (paralēli); ieraksti plūst tālāk, tiklīdz katra lapa atnāk.
+    Posms "market_fetch" = laiks no pieprasījumiem līdz pēdējai lapai (neatkarīgi no patērētāja tempa).
+    """
+    if not jobs:
+        return iter(())
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs))))
+    t0 = time.perf_counter()
+    remaining = [len(jobs)]
+    lock = threading.Lock()
+
+    def page_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        METRICS.add_stage_time("market_fetch", time.perf_counter() - t0)
+
+    futures = {}
+    for page, job in enumerate(jobs):
+        f = pool.submit(fetch_page, job)
+        futures[f] = page
+        f.add_done_callback(page_done)
+    pool.shutdown(wait=False)
+
+    def gen():
+        for f in as_completed(futures):
+            page = futures[f]
+            for i, row in enumerate(f.result()):
+                yield {**row, FEED_POS: (page, i)}  # kopija: ķermenis var būt kešā
+    return gen()
+
+def iter_top_markets(base_url: str, n: int = 100, cache: Optional[HttpCache] = None, ttl_s: float = 0,
+                     max_workers: int = 4) -> Iterator[Dict]:
+    """Top-`n` pēc kapitalizācijas: ceil(n / 250) lapas paralēli, ienākšanas secībā."""
+    per_page = min(n, COINGECKO_PAGE_MAX)
+    pages = list(range(1, (n + per_page - 1) // per_page + 1))
+    last_len = n - per_page * (len(pages) - 1)
+
+    def fetch(page):
+        rows = get_markets_page(base_url, page, per_page, cache=cache, ttl_s=ttl_s)
+        return rows[:last_len] if page == pages[-1] else rows
+    return _stream_pages(fetch, pages, max_workers)
+
+def coingecko_ids_path(state_file: str) -> str:
+    """Blakus rotatora state failam: last_top.json -> last_top.coingecko_ids.json"""
+    return os.path.splitext(state_file)[0] + ".coingecko_ids.json"
+
+def _load_ids_file(path: str, name: str, ttl_s: float) -> Optional[Dict[str, List[str]]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("name") != name or time.time() - data.get("ts", 0) >= ttl_s:
+        return None
+    return data["ids"]
+
+def _save_ids_file(path: str, name: str, ids: Dict[str, List[str]]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"name": name, "ts": time.time(), "ids": ids}, f)
+    os.replace(tmp, path)
+
+def resolve_coingecko_ids(base_url: str, symbols: List[str], cache: Optional[HttpCache] = None,
+                          ttl_s: float = 0, ids_file: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    SYMBOL -> CoinGecko id kandidāti (simbols nav unikāls; ieraksts var būt arī pats id).
+    Gatavā atbilde glabājas ar TTL — HTTP kešā vai bez tā `ids_file` —, tāpēc
+    /coins/list (vairāki MB) netiek lejupielādēts katrā skrējienā.
+    """
+    wanted = sorted({s.upper() for s in symbols})
+    name = f"coingecko_ids:{base_url}:{','.join(wanted)}"
+    if cache is not None:
+        cached = cache.load_json(name, ttl_s)
+    else:
+        cached = _load_ids_file(ids_file, name, ttl_s) if ids_file else None
+    if cached is not None:
+        METRICS.inc("http_cache_hit")
+        return cached
+    out: Dict[str, List[str]] = {s: [] for s in wanted}
+    for coin in cached_get(cache, base_url + COINGECKO_COINS_LIST, ttl_s=ttl_s) or []:
+        for key in (str(coin.get("symbol", "")).upper(), str(coin.get("id", "")).upper()):
+            if key in out and coin["id"] not in out[key]:
+                out[key].append(coin["id"])
+    if cache is not None:
+        cache.save_json(name, out)
+    elif ids_file:
+        _save_ids_file(ids_file, name, out)
+    return out
+
+def iter_manual_markets(base_url: str, symbols: List[str], cache: Optional[HttpCache] = None,
+                        ttl_s: float = 0, ids_ttl_s: float = 0, max_workers: int = 4,
+                        ids_file: Optional[str] = None) -> Iterator[Dict]:
+    """
+    MANUAL watchlist: tikai norādītie simboli, `ids` pa COINGECKO_PAGE_MAX vienā pieprasījumā.
+    Ja simbolam ir vairāki kandidāti, paliek lielākās kapitalizācijas monēta.
+    """
+    candidates = resolve_coingecko_ids(base_url, symbols, cache, ids_ttl_s, ids_file)
+    missing = [s for s, ids in candidates.items() if not ids]
+    if missing:
+        print(f"[watchlist] not on CoinGecko: {missing}")
+    # viena simbola kandidāti vienā partijā, lai izvēle būtu pēc kapitalizācijas
+    batches: List[List[tuple]] = [[]]
+    for sym, ids in candidates.items():
+        if ids and len(batches[-1]) + len(ids) > COINGECKO_PAGE_MAX:
+            batches.append([])
+        batches[-1].extend((sym, i) for i in ids[:COINGECKO_PAGE_MAX])
+    batches = [b for b in batches if b]
+
+    def fetch(batch):
+        owner = {i: sym for sym, i in batch}
+        rows, seen = [], set()
+        for m in get_markets_page(base_url, 1, COINGECKO_PAGE_MAX, ids=sorted(owner), cache=cache, ttl_s=ttl_s):
+            sym = owner.get(m.get("id"))
+            if sym and sym not in seen:  # market_cap_desc -> pirmais ir lielākais
+                seen.add(sym)
+                rows.append(m)
+        return rows
+    return _stream_pages(fetch, batches, max_workers)
+
+class MarketFeed:
+    """
+    Tirgu plūsma filter_and_rank ievadei: pirmā iterācija straumē no tīkla (lapas
+    ienākšanas secībā), nākamās (citi TF) atkārto jau saņemtos. Dublikātus pēc
+    CoinGecko id (monēta pārvietojusies starp lapām) izlaiž.
+    """
+
+    def __init__(self, source: Iterable[Dict]):
+        self._source = iter(source)
+        self._seen: List[Dict] = []
+        self._ids = set()
+        self._done = False
+
+    def __iter__(self) -> Iterator[Dict]:
+        i = 0
+        while True:
+            if i < len(self._seen):
+                yield self._seen[i]
+                i += 1
+                continue
+            if self._done:
+                return
+            try:
+                m = next(self._source)
+            except StopIteration:
+                self._done = True
+                METRICS.inc("markets_fetched", len(self._seen))
+                return
+            key = m.get("id") or m.get("symbol")
+            if key in self._ids:
+                continue
+            self._ids.add(key)
+            self._seen.append(m)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+def get_coinbase_products(base_url: str, cache: Optional[HttpCache] = None, ttl_s: float = 0) -> List[Dict]:
+    return cached_get(cache, base_url + COINBASE_PRODUCTS, ttl_s=ttl_s)
 
 def pick_usd_pairs(products: List[Dict]) -> Dict[str, str]:
     """Map SYMBOL -> PRODUCT_ID where quote is USD (e.g., ETH -> ETH-USD)."""
@@ -54,21 +332,126 @@ def pick_usd_pairs(products: List[Dict]) -> Dict[str, str]:
         out[base] = pid
     return out
 
-def fetch_coinbase_ohlcv(base_url: str, product_id: str, granularity_s: int, limit: int = 300) -> Optional[pd.DataFrame]:
+def get_symbol_to_product(base_url: str, cache: Optional[HttpCache] = None, ttl_s: float = 0) -> Dict[str, str]:
+    """
+    SYMBOL -> PRODUCT_ID karte. Ar kešu tā tiek glabāta jau gatava, tāpēc svaigā
+    stāvoklī nav ne produktu kataloga pieprasījuma, ne tā parsēšanas.
+    """
+    if cache is not None:
+        cached = cache.load_json(f"symbol_to_product:{base_url}", ttl_s)
+        if cached is not None:
+            METRICS.inc("http_cache_hit")
+            return cached
+    mapping = pick_usd_pairs(get_coinbase_products(base_url, cache, ttl_s))
+    if cache is not None:
+        cache.save_json(f"symbol_to_product:{base_url}", mapping)
+    return mapping
+
+def fetch_coinbase_candles(base_url: str, product_id: str, granularity_s: int,
+                           start: Optional[int] = None, end: Optional[int] = None) -> List[list]:
     """
     Coinbase candles response rows:
     [ time, low, high, open, close, volume ] in reverse chronological order.
+    Atgriež tās hronoloģiskā secībā; `start`/`end` ir unix sekundes.
     """
     params = {"granularity": granularity_s}
+    if start is not None:
+        params["start"] = datetime.fromtimestamp(start, tz=timezone.utc).isoformat()
+        params["end"] = datetime.fromtimestamp(end if end is not None else time.time(), tz=timezone.utc).isoformat()
     url = base_url + COINBASE_CANDLES.format(product_id=product_id)
-    with httpx.Client() as client:
-        data = _get(client, url, params=params)
-    if not data:
-        return None
-    # Reverse to chronological
-    data = list(reversed(data))
-    df = pd.DataFrame(data, columns=["time", "low", "high", "open", "close", "volume"])
-    if len(df) > limit:
-        df = df.iloc[-limit:]
-    df["time"] = pd.to_datetime(df["time"], unit="s", utc=True)
-    return df
+    data = _get(get_client(), url, params=params)
+    return list(reversed(data or []))
+
+def fetch_candles_paged(source, product_id: str, granularity_s: int, limit: int) -> List[list]:
+    """
+    Vairāk par 300 svecēm: iet atpakaļ pa 300 sveču logiem (start/end).
+    `source(product_id, granularity_s, start=None, end=None)` -> hronoloģiskas rindas
+    (fetch_coinbase_candles vai CandleSource).
+    """
+    if limit <= 300:
+        return source(product_id, granularity_s)
+    end = int(time.time())
+    out: List[list] = []
+    while len(out) < limit:
+        start = end - 300 * granularity_s
+        page = source(product_id, granularity_s, start=start, end=end)
+        if out:
+            page = [r for r in page if r[0] < out[0][0]]
+        if not page:
+            break
+        out = page + out
+        end = start
+    return out[-limit:]
+
+def fetch_coinbase_candles_paged(base_url: str, product_id: str, granularity_s: int, limit: int) -> List[list]:
+    return fetch_candles_paged(partial(fetch_coinbase_candles, base_url), product_id, granularity_s, limit)
+
+def fetch_ohlcv(source, product_id: str, granularity_s: int, limit: int = 300) -> Optional[Candles]:
+    return to_candles(fetch_candles_paged(source, product_id, granularity_s, limit), limit)
+
+def fetch_coinbase_ohlcv(base_url: str, product_id: str, granularity_s: int, limit: int = 300) -> Optional[Candles]:
+    return fetch_ohlcv(partial(fetch_coinbase_candles, base_url), product_id, granularity_s, limit)
+
+def fetch_coinbase_ohlcv_stored(base_url: str, store: CandleStore, product_id: str,
+                                granularity_s: int, limit: int = 300) -> Optional[Candles]:
+    return fetch_ohlcv_stored(partial(fetch_coinbase_candles, base_url), store, product_id, granularity_s, limit)
+
+def fetch_ohlcv_stored(source, store: CandleStore, product_id: str,
+                       granularity_s: int, limit: int = 300) -> Optional[Candles]:
+    """
+    Kā fetch_ohlcv, bet no avota prasa tikai logu pēc pēdējās
+    saglabātās sveces (ieskaitot to, jo tā varēja būt vēl neaizvērta).
+    """
+    stored = store.load(product_id, granularity_s)
+    last = int(stored[0, -1]) if stored is not None and stored.shape[1] else None
+    now = int(time.time())
+    full = (last is None or stored.shape[1] < min(limit, store.history)
+            or (now - last) // granularity_s >= 299)  # 300 sveces = viena lapa
+    if full:
+        rows = fetch_candles_paged(source, product_id, granularity_s, max(limit, 300))
+    else:
+        rows = source(product_id, granularity_s, start=last, end=now)
+    arr = store.append(product_id, granularity_s, rows, replace=full)
+    return to_candles(arr, limit) if arr is not None else None
+
+class CandleCache:
+    """
+    Skrējiena sveču kešs pēc (product_id, granularity).
+    Izsaucams tāpat kā `ohlcv_fetcher` (pid, gran, limit), tāpēc to var dalīt
+    starp filter_and_rank, compute_entry_sl_tp un citiem posmiem.
+    `plan` {granularitāte: (bāzes granularitāte, bāzes sveču skaits)}: no tīkla ielādē
+    tikai bāzes sērijas (katru vienreiz), pārējās granularitātes saliek lokāli no tām.
+    """
+
+    def __init__(self, fetcher, plan: Optional[Dict[int, Tuple[int, int]]] = None):
+        self._fetcher = fetcher
+        self.plan = plan or {}
+        self._data: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, product_id: str, granularity_s: int, limit: int = 300) -> Optional[Candles]:
+        key = (product_id, granularity_s)
+        with self._lock:
+            cached = self._data.get(key)
+            if cached is not None and cached[0] >= limit:
+                self.hits += 1
+                c = cached[1]
+                return c.tail(limit) if c is not None else None
+            self.misses += 1
+        base, base_limit = self.plan.get(granularity_s, (granularity_s, limit))
+        fetch_limit = limit
+        if base != granularity_s:
+            c = resample(self.get(product_id, base, base_limit), granularity_s)
+        else:
+            fetch_limit = max(limit, base_limit)
+            c = self._fetcher(product_id, granularity_s, fetch_limit)
+        with self._lock:
+            self._data[key] = (fetch_limit, c)
+        return c.tail(limit) if c is not None else None
+
+    __call__ = get
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._data)}
@@ -71,7 +71,7 @@ def build_message_lv(
 
     if include_advice and top_rows:
         lines.append("")
-        lines.append("Ieteikumi (1h):")
+        lines.append(f"Ieteikumi ({timeframe}):")
         for r in top_rows:
             adv = r.get("advice", {})
             if adv:
@@ -0,0 +1,217 @@
+"""
+Skrējienu vēsture (SQLite, tikai pievienošana) last_top.json vietā.
+
+    runs    — viens ieraksts skrējienam un TF: laiks, top_n, Top-N JSON
+    entries — katra simbola rinda: vieta pilnajā rangā, punkti, indikatori vai izlaišanas iemesls
+    latest  — pēdējais Top-N katram TF (load_prev_top = viens primārās atslēgas nolasījums)
+
+Indeksi: entries(symbol, ts) simbola vēsturei laika logā, runs(timeframe, ts) sērijām.
+Kompaktēšana pēc katra pieraksta: vecākiem par `detail_days` paliek tikai Top-N
+rindas, vecāki par `retention_days` tiek dzēsti, tāpēc fails paliek ierobežots.
+
+    python -m src.history ETH --tf 1h --since 2025-01-01   # ranga vēsture + cik ilgi Top-N
+    python -m src.history --compact
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .metrics import METRICS
+
+DAY_S = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    timeframe TEXT NOT NULL,
+    top_n INTEGER NOT NULL,
+    top TEXT NOT NULL,
+    detailed INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS runs_tf_ts ON runs(timeframe, ts);
+CREATE INDEX IF NOT EXISTS runs_ts ON runs(ts);
+CREATE INDEX IF NOT EXISTS runs_detailed_ts ON runs(detailed, ts);
+CREATE TABLE IF NOT EXISTS entries (
+    run_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    timeframe TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    rank INTEGER,
+    in_top INTEGER NOT NULL,
+    score REAL, pct24h REAL, price REAL, ma REAL, rsi REAL, atrpct REAL, volume_usd REAL,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_symbol_ts ON entries(symbol, ts);
+CREATE INDEX IF NOT EXISTS entries_run ON entries(run_id);
+CREATE TABLE IF NOT EXISTS latest (
+    timeframe TEXT PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    top TEXT NOT NULL
+);
+"""
+
+VALUE_FIELDS = ("score", "pct24h", "price", "ma", "rsi", "atrpct", "volume_usd")
+ENTRY_COLUMNS = ("run_id", "ts", "timeframe", "symbol", "rank", "in_top") + VALUE_FIELDS + ("reason",)
+INSERT_ENTRY = (f"INSERT INTO entries ({', '.join(ENTRY_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(ENTRY_COLUMNS))})")
+
+def _top_payload(top: List[Dict]) -> List[Dict]:
+    return [{"symbol": r["symbol"], "rank": i + 1} for i, r in enumerate(top)]
+
+def _syms_ranks(payload: List[Dict]) -> Tuple[List[str], Dict[str, int]]:
+    return [it["symbol"] for it in payload], {it["symbol"]: int(it["rank"]) for it in payload}
+
+class RunHistory:
+    def __init__(self, path: str, detail_days: int = 30, retention_days: int = 1825):
+        self.path = path
+        self.detail_days = detail_days
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")  # iedarbojas tikai jaunam failam
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self.db.close()
+
+    # ── Pēdējais Top-N ────────────────────────────────────────────────────────
+
+    def latest(self, timeframe: str) -> Optional[Tuple[List[str], Dict[str, int]]]:
+        row = self.db.execute("SELECT top FROM latest WHERE timeframe = ?", (timeframe,)).fetchone()
+        return None if row is None else _syms_ranks(json.loads(row[0]))
+
+    def prev_top(self, timeframe: str, legacy_state_file: Optional[str] = None) -> Tuple[List[str], Dict[str, int]]:
+        """Kā load_prev_top; kamēr TF vēl nav ierakstu — no vecā state faila (pāreja)."""
+        prev = self.latest(timeframe)
+        if prev is not None:
+            return prev
+        if legacy_state_file:
+            from .strategy_rotator import load_prev_top
+            return load_prev_top(legacy_state_file)
+        return [], {}
+
+    # ── Pieraksts ─────────────────────────────────────────────────────────────
+
+    def append(self, timeframe: str, top: List[Dict], top_n: int, ranking: Optional[List[Dict]] = None,
+               skipped: Iterable[Dict] = (), ts: Optional[float] = None) -> bool:
+        """
+        Pieraksta skrējienu: `ranking` (pilnais rangs, dilstoši; citādi `top`) un
+        `skipped` iemesli. Atgriež True, ja Top-N sastāvs/secība mainījās (kā save_top).
+        """
+        ts = int(ts if ts is not None else time.time())
+        payload = _top_payload(top)
+        ranking = ranking if ranking is not None else top
+        rows = [(ts, timeframe, r["symbol"], i + 1, int(i < len(top)), *(r.get(k) for k in VALUE_FIELDS), None)
+                for i, r in enumerate(ranking)]
+        rows += [(ts, timeframe, s["symbol"], None, 0, *([None] * len(VALUE_FIELDS)), s.get("reason"))
+                 for s in skipped]
+        with self._lock, self.db:
+            prev = self.db.execute("SELECT top FROM latest WHERE timeframe = ?", (timeframe,)).fetchone()
+            changed = prev is None or [it["symbol"] for it in json.loads(prev[0])] != [r["symbol"] for r in top]
+            top_json = json.dumps(payload, ensure_ascii=False)
+            run_id = self.db.execute("INSERT INTO runs (ts, timeframe, top_n, top) VALUES (?, ?, ?, ?)",
+                                     (ts, timeframe, top_n, top_json)).lastrowid
+            self.db.executemany(INSERT_ENTRY, [(run_id, *r) for r in rows])
+            self.db.execute("INSERT OR REPLACE INTO latest (timeframe, run_id, top) VALUES (?, ?, ?)",
+                            (timeframe, run_id, top_json))
+        METRICS.inc("history_rows", len(rows))
+        self.compact(now=ts)
+        return changed
+
+    def compact(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Detaļas (ne-Top rindas, iemesli) pēc `detail_days`; skrējieni pēc `retention_days`."""
+        now = int(now if now is not None else time.time())
+        out = {"runs_compacted": 0, "runs_deleted": 0, "entries_deleted": 0}
+        with self._lock:
+            with self.db:
+                if self.retention_days > 0:
+                    old = [r[0] for r in self.db.execute(
+                        "SELECT id FROM runs WHERE ts < ? AND id NOT IN (SELECT run_id FROM latest)",
+                        (now - self.retention_days * DAY_S,))]
+                    for run_id in old:
+                        out["entries_deleted"] += self.db.execute("DELETE FROM entries WHERE run_id = ?", (run_id,)).rowcount
+                        self.db.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+                    out["runs_deleted"] = len(old)
+                if self.detail_days > 0:
+                    old = [r[0] for r in self.db.execute(
+                        "SELECT id FROM runs WHERE detailed = 1 AND ts < ?", (now - self.detail_days * DAY_S,))]
+                    for run_id in old:
+                        out["entries_deleted"] += self.db.execute(
+                            "DELETE FROM entries WHERE run_id = ? AND in_top = 0", (run_id,)).rowcount
+                        self.db.execute("UPDATE runs SET detailed = 0 WHERE id = ?", (run_id,))
+                    out["runs_compacted"] = len(old)
+            if out["entries_deleted"]:
+                self.db.execute("PRAGMA incremental_vacuum")
+        METRICS.inc("history_entries_compacted", out["entries_deleted"])
+        return out
+
+    # ── Vaicājumi ─────────────────────────────────────────────────────────────
+
+    def symbol_history(self, symbol: str, timeframe: Optional[str] = None, since: Optional[float] = None,
+                       until: Optional[float] = None) -> List[Dict]:
+        """Simbola rindas laika logā (indekss entries(symbol, ts)), hronoloģiski."""
+        sql = ("SELECT ts, timeframe, rank, in_top, reason, " + ", ".join(VALUE_FIELDS) +
+               " FROM entries WHERE symbol = ? AND ts >= ? AND ts <= ?")
+        args: list = [symbol.upper(), int(since or 0), int(until if until is not None else 2**62)]
+        if timeframe:
+            sql += " AND timeframe = ?"
+            args.append(timeframe)
+        cur = self.db.execute(sql + " ORDER BY ts", args)
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, r)) for r in cur]
+
+    def top_streak(self, symbol: str, timeframe: str) -> Tuple[int, Optional[int]]:
+        """(pēc kārtas skrējienu skaits Top-N līdz pēdējam, pirmā tāda skrējiena ts)."""
+        symbol = symbol.upper()
+        n, first = 0, None
+        for ts, top in self.db.execute("SELECT ts, top FROM runs WHERE timeframe = ? ORDER BY ts DESC, id DESC",
+                                       (timeframe,)):
+            if symbol not in (it["symbol"] for it in json.loads(top)):
+                break
+            n, first = n + 1, ts
+        return n, first
+
+def _fmt_ts(ts: Optional[int]) -> str:
+    return "-" if ts is None else datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+def _parse_day(value: Optional[str]) -> Optional[float]:
+    return None if not value else datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+def main(argv=None):
+    from .config import load_settings
+
+    cfg = load_settings(require_telegram=False)
+    ap = argparse.ArgumentParser(description="Skrējienu vēstures vaicājumi")
+    ap.add_argument("symbol", nargs="?", help="simbols, piem. ETH")
+    ap.add_argument("--db", default=cfg.HISTORY_DB or "run_history.sqlite")
+    ap.add_argument("--tf", default=cfg.TIMEFRAME)
+    ap.add_argument("--profile", default="", help="profila nosaukums (PROFILES_FILE)")
+    ap.add_argument("--since", default=None, help="YYYY-MM-DD (UTC)")
+    ap.add_argument("--until", default=None, help="YYYY-MM-DD (UTC)")
+    ap.add_argument("--compact", action="store_true", help="piemērot kompaktēšanas politiku tagad")
+    args = ap.parse_args(argv)
+
+    h = RunHistory(args.db, cfg.HISTORY_DETAIL_DAYS, cfg.HISTORY_RETENTION_DAYS)
+    key = f"{args.profile}:{args.tf}" if args.profile else args.tf
+    if args.compact:
+        print(h.compact())
+    if args.symbol:
+        for r in h.symbol_history(args.symbol, key, _parse_day(args.since), _parse_day(args.until)):
+            where = f"#{r['rank']}" + (" TOP" if r["in_top"] else "") if r["rank"] else f"skip: {r['reason']}"
+            score = f" score={r['score']:.2f} rsi={r['rsi']:.1f} atr%={r['atrpct']:.2f}" if r["score"] is not None else ""
+            print(f"{_fmt_ts(r['ts'])}  {where}{score}")
+        n, first = h.top_streak(args.symbol, key)
+        print(f"{args.symbol.upper()} Top-N pēc kārtas: {n} skrējieni (kopš {_fmt_ts(first)})")
+    h.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Diskā glabāts HTTP atbilžu kešs lēni mainīgiem references datiem.
+
+Katrs ieraksts ir JSON fails (atslēgas sha1): ķermenis, saglabāšanas laiks,
+ETag / Last-Modified. Svaigs ieraksts (vecums < TTL) tiek atgriezts bez tīkla,
+novecojis — pārbaudīts ar If-None-Match / If-Modified-Since (304 = derīgs).
+Kopējais izmērs ierobežots ar LRU pēc faila mtime (atjauno katrā trāpījumā).
+Direktoriju var dalīt vairāki procesi (--shard): ieraksts, ko cits process tikko
+izmetis, ir vienkārši garām, un katrs raksta caur savu pagaidu failu.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+class HttpCache:
+    def __init__(self, root: str, max_bytes: int = 50 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, params: Optional[dict] = None) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+        return f"{url}?{query}"
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        p = self.path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != key:
+            return None
+        try:
+            os.utime(p)  # LRU
+        except FileNotFoundError:
+            return None  # izmests starp nolasīšanu un utime (cits pavediens / process)
+        return entry
+
+    def age(self, entry: Dict) -> float:
+        return time.time() - entry.get("stored_at", 0)
+
+    def put(self, key: str, body, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict:
+        entry = {"key": key, "stored_at": time.time(), "etag": etag, "last_modified": last_modified, "body": body}
+        p = self.path(key)
+        with self._lock:
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(entry, f, separators=(",", ":"))
+                os.replace(tmp, p)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self._evict()
+        return entry
+
+    def refresh(self, key: str, entry: Dict) -> Dict:
+        """304: ieraksts joprojām derīgs, TTL sākas no jauna."""
+        return self.put(key, entry["body"], entry.get("etag"), entry.get("last_modified"))
+
+    def _evict(self) -> None:
+        files: List[tuple] = []
+        total = 0
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue  # cits process jau izmetis
+            files.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def load_json(self, name: str, ttl_s: float) -> Optional[Dict]:
+        """Mazs atvasināts artefakts (piem. symbol->product karte), ja nav vecāks par `ttl_s`."""
+        entry = self.get(f"artifact:{name}")
+        if entry is None or self.age(entry) >= ttl_s:
+            return None
+        return entry["body"]
+
+    def save_json(self, name: str, body) -> None:
+        self.put(f"artifact:{name}", body)
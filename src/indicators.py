@@ -1,10 +1,16 @@
+import json
+import os
+from collections import deque
+from typing import TYPE_CHECKING
 import numpy as np
-import pandas as pd
 
-def sma(series: pd.Series, period: int) -> pd.Series:
+if TYPE_CHECKING:  # pandas tikai references funkcijām zemāk, kodols strādā ar masīviem
+    import pandas as pd
+
+def sma(series: "pd.Series", period: int) -> "pd.Series":
     return series.rolling(window=period, min_periods=period).mean()
 
-def rsi(series: pd.Series, period: int = 14) -> pd.Series:
+def rsi(series: "pd.Series", period: int = 14) -> "pd.Series":
     delta = series.diff()
     up = delta.clip(lower=0)
     down = -delta.clip(upper=0)
@@ -14,14 +20,242 @@ def rsi(series: pd.Series, period: int = 14) -> pd.Series:
     rsi = 100 - (100 / (1 + rs))
     return rsi
 
-def atr(df: pd.DataFrame, period: int = 14) -> pd.Series:
+def atr(df: "pd.DataFrame", period: int = 14) -> "pd.Series":
     # df: columns [open, high, low, close]
+    import pandas as pd
+
     high_low = df["high"] - df["low"]
     high_close = (df["high"] - df["close"].shift()).abs()
     low_close = (df["low"] - df["close"].shift()).abs()
     tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
     return tr.ewm(alpha=1/period, adjust=False).mean()
 
-def atr_pct(df: pd.DataFrame, period: int = 14) -> pd.Series:
+def atr_pct(df: "pd.DataFrame", period: int = 14) -> "pd.Series":
     atr_val = atr(df, period=period)
     return (atr_val / df["close"]) * 100.0
+
+# ── Batch (simboli × laiks) ────────────────────────────────────────────────────
+# Matricas ir (N, T): katra rinda viens simbols, hronoloģiski, labajā pusē
+# izlīdzinātas (īsākām vēsturēm kreisā puse aizpildīta ar NaN).
+
+def stack_right_aligned(series_list) -> np.ndarray:
+    """Saliek 1-D masīvus (N, T) matricā; īsākās rindas papildina ar NaN kreisajā pusē."""
+    n = len(series_list)
+    t = max((len(s) for s in series_list), default=0)
+    out = np.full((n, t), np.nan)
+    for i, s in enumerate(series_list):
+        if len(s):
+            out[i, t - len(s):] = np.asarray(s, dtype=np.float64)
+    return out
+
+def wilder_ema_2d(x: np.ndarray, period: int) -> np.ndarray:
+    """ewm(alpha=1/period, adjust=False) pa rindām; sākas no pirmās ne-NaN vērtības."""
+    alpha = 1.0 / period
+    out = np.empty_like(x, dtype=np.float64)
+    state = np.full(x.shape[0], np.nan)
+    for j in range(x.shape[1]):
+        col = x[:, j]
+        valid = ~np.isnan(col)
+        seed = valid & np.isnan(state)
+        step = valid & ~seed
+        state[seed] = col[seed]
+        state[step] += alpha * (col[step] - state[step])
+        out[:, j] = state
+    return out
+
+def sma_2d(x: np.ndarray, period: int) -> np.ndarray:
+    """rolling(period, min_periods=period).mean() pa rindām."""
+    out = np.full_like(x, np.nan, dtype=np.float64)
+    if x.shape[1] < period:
+        return out
+    filled = np.nan_to_num(x)
+    csum = np.cumsum(filled, axis=1)
+    ccnt = np.cumsum(~np.isnan(x), axis=1)
+    win_sum = csum[:, period - 1:].copy()
+    win_sum[:, 1:] -= csum[:, :-period]
+    win_cnt = ccnt[:, period - 1:].copy()
+    win_cnt[:, 1:] -= ccnt[:, :-period]
+    out[:, period - 1:] = np.where(win_cnt == period, win_sum / period, np.nan)
+    return out
+
+def rsi_2d(close: np.ndarray, period: int = 14) -> np.ndarray:
+    delta = np.full_like(close, np.nan, dtype=np.float64)
+    delta[:, 1:] = np.diff(close, axis=1)
+    roll_up = wilder_ema_2d(np.where(np.isnan(delta), np.nan, np.clip(delta, 0, None)), period)
+    roll_down = wilder_ema_2d(np.where(np.isnan(delta), np.nan, -np.clip(delta, None, 0)), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = roll_up / np.where(roll_down == 0, np.nan, roll_down)
+        return 100 - (100 / (1 + rs))
+
+def atr_pct_2d(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    prev_close = np.full_like(close, np.nan, dtype=np.float64)
+    prev_close[:, 1:] = close[:, :-1]
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    return wilder_ema_2d(tr, period) / close * 100.0
+
+def last_values_2d(close: np.ndarray, high: np.ndarray, low: np.ndarray,
+                   ma_period: int, rsi_period: int = 14, atr_period: int = 14) -> dict:
+    """Visam universam vienā piegājienā: pēdējās close/prev_close/ma/rsi/atrpct vērtības (N,)."""
+    n, t = close.shape
+    if t == 0:
+        nan = np.full(n, np.nan)
+        return {"close": nan, "prev_close": nan, "ma": nan, "rsi": nan, "atrpct": nan}
+    if t >= ma_period:
+        ma = close[:, -ma_period:].mean(axis=1)  # NaN, ja logā ir polsterējums
+    else:
+        ma = np.full(n, np.nan)
+    return {
+        "close": close[:, -1],
+        "prev_close": close[:, -2] if t >= 2 else close[:, -1],
+        "ma": ma,
+        "rsi": rsi_2d(close, rsi_period)[:, -1],
+        "atrpct": atr_pct_2d(high, low, close, atr_period)[:, -1],
+    }
+
+# ── Straumēšanas stāvoklis (O(1) uz sveci) ─────────────────────────────────────
+
+class IndicatorState:
+    """
+    Inkrementāls SMA/RSI/ATR% stāvoklis vienam produktam un TF.
+    `update` pievieno vienu aizvērtu sveci par O(1); Wilder EMA tiek turpināta
+    no visas vēstures, nevis no 300 sveču loga. Rezultāti sakrīt ar `sma`,
+    `rsi`, `atr_pct` tai pašai sveču virknei.
+    """
+
+    def __init__(self, ma_period: int = 20, rsi_period: int = 14, atr_period: int = 14):
+        self.ma_period = ma_period
+        self.rsi_period = rsi_period
+        self.atr_period = atr_period
+        self.window = deque(maxlen=ma_period)
+        self.win_sum = 0.0
+        self.last_time = None
+        self.prev_close = None
+        self.before_close = None
+        self.avg_up = None
+        self.avg_down = None
+        self.atr = None
+        self.count = 0
+
+    def _next(self, high: float, low: float, close: float):
+        """Nākamais (avg_up, avg_down, atr), nemainot stāvokli."""
+        avg_up, avg_down, atr_v = self.avg_up, self.avg_down, self.atr
+        if self.prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+            delta = close - self.prev_close
+            up, down = max(delta, 0.0), max(-delta, 0.0)
+            if avg_up is None:
+                avg_up, avg_down = up, down
+            else:
+                avg_up += (up - avg_up) / self.rsi_period
+                avg_down += (down - avg_down) / self.rsi_period
+        atr_v = tr if atr_v is None else atr_v + (tr - atr_v) / self.atr_period
+        return avg_up, avg_down, atr_v
+
+    def update(self, candle) -> bool:
+        """candle: (time, low, high, open, close, volume). Atgriež False, ja jau iekļauta."""
+        t, low, high, _, close = (float(x) for x in candle[:5])
+        if self.last_time is not None and t <= self.last_time:
+            return False
+        self.avg_up, self.avg_down, self.atr = self._next(high, low, close)
+        if len(self.window) == self.ma_period:
+            self.win_sum -= self.window[0]
+        self.window.append(close)
+        self.win_sum += close
+        self.before_close, self.prev_close = self.prev_close, close
+        self.last_time = t
+        self.count += 1
+        return True
+
+    def values(self, pending=None) -> dict:
+        """
+        Pašreizējās vērtības {close, prev_close, ma, rsi, atrpct}. `pending` ir
+        vēl neaizvērta svece, kuru ieskaita rezultātā, bet ne stāvoklī.
+        """
+        avg_up, avg_down, atr_v = self.avg_up, self.avg_down, self.atr
+        close, prev_close = self.prev_close, self.before_close
+        win_sum, win_len = self.win_sum, len(self.window)
+        if pending is not None:
+            _, low, high, _, pclose = (float(x) for x in pending[:5])
+            avg_up, avg_down, atr_v = self._next(high, low, pclose)
+            prev_close, close = close, pclose
+            if win_len == self.ma_period:
+                win_sum -= self.window[0]
+            else:
+                win_len += 1
+            win_sum += pclose
+        if close is None:
+            return {"close": np.nan, "prev_close": np.nan, "ma": np.nan, "rsi": np.nan, "atrpct": np.nan}
+        rsi_v = np.nan if avg_up is None or not avg_down else 100 - (100 / (1 + avg_up / avg_down))
+        return {
+            "close": close,
+            "prev_close": prev_close if prev_close is not None else close,
+            "ma": win_sum / self.ma_period if win_len == self.ma_period else np.nan,
+            "rsi": rsi_v,
+            "atrpct": atr_v / close * 100.0 if atr_v is not None else np.nan,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "periods": [self.ma_period, self.rsi_period, self.atr_period],
+            "window": list(self.window), "last_time": self.last_time,
+            "prev_close": self.prev_close, "before_close": self.before_close,
+            "avg_up": self.avg_up, "avg_down": self.avg_down, "atr": self.atr, "count": self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "IndicatorState":
+        st = cls(*d["periods"])
+        st.window.extend(d["window"])
+        st.win_sum = float(sum(st.window))
+        st.last_time, st.prev_close, st.before_close = d["last_time"], d["prev_close"], d.get("before_close")
+        st.avg_up, st.avg_down, st.atr = d["avg_up"], d["avg_down"], d["atr"]
+        st.count = d.get("count", 0)
+        return st
+
+class IndicatorBook:
+    """
+    IndicatorState krājums pēc (product_id, granularity, MA_PERIOD), glabāts JSON failā.
+    MA_PERIOD ir atslēgā, jo profili ar dažādu MA_PERIOD dala vienu failu un citādi
+    katrs skrējiens atiestatītu otra stāvokli.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.states = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                for k, v in raw.items():
+                    st = IndicatorState.from_dict(v)
+                    product_id, granularity_s = k.split(":")[:2]  # arī vecais "pid:gran" formāts
+                    self.states[self.key(product_id, int(granularity_s), st.ma_period)] = st
+            except Exception:
+                self.states = {}
+
+    @staticmethod
+    def key(product_id: str, granularity_s: int, ma_period: int) -> str:
+        return f"{product_id}:{granularity_s}:{ma_period}"
+
+    def get(self, product_id: str, granularity_s: int, ma_period: int) -> IndicatorState:
+        key = self.key(product_id, granularity_s, ma_period)
+        st = self.states.get(key)
+        if st is None:
+            st = self.states[key] = IndicatorState(ma_period)
+        return st
+
+    def reset(self, product_id: str, granularity_s: int, ma_period: int) -> IndicatorState:
+        st = self.states[self.key(product_id, granularity_s, ma_period)] = IndicatorState(ma_period)
+        return st
+
+    def save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({k: v.to_dict() for k, v in self.states.items()}, f)
+        os.replace(tmp, self.path)
+
+def indicator_state_path(state_file: str) -> str:
+    """Blakus rotatora state failam: last_top.json -> last_top.indicators.json"""
+    return os.path.splitext(state_file)[0] + ".indicators.json"
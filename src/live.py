@@ -0,0 +1,410 @@
+"""
+Live režīms: Coinbase websocket ticker plūsma -> lokālas sveces katram produktam
+-> tie paši sliekšņi un punkti kā filter_and_rank, bet tikai mainītajiem produktiem.
+Kad mainās Top-N sastāvs (NEW/KEEP/DROP kā diff_labels), tiek sūtīta ziņa.
+
+    python -m src.live                                    # Coinbase websocket (vajag `websockets`)
+    python -m src.live --record feed.jsonl.gz             # + saglabā saņemtās ziņas
+    python -m src.live --replay feed.jsonl.gz --dry-run   # tas pats bez tīkla
+    python -m src.live --synthetic 200 --dry-run          # sintētisks universs un plūsma
+
+Indikatori ir IndicatorState (O(1) uz aizvērtu sveci), sākumā piepildīti ar REST
+vēsturi; veidojošā svece tiek ieskaitīta tikai rezultātā. Sveču laiks ir ziņu laiks,
+tāpēc atskaņošana ir deterministiska.
+"""
+import argparse
+import gzip
+import heapq
+import json
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .candles import Candles
+from .indicators import IndicatorState
+from .metrics import METRICS
+from .strategy_rotator import (STABLES, make_candidate, diff_labels, load_prev_top, save_top, compute_entry_sl_tp,
+                               prefetch_ohlcv)
+
+WS_URL = "wss://ws-feed.exchange.coinbase.com"
+TRADE_TYPES = ("ticker", "match", "last_match")
+
+def parse_time(value: str) -> float:
+    """"2025-10-09T09:45:01.123456Z" -> unix sekundes."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+def format_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+# ── Plūsmas (katra dod neapstrādātas JSON rindas) ──────────────────────────────
+
+class CoinbaseFeed:
+    """Coinbase Exchange websocket `ticker` kanāls; pārtraukuma gadījumā pieslēdzas no jauna."""
+
+    def __init__(self, product_ids: List[str], url: str = WS_URL, channels=("ticker",)):
+        self.product_ids = list(product_ids)
+        self.url = url
+        self.channels = list(channels)
+
+    def __iter__(self) -> Iterator[str]:
+        from websockets.sync.client import connect  # izvēles atkarība, vajag tikai live režīmam
+
+        backoff = 1.0
+        while True:
+            try:
+                with connect(self.url, max_size=2 ** 22, open_timeout=30) as ws:
+                    ws.send(json.dumps({"type": "subscribe", "product_ids": self.product_ids,
+                                        "channels": self.channels}))
+                    print(f"[live] subscribed {len(self.product_ids)} products on {self.url}")
+                    backoff = 1.0
+                    for raw in ws:
+                        yield raw
+            except Exception as e:
+                METRICS.inc("live_reconnects")
+                print(f"[live] websocket error: {e!r}; reconnect in {backoff:.0f}s")
+                time.sleep(backoff)
+                backoff = min(30.0, backoff * 2)
+
+class ReplayFeed:
+    """Ierakstītas ziņas no JSONL (.gz); `speed` > 0 atskaņo reālā laika tempā (x speed), 0 = cik ātri var."""
+
+    def __init__(self, path: str, speed: float = 0.0):
+        self.path = path
+        self.speed = speed
+
+    def __iter__(self) -> Iterator[str]:
+        opener = gzip.open if self.path.endswith(".gz") else open
+        t0_event = t0_wall = None
+        with opener(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if self.speed > 0 and '"time"' in line:
+                    t = parse_time(json.loads(line)["time"])
+                    if t0_event is None:
+                        t0_event, t0_wall = t, time.monotonic()
+                    delay = (t - t0_event) / self.speed - (time.monotonic() - t0_wall)
+                    if delay > 0:
+                        time.sleep(delay)
+                yield line
+
+class SyntheticFeed:
+    """
+    Deterministiska ticker plūsma (nejaušā pastaiga) offline testiem un slodzei:
+    `rate` ziņas sekundē ziņu laikā, `seconds` ilgumā no `start`.
+    """
+
+    def __init__(self, prices: Dict[str, float], open_24h: Dict[str, float], start: float,
+                 seconds: float = 3600, rate: float = 2000, seed: int = 0):
+        self.prices, self.open_24h = dict(prices), open_24h
+        self.start, self.seconds, self.rate, self.seed = start, seconds, rate, seed
+
+    def __iter__(self) -> Iterator[str]:
+        rng = np.random.default_rng(self.seed)
+        pids = list(self.prices)
+        price = np.array([self.prices[p] for p in pids])
+        drift = rng.normal(0.0, 2e-5, len(pids))  # daži produkti stundas laikā kāpj, citi krīt
+        n = int(self.seconds * self.rate)
+        chunk = 10000
+        volume = {p: 0.0 for p in pids}
+        for s in range(0, n, chunk):
+            m = min(chunk, n - s)
+            which = rng.integers(0, len(pids), m)
+            steps = rng.normal(0.0, 4e-4, m)
+            sizes = rng.exponential(1.0, m)
+            times = self.start + (s + np.arange(m)) / self.rate
+            for j in range(m):
+                i = which[j]
+                price[i] *= 1.0 + drift[i] + steps[j]
+                pid = pids[i]
+                volume[pid] += sizes[j]
+                yield (f'{{"type":"ticker","product_id":"{pid}","price":"{price[i]:.8g}",'
+                       f'"last_size":"{sizes[j]:.6f}","open_24h":"{self.open_24h[pid]:.8g}",'
+                       f'"volume_24h":"{volume[pid]:.4f}","time":"{format_time(times[j])}"}}')
+
+def record(feed: Iterable[str], path: str) -> Iterator[str]:
+    """Laiž plūsmu cauri, katru ziņu pierakstot JSONL.gz (ReplayFeed formāts)."""
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for raw in feed:
+            f.write(raw.strip() + "\n")
+            yield raw
+
+# ── Lokālās sveces un rangošana ───────────────────────────────────────────────
+
+class LiveProduct:
+    __slots__ = ("symbol", "name", "product_id", "volume_usd", "pct", "gran", "state", "forming", "history")
+
+    def __init__(self, symbol: str, name: str, product_id: str, volume_usd: float, pct: float,
+                 gran: int, ma_period: int, history: int = 300):
+        self.symbol, self.name, self.product_id = symbol, name, product_id
+        self.volume_usd, self.pct = volume_usd, pct
+        self.gran = gran
+        self.state = IndicatorState(ma_period)
+        self.forming: Optional[list] = None  # [time, low, high, open, close, volume]
+        self.history: deque = deque(maxlen=history)
+
+    def seed(self, candles: Candles, now: float) -> None:
+        """REST vēsture: aizvērtās sveces stāvoklī, pēdējā neaizvērtā kļūst par veidojošo."""
+        for row in candles.rows():
+            row = [float(x) for x in row]
+            if row[0] + self.gran <= now:
+                self.state.update(row)
+                self.history.append(row)
+            else:
+                self.forming = row
+
+    def on_trade(self, t: float, price: float, size: float) -> None:
+        bucket = t - t % self.gran
+        f = self.forming
+        if f is None or bucket > f[0]:
+            if f is not None:
+                self.state.update(f)
+                self.history.append(f)
+            self.forming = [bucket, price, price, price, price, size]
+        elif bucket == f[0]:
+            if price < f[1]:
+                f[1] = price
+            if price > f[2]:
+                f[2] = price
+            f[4] = price
+            f[5] += size
+        # vēlāks ieraksts par jau aizvērtu sveci — ignorē
+
+    def candle_count(self) -> int:
+        return len(self.history) + (self.forming is not None)
+
+    def candles(self) -> Candles:
+        rows = list(self.history) + ([self.forming] if self.forming is not None else [])
+        return Candles.from_rows(rows)
+
+class LiveRanker:
+    """
+    Uztur Top-N no plūsmas: ziņa atjaunina tikai sava produkta sveci un atzīmē to
+    kā mainītu; ik pēc `eval_interval_s` (ziņu laikā) pārrēķina tikai mainītos.
+    `on_change(top, labels, prev_ranks)` izsauc, kad mainās Top-N sastāvs.
+    """
+
+    def __init__(self, products: Dict[str, LiveProduct], thresholds: Dict, top_n: int,
+                 atr_score_cap: Optional[float], on_change: Callable, prev_syms: Optional[List[str]] = None,
+                 prev_ranks: Optional[Dict[str, int]] = None, eval_interval_s: float = 1.0,
+                 notify_min_interval_s: float = 60.0):
+        self.products = products
+        self.eff = thresholds
+        self.top_n = top_n
+        self.atr_score_cap = atr_score_cap
+        self.on_change = on_change
+        self.eval_interval_s = eval_interval_s
+        self.notify_min_interval_s = notify_min_interval_s
+        self.order = {pid: i for i, pid in enumerate(products)}  # tie-break: kapitalizācijas secība
+        self.candidates: Dict[str, Dict] = {}
+        self.dirty = set(products)
+        self.top_syms: List[str] = list(prev_syms or [])
+        self.prev_ranks: Dict[str, int] = dict(prev_ranks or {})
+        self.clock = 0.0
+        self.last_eval = float("-inf")
+        self.last_notify = float("-inf")
+        self.stats = {"messages": 0, "trades": 0, "evaluations": 0, "evaluated_products": 0, "notifications": 0}
+
+    def on_message(self, raw: str) -> None:
+        self.stats["messages"] += 1
+        msg = json.loads(raw)
+        if msg.get("type") not in TRADE_TYPES:
+            return
+        p = self.products.get(msg.get("product_id"))
+        if p is None or "price" not in msg or "time" not in msg:
+            return
+        t = parse_time(msg["time"])
+        price = float(msg["price"])
+        p.on_trade(t, price, float(msg.get("last_size") or msg.get("size") or 0.0))
+        open_24h = msg.get("open_24h")
+        if open_24h:
+            p.pct = (price / float(open_24h) - 1.0) * 100.0
+        self.stats["trades"] += 1
+        self.dirty.add(p.product_id)
+        if t > self.clock:
+            self.clock = t
+        if self.clock - self.last_eval >= self.eval_interval_s:
+            self.evaluate()
+
+    def _candidate(self, p: LiveProduct) -> Optional[Dict]:
+        eff = self.eff
+        if p.symbol in STABLES or p.volume_usd < eff["MIN_24H_VOLUME_USD"] or p.pct < eff["MIN_24H_PCT"]:
+            return None
+        if p.candle_count() < max(eff["MA_PERIOD"], 50):
+            return None
+        last = {k: float(v) for k, v in p.state.values(p.forming).items()}
+        cand, _ = make_candidate(p.symbol, p.name, p.product_id, p.volume_usd, p.pct, last,
+                                 eff["RSI_THRESHOLD"], eff["ATR_PCT_MIN"], self.atr_score_cap)
+        return cand
+
+    def ranked(self, n: Optional[int] = None) -> List[Dict]:
+        best = heapq.nsmallest(self.top_n if n is None else n, self.candidates.items(),
+                               key=lambda kv: (-kv[1]["score"], self.order[kv[0]]))
+        return [c for _, c in best]
+
+    def evaluate(self, force_notify: bool = False) -> None:
+        self.last_eval = self.clock
+        self.stats["evaluations"] += 1
+        self.stats["evaluated_products"] += len(self.dirty)
+        for pid in self.dirty:
+            cand = self._candidate(self.products[pid])
+            if cand is None:
+                self.candidates.pop(pid, None)
+            else:
+                self.candidates[pid] = cand
+        self.dirty.clear()
+        top = self.ranked()
+        syms = [r["symbol"] for r in top]
+        if set(syms) == set(self.top_syms) and not force_notify:
+            return
+        if not force_notify and self.clock - self.last_notify < self.notify_min_interval_s:
+            return  # sastāvs vēl var mainīties atpakaļ; pārbaudīs nākamajā novērtējumā
+        labels = diff_labels(syms, self.top_syms)
+        self.on_change(top, labels, self.prev_ranks)
+        self.stats["notifications"] += 1
+        self.last_notify = self.clock
+        self.top_syms = syms
+        self.prev_ranks = {s: i + 1 for i, s in enumerate(syms)}
+
+# ── Palaišana ─────────────────────────────────────────────────────────────────
+
+def build_products(markets, symbol_to_product, gran: int, ma_period: int) -> Dict[str, LiveProduct]:
+    """Visi tirgi ar Coinbase USD pāri (lētie filtri tiek pārbaudīti katrā novērtējumā ar live pct)."""
+    products: Dict[str, LiveProduct] = {}
+    for m in markets:
+        sym = m.get("symbol", "").upper()
+        pid = symbol_to_product.get(sym)
+        if not pid or pid in products:
+            continue
+        pct = m.get("price_change_percentage_24h")
+        if pct is None:
+            pct = m.get("price_change_percentage_24h_in_currency", 0.0)
+        products[pid] = LiveProduct(sym, m.get("name", sym), pid, float(m.get("total_volume", 0.0)),
+                                    float(pct or 0.0), gran, ma_period)
+    return products
+
+def run_live(cfg, feed_factory: Callable[[List[str], Dict[str, LiveProduct]], Iterable[str]],
+             dry_run: bool = False, record_path: Optional[str] = None, now: Optional[float] = None) -> Dict:
+    """`now` — pulkstenis REST vēstures sēšanai (sintētiskam universam); citādi time.time()."""
+    from .config import resolve_thresholds
+    from .data_sources import get_symbol_to_product, timeframe_to_granularity_seconds, close_client
+    from .formatter import build_message_lv
+    from .notifier import send_telegram_message
+    from .pipeline import make_http_cache, make_market_feed, make_candle_cache, make_history
+    import pytz
+
+    tf = cfg.TIMEFRAME
+    gran = timeframe_to_granularity_seconds(tf)
+    eff = resolve_thresholds(cfg, tf)
+    http_cache = make_http_cache(cfg)
+    markets = make_market_feed(cfg, http_cache)
+    symbol_to_product = get_symbol_to_product(cfg.COINBASE_BASE, http_cache, cfg.PRODUCTS_TTL_S)
+    products = build_products(markets, symbol_to_product, gran, eff["MA_PERIOD"])
+
+    # REST vēsture (tas pats CandleCache / krātuve kā main)
+    candles = make_candle_cache(cfg, [tf])
+    seed_frames = prefetch_ohlcv(candles, list(products), gran, 300, cfg.FETCH_CONCURRENCY)
+    now = time.time() if now is None else now
+    for pid, c in seed_frames.items():
+        if c is not None:
+            products[pid].seed(c, now)
+    print(f"[live] TF={tf}; {len(products)} products seeded; thresholds {eff}")
+    history = make_history(cfg)
+
+    def on_change(top, labels, prev_ranks):
+        if cfg.ADVICE_ENABLED:
+            for r in top:
+                p = products[r["product_id"]]
+                if p.candle_count() > 50:
+                    r["advice"] = compute_entry_sl_tp(r, p.candles())
+        if history is not None:
+            history.append(tf, top, cfg.TOP_N, ranker.ranked(len(ranker.candidates)), ts=ranker.clock)
+        else:
+            save_top(cfg.STATE_FILE, top)
+        text = build_message_lv(now_riga=datetime.now(pytz.timezone("Europe/Riga")), timeframe=tf, top_rows=top,
+                                labels=labels, short_format=cfg.SHORT_FORMAT, include_advice=cfg.ADVICE_ENABLED,
+                                detail_emoji=cfg.DETAIL_EMOJI, long_format=cfg.LONG_FORMAT, prev_ranks=prev_ranks)
+        changes = {k: v for k, v in labels.items() if v != "KEEP"}
+        print(f"[live] {format_time(ranker.clock)} top changed: {changes}")
+        if dry_run:
+            print(text)
+        else:
+            send_telegram_message(cfg.TELEGRAM_BOT_TOKEN, cfg.TELEGRAM_CHAT_IDS, text,
+                                  max_workers=cfg.TELEGRAM_CONCURRENCY)
+
+    if history is not None:
+        prev_syms, prev_ranks = history.prev_top(tf, legacy_state_file=cfg.STATE_FILE)
+    else:
+        prev_syms, prev_ranks = load_prev_top(cfg.STATE_FILE)
+    ranker = LiveRanker(products, eff, cfg.TOP_N, cfg.ATR_SCORE_CAP, on_change, prev_syms, prev_ranks,
+                        eval_interval_s=cfg.LIVE_EVAL_S, notify_min_interval_s=cfg.LIVE_NOTIFY_MIN_S)
+    ranker.clock = now
+    ranker.evaluate()
+
+    feed = feed_factory(list(products), products)
+    if record_path:
+        feed = record(feed, record_path)
+    t0 = time.perf_counter()
+    try:
+        for raw in feed:
+            ranker.on_message(raw)
+    except KeyboardInterrupt:
+        print("[live] stopping")
+    finally:
+        close_client()
+    ranker.evaluate()
+    if history is not None:
+        history.close()
+    dt = time.perf_counter() - t0
+    stats = dict(ranker.stats, seconds=round(dt, 3),
+                 messages_per_s=round(ranker.stats["messages"] / dt, 1) if dt > 0 else None)
+    for k, v in stats.items():
+        if isinstance(v, (int, float)):
+            METRICS.inc(f"live_{k}", v)
+    if cfg.METRICS_DIR:
+        METRICS.write(cfg.METRICS_DIR)
+    print(f"[live] {stats}")
+    return stats
+
+def main(argv=None):
+    from .config import load_settings
+    from .data_sources import set_transport
+    from .ratelimit import LIMITER
+
+    ap = argparse.ArgumentParser(description="Relative Strength Rotator live mode")
+    ap.add_argument("--replay", default=None, help="JSONL(.gz) ar ierakstītām websocket ziņām")
+    ap.add_argument("--speed", type=float, default=0.0, help="atskaņošanas temps (0 = cik ātri var)")
+    ap.add_argument("--record", default=None, help="saglabāt saņemtās ziņas JSONL.gz")
+    ap.add_argument("--synthetic", type=int, default=0, help="sintētisks universs (REST + plūsma) ar N simboliem")
+    ap.add_argument("--seconds", type=float, default=3600, help="sintētiskās plūsmas ilgums (ziņu laikā)")
+    ap.add_argument("--rate", type=float, default=2000, help="sintētiskās plūsmas ziņas sekundē")
+    ap.add_argument("--dry-run", action="store_true", help="ziņas drukāt, nevis sūtīt uz Telegram")
+    args = ap.parse_args(argv)
+    cfg = load_settings(require_telegram=not args.dry_run)
+
+    start = None  # īsta plūsma un atskaņošana: time.time()
+    if args.synthetic:
+        from .replay import SyntheticTransport
+
+        synth = SyntheticTransport(args.synthetic)
+        set_transport(synth)
+        LIMITER.enabled = False
+        start = synth.now
+        pct = {f"C{i}-USD": m["price_change_percentage_24h"] for i, m in enumerate(synth.markets)}
+
+        def factory(pids, products):
+            prices = {pid: products[pid].forming[4] if products[pid].forming else 100.0 for pid in pids}
+            open_24h = {pid: prices[pid] / (1 + pct[pid] / 100.0) for pid in pids}
+            return SyntheticFeed(prices, open_24h, start, args.seconds, args.rate)
+    elif args.replay:
+        factory = lambda pids, products: ReplayFeed(args.replay, args.speed)
+    else:
+        factory = lambda pids, products: CoinbaseFeed(pids)
+    run_live(cfg, factory, dry_run=args.dry_run, record_path=args.record, now=start)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Skrējiena metrikas: posmu laiki, katrs HTTP pieprasījums (endpoint, statuss,
+latentums, baiti, mēģinājums), indikatoru laiks un skip iemesli.
+Pēc skrējiena -> JSON atskaite un Prometheus textfile.
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def endpoint_label(url: str) -> str:
+    """https://api.exchange.coinbase.com/products/ETH-USD/candles -> api.exchange.coinbase.com/products/{id}/candles"""
+    u = urlsplit(str(url))
+    path = re.sub(r"/products/[^/]+/candles", "/products/{id}/candles", u.path)
+    path = re.sub(r"/bot[^/]+/", "/bot{token}/", path)
+    return f"{u.hostname}{path}"
+
+def skip_category(reason: str) -> str:
+    """"indicators fail {...}" -> "indicators fail"."""
+    return reason.split(" {", 1)[0]
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    v = sorted(values)
+    k = (len(v) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(v) - 1)
+    return v[lo] + (v[hi] - v[lo]) * (k - lo)
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hooks: List = []  # objekti ar enter(stage) / exit(stage), piem. src/profiler.py
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self.stages: Dict[str, float] = {}
+            self.requests: List[Dict] = []
+            self.counters: Dict[str, float] = {}
+            self.observations: Dict[str, List[float]] = {}
+            self.skips: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        for h in self.hooks:
+            h.enter(name)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + dt
+            for h in self.hooks:
+                h.exit(name)
+
+    def add_stage_time(self, name: str, seconds: float) -> None:
+        """Posma laiks, kas mērīts fona pavedienos (bez `stage` konteksta un `hooks`)."""
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record_http(self, url: str, status: Optional[int], latency_s: float, nbytes: int, attempt: int = 1,
+                    error: Optional[str] = None) -> None:
+        with self._lock:
+            self.requests.append({"endpoint": endpoint_label(url), "status": status, "latency_s": round(latency_s, 6),
+                                  "bytes": nbytes, "attempt": attempt, "error": error})
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0.0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self.observations.setdefault(name, []).append(value)
+
+    def count_skips(self, skipped: List[Dict]) -> None:
+        with self._lock:
+            for s in skipped:
+                cat = skip_category(s.get("reason", "?"))
+                self.skips[cat] = self.skips.get(cat, 0) + 1
+
+    # ── Eksports ──────────────────────────────────────────────────────────────
+
+    def _http_summary(self) -> Dict[str, Dict]:
+        out: Dict[str, Dict] = {}
+        for r in self.requests:
+            e = out.setdefault(r["endpoint"], {"count": 0, "status": {}, "retries": 0, "bytes": 0, "_lat": []})
+            e["count"] += 1
+            e["status"][str(r["status"])] = e["status"].get(str(r["status"]), 0) + 1
+            e["retries"] += 1 if r["attempt"] > 1 else 0
+            e["bytes"] += r["bytes"]
+            e["_lat"].append(r["latency_s"])
+        for e in out.values():
+            lat = e.pop("_lat")
+            e["latency_s"] = {"p50": percentile(lat, 0.5), "p95": percentile(lat, 0.95),
+                              "p99": percentile(lat, 0.99), "max": max(lat)}
+        return out
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "duration_s": round(time.time() - self.started, 3),
+                "stages_s": {k: round(v, 6) for k, v in self.stages.items()},
+                "http": self._http_summary(),
+                "counters": dict(self.counters),
+                "observations": {k: {"count": len(v), "sum": sum(v), "p50": percentile(v, 0.5),
+                                     "p95": percentile(v, 0.95), "max": max(v)} for k, v in self.observations.items()},
+                "skips": dict(self.skips),
+                "requests": list(self.requests),
+            }
+
+    def prometheus(self) -> str:
+        rep = self.report()
+        esc = lambda s: str(s).replace("\\", "\\\\").replace('"', '\\"')
+        lines = ["# TYPE rotator_stage_seconds gauge"]
+        lines += [f'rotator_stage_seconds{{stage="{esc(k)}"}} {v}' for k, v in rep["stages_s"].items()]
+        lines.append("# TYPE rotator_http_requests_total counter")
+        for ep, e in rep["http"].items():
+            for st, n in e["status"].items():
+                lines.append(f'rotator_http_requests_total{{endpoint="{esc(ep)}",status="{esc(st)}"}} {n}')
+        lines.append("# TYPE rotator_http_retries_total counter")
+        lines += [f'rotator_http_retries_total{{endpoint="{esc(ep)}"}} {e["retries"]}' for ep, e in rep["http"].items()]
+        lines.append("# TYPE rotator_http_response_bytes_total counter")
+        lines += [f'rotator_http_response_bytes_total{{endpoint="{esc(ep)}"}} {e["bytes"]}' for ep, e in rep["http"].items()]
+        lines.append("# TYPE rotator_http_request_duration_seconds histogram")
+        by_ep: Dict[str, List[float]] = {}
+        for r in rep["requests"]:
+            by_ep.setdefault(r["endpoint"], []).append(r["latency_s"])
+        for ep, lat in by_ep.items():
+            for b in LATENCY_BUCKETS:
+                lines.append(f'rotator_http_request_duration_seconds_bucket{{endpoint="{esc(ep)}",le="{b}"}} {sum(x <= b for x in lat)}')
+            lines.append(f'rotator_http_request_duration_seconds_bucket{{endpoint="{esc(ep)}",le="+Inf"}} {len(lat)}')
+            lines.append(f'rotator_http_request_duration_seconds_sum{{endpoint="{esc(ep)}"}} {sum(lat)}')
+            lines.append(f'rotator_http_request_duration_seconds_count{{endpoint="{esc(ep)}"}} {len(lat)}')
+        lines.append("# TYPE rotator_skipped_total counter")
+        lines += [f'rotator_skipped_total{{reason="{esc(k)}"}} {v}' for k, v in rep["skips"].items()]
+        for name, v in rep["counters"].items():
+            lines.append(f"# TYPE rotator_{name} gauge")
+            lines.append(f"rotator_{name} {v}")
+        for name, o in rep["observations"].items():
+            lines.append(f"# TYPE rotator_{name} summary")
+            lines.append(f'rotator_{name}{{quantile="0.5"}} {o["p50"]}')
+            lines.append(f'rotator_{name}{{quantile="0.95"}} {o["p95"]}')
+            lines.append(f"rotator_{name}_sum {o['sum']}")
+            lines.append(f"rotator_{name}_count {o['count']}")
+        lines.append("# TYPE rotator_run_duration_seconds gauge")
+        lines.append(f"rotator_run_duration_seconds {rep['duration_s']}")
+        lines.append("# TYPE rotator_last_run_timestamp_seconds gauge")
+        lines.append(f"rotator_last_run_timestamp_seconds {int(rep['started'])}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str) -> None:
+        """metrics/run_report.json + metrics/rotator.prom (atomiski, textfile collector drošs)."""
+        os.makedirs(directory, exist_ok=True)
+        for name, content in (("run_report.json", json.dumps(self.report(), indent=2)), ("rotator.prom", self.prometheus())):
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+
+METRICS = Metrics()
@@ -1,42 +1,121 @@
 # src/notifier.py
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import threading
 import time
 import httpx
-import json
+
+from .data_sources import get_transport
+from .metrics import METRICS
+from .ratelimit import LIMITER, TokenBucket, parse_retry_after
 
 API_BASE = "https://api.telegram.org"
 
-def send_telegram_message(token: str, chat_ids: List[str], text: str):
+# Telegram: ~30 ziņas/s globāli (LIMITER, api.telegram.org), ~1 ziņa/s vienā čatā
+PER_CHAT_LIMIT: Tuple[float, float] = (1.0, 1.0)
+MAX_ATTEMPTS = 4
+BACKOFF_MAX_S = 8.0
+# Atkārto tikai tad, ja ziņa droši nav nosūtīta: savienojums neizveidojās.
+# ReadTimeout u.c. — Telegram to varēja jau piegādāt, atkārtojums dubultotu ziņu.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+def _retryable_status(status: int) -> bool:
+    """429 un 5xx; 4xx (čats neeksistē, bots bloķēts) un 200 ar ok=false — neatkārto."""
+    return status == 429 or status >= 500
+
+class _ChatBuckets:
+    def __init__(self, limit: Tuple[float, float] = PER_CHAT_LIMIT):
+        self.limit = limit
+        self.buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def get(self, cid: str) -> TokenBucket:
+        with self._lock:
+            b = self.buckets.get(cid)
+            if b is None:
+                b = self.buckets[cid] = TokenBucket(*self.limit)
+            return b
+
+def _retry_after(resp: httpx.Response, payload: Dict) -> Optional[float]:
+    """429: `parameters.retry_after` ķermenī, citādi Retry-After galvene."""
+    params = payload.get("parameters") or {}
+    if params.get("retry_after") is not None:
+        return float(params["retry_after"])
+    return parse_retry_after(resp.headers.get("retry-after"))
+
+def _deliver(client: httpx.Client, url: str, cid: str, text: str, chat_bucket: TokenBucket) -> Dict:
+    """Viena čata piegāde ar atkārtojumiem; atgriež atskaites rindu."""
+    result = {"chat_id": cid, "ok": False, "status": None, "attempts": 0, "error": None}
+    t_start = time.perf_counter()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        result["attempts"] = attempt
+        chat_bucket.acquire()
+        LIMITER.acquire(API_BASE)
+        t0 = time.perf_counter()
+        wait = min(BACKOFF_MAX_S, 2.0 ** (attempt - 1))
+        try:
+            resp = client.post(url, data={"chat_id": cid, "text": text, "disable_web_page_preview": "true"})
+        except httpx.HTTPError as e:
+            METRICS.record_http(url, None, time.perf_counter() - t0, 0, attempt, error=type(e).__name__)
+            METRICS.inc("telegram_errors")
+            result["error"] = f"{type(e).__name__}: {e}"
+            if not isinstance(e, RETRYABLE_ERRORS):
+                break
+        else:
+            METRICS.record_http(resp.request.url, resp.status_code, time.perf_counter() - t0, len(resp.content), attempt)
+            try:
+                payload = resp.json()
+            except ValueError:
+                payload = {"raw": resp.text}
+            result["status"] = resp.status_code
+            if resp.status_code == 200 and payload.get("ok", False):
+                if LIMITER.enabled:
+                    LIMITER.bucket(API_BASE).recover()
+                result["ok"], result["error"] = True, None
+                break
+            result["error"] = payload.get("description") or str(payload)[:200]
+            if resp.status_code == 429:
+                # Var būt gan čata, gan globālais limits: čatu aptur uz retry_after, globālo tempu samazina
+                METRICS.inc("ratelimit_429")
+                if LIMITER.enabled:
+                    LIMITER.bucket(API_BASE).throttle()
+                ra = _retry_after(resp, payload)
+                if ra is not None:
+                    chat_bucket.block_for(ra)
+                    wait = 0.0
+            elif not _retryable_status(resp.status_code):
+                break
+        if attempt < MAX_ATTEMPTS and wait > 0:
+            time.sleep(wait)
+    result["latency_s"] = round(time.perf_counter() - t_start, 6)
+    return result
+
+def send_telegram_message(token: str, chat_ids: List[str], text: str, max_workers: int = 16) -> List[Dict]:
     """
-    Sūta ziņu ar tiešo Telegram HTTP API (bez async, droši GitHub Actions).
-    Ar vienkāršu throttling un kļūdu izdrukām.
+    Sūta ziņu ar tiešo Telegram HTTP API visiem čatiem paralēli (pavedieni).
+    Globālo tempu tur LIMITER (api.telegram.org), katram čatam savs spainis;
+    429 `retry_after` tiek ievērots; savienojuma kļūdas un 5xx atkārto ar backoff,
+    pārējo (arī ReadTimeout — ziņa varēja būt piegādāta) neatkārto.
+    Atgriež piegādes atskaiti pa čatiem.
     """
+    chat_ids = [c.strip() for c in chat_ids if c.strip()]
     if not chat_ids:
         print("[telegram] No chat IDs provided")
-        return
+        return []
 
-    with httpx.Client(timeout=30.0) as client:
-        for cid in chat_ids:
-            cid = cid.strip()
-            try:
-                resp = client.post(
-                    f"{API_BASE}/bot{token}/sendMessage",
-                    data={
-                        "chat_id": cid,
-                        "text": text,
-                        "disable_web_page_preview": "true",
-                    },
-                )
-                try:
-                    payload = resp.json()
-                except Exception:
-                    payload = {"raw": resp.text}
-
-                if resp.status_code != 200 or not payload.get("ok", False):
-                    print(f"[telegram] ERROR sending to {cid}: HTTP {resp.status_code} payload={payload}")
-                else:
-                    print(f"[telegram] sent to {cid}")
-            except Exception as e:
-                print(f"[telegram] Exception sending to {cid}: {e}")
-
-            time.sleep(1.0)  # vienkāršs throttling
+    url = f"{API_BASE}/bot{token}/sendMessage"
+    chats = _ChatBuckets()
+    workers = max(1, min(max_workers, len(chat_ids)))
+    limits = httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+    with httpx.Client(timeout=30.0, limits=limits, transport=get_transport()) as client:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            report = list(ex.map(lambda cid: _deliver(client, url, cid, text, chats.get(cid)), chat_ids))
+
+    for r in report:
+        if r["ok"]:
+            print(f"[telegram] sent to {r['chat_id']}" + (f" (attempt {r['attempts']})" if r["attempts"] > 1 else ""))
+        else:
+            print(f"[telegram] ERROR sending to {r['chat_id']}: HTTP {r['status']} {r['error']} (attempts {r['attempts']})")
+    METRICS.inc("telegram_sent", sum(r["ok"] for r in report))
+    METRICS.inc("telegram_failed", sum(not r["ok"] for r in report))
+    return report
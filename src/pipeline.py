@@ -0,0 +1,76 @@
+"""
+Cauruļvada sastāvdaļas no Settings: tirgu plūsma, sveču krātuve / avots / kešs,
+HTTP kešs un skrējienu vēsture. Kopīgas main.py (viens skrējiens, daļas, daemon)
+un src/live.py, lai abi režīmi ielādē datus vienādi.
+"""
+from typing import Dict, Optional, Tuple
+
+from .candle_sources import make_source
+from .candle_store import CandleStore, MemoryCandleStore
+from .config import universe_size
+from .data_sources import (iter_top_markets, iter_manual_markets, coingecko_ids_path, MarketFeed, CandleCache,
+                           fetch_ohlcv, fetch_ohlcv_stored, fetch_granularity, timeframe_to_granularity_seconds)
+from .history import RunHistory
+from .http_cache import HttpCache
+
+def fetch_plan(timeframes) -> Dict[int, Tuple[int, int]]:
+    """
+    TF granularitāte -> (Coinbase granularitāte, no kuras to saliek, cik sveču tai ielādēt).
+    TF grupē pēc dabīgās granularitātes (15m -> 900; 1h un 4h -> 3600), katra grupa
+    ielādē tikai tik, cik vajag tās garākajam TF — ne visus TF no smalkākā.
+    """
+    grans = [timeframe_to_granularity_seconds(tf) for tf in timeframes]
+    limits: Dict[int, int] = {}
+    for g in grans:
+        base = fetch_granularity(g)
+        limits[base] = max(limits.get(base, 0), 300 * g // base)
+    return {g: (fetch_granularity(g), limits[fetch_granularity(g)]) for g in grans}
+
+def make_http_cache(cfg) -> Optional[HttpCache]:
+    """HttpCache no HTTP_CACHE_DIR; ja nav — None (katrs pieprasījums iet tīklā)."""
+    if not cfg.HTTP_CACHE_DIR:
+        return None
+    return HttpCache(cfg.HTTP_CACHE_DIR, cfg.HTTP_CACHE_MAX_MB * 1024 * 1024)
+
+def make_candle_store(cfg, timeframes, in_memory: bool = False):
+    """CandleStore no CANDLE_STORE_DIR; ja tā nav — atmiņas krātuve (`in_memory`) vai None."""
+    history = max([cfg.CANDLE_HISTORY] + [lim for _, lim in fetch_plan(timeframes).values()])
+    if cfg.CANDLE_STORE_DIR:
+        return CandleStore(cfg.CANDLE_STORE_DIR, history=history)
+    return MemoryCandleStore(history=history) if in_memory else None
+
+def make_candle_source(cfg):
+    """CANDLE_SOURCES: viens avots vai HedgedSource (primārais + sekundārais)."""
+    return make_source(cfg.CANDLE_SOURCES, {"exchange": cfg.COINBASE_BASE, "advanced": cfg.COINBASE_ADVANCED_BASE},
+                       quantile=cfg.HEDGE_QUANTILE, initial_delay_s=cfg.HEDGE_DELAY_S, max_ratio=cfg.HEDGE_MAX_RATIO)
+
+def make_candle_cache(cfg, timeframes, store=None, source=None) -> CandleCache:
+    """
+    Katrai dabīgajai granularitātei viena ielāde (skat. fetch_plan); TF, kam Coinbase
+    nav savas granularitātes (4h), saliek lokāli no tās pašas sērijas, ko lieto 1h.
+    `source` (CandleSource) var dalīt starp skrējieniem, lai hedžēšanas slieksnis mācās.
+    """
+    if store is None:
+        store = make_candle_store(cfg, timeframes)
+    if source is None:
+        source = make_candle_source(cfg)
+    if store is not None:
+        fetcher = lambda pid, gran, lim: fetch_ohlcv_stored(source, store, pid, gran, lim)
+    else:
+        fetcher = lambda pid, gran, lim: fetch_ohlcv(source, pid, gran, lim)
+    return CandleCache(fetcher, fetch_plan(timeframes))
+
+def make_history(cfg) -> Optional[RunHistory]:
+    """RunHistory no HISTORY_DB; ja nav — None (tikai STATE_FILE)."""
+    if not cfg.HISTORY_DB:
+        return None
+    return RunHistory(cfg.HISTORY_DB, cfg.HISTORY_DETAIL_DAYS, cfg.HISTORY_RETENTION_DAYS)
+
+def make_market_feed(cfg, http_cache) -> MarketFeed:
+    """WATCHLIST_MODE: TOP<N> (lapas paralēli) vai MANUAL (`ids` partijas); lapas sāk lādēt uzreiz."""
+    if cfg.WATCHLIST_MODE == "MANUAL":
+        source = iter_manual_markets(cfg.COINGECKO_BASE, cfg.MANUAL_SYMBOLS, http_cache,
+                                     cfg.MARKETS_TTL_S, cfg.PRODUCTS_TTL_S, ids_file=coingecko_ids_path(cfg.STATE_FILE))
+    else:
+        source = iter_top_markets(cfg.COINGECKO_BASE, universe_size(cfg.WATCHLIST_MODE), http_cache, cfg.MARKETS_TTL_S)
+    return MarketFeed(source)
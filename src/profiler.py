@@ -0,0 +1,290 @@
+"""
+Iebūvētā profilēšana pa posmiem (METRICS.stage):
+
+    python main.py --profile                               # -> profile/
+    HTTP_REPLAY=fixtures.json.gz python main.py --profile prof_dir   # bez tīkla
+
+CPU: fona pavediens ik `interval_s` nolasa visu pavedienu stekus (sys._current_frames)
+un katram stekam pieskaita tā pavediena CPU laiku kopš iepriekšējā parauga
+(pthread_getcpuclockid) — gaidošie pavedieni (pūli, wait/select, sleep) neko nepievieno.
+Kur pavedienu CPU pulksteņa nav, svars ir sienas laiks un dīkstāves steki tiek izlaisti.
+
+Atmiņa: tracemalloc izseko tikai posma laikā veiktās alokācijas (clear_traces posma sākumā);
+posma pīķis un alokāciju vietas, kas to veido (momentuzņēmums, kad izsekotā atmiņa
+aug par 25% pāri iepriekšējam, vai posma beigās, ja tur ir vairāk).
+
+Izvade DIR/: profile.txt (tas pats, kas izdrukāts), profile.json un stacks.collapsed —
+`posms;funkcija (fails:rinda);... mikrosekundes`, der flamegraph.pl / inferno / speedscope.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .metrics import METRICS
+
+OUTSIDE = "(no stage)"
+OWN_FILES = {__file__, tracemalloc.__file__}  # filter_traces ir lēns (Python cilpa), filtrē grupētās rindas
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_DEPTH = 128
+# paraugu pavedienam vajag GIL: ar noklusēto 5 ms pārslēgšanos tas to dabū galvenokārt
+# vietās, kur citi pavedieni GIL atlaiž paši (NumPy kopijas, I/O), un paraugi sakrājas tur
+SWITCH_INTERVAL_S = 0.00005
+# lapas funkcijas, kurās pavediens gaida (izmanto tikai bez pavedienu CPU pulksteņa)
+IDLE_LEAVES = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("thread.py", "_worker"),
+               ("queue.py", "get"), ("selectors.py", "select")}
+
+def _thread_cpu(ident: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError, ProcessLookupError):
+        return None
+
+def _short_path(filename: str) -> str:
+    """Repo faili relatīvi pret repo sakni, bibliotēkas — no site-packages / pythonX.Y/."""
+    for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    if filename.startswith(ROOT + os.sep):
+        return os.path.relpath(filename, ROOT)
+    lib = f"python{sys.version_info[0]}.{sys.version_info[1]}" + os.sep
+    return filename.split(lib, 1)[1] if lib in filename else filename
+
+class StageProfiler:
+    """METRICS āķis: CPU paraugi un tracemalloc pīķi katram posmam."""
+
+    def __init__(self, interval_s: float = 0.005, trace_memory: bool = True, top: int = 15):
+        self.interval_s = interval_s
+        self.trace_memory = trace_memory
+        self.top = top
+        self.stage = OUTSIDE
+        self.order: List[str] = []
+        self.stacks: Dict[str, Counter] = {}      # posms -> {steks: CPU s}
+        self.samples: Counter = Counter()
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.memory: Dict[str, Dict] = {}
+        self._labels: Dict[object, str] = {}
+        self._last_cpu: Dict[int, float] = {}
+        self._thread_clock = _thread_cpu(threading.get_ident()) is not None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._mem: Optional[Dict] = None
+        self._t0 = self._cpu0 = 0.0
+        self._owns_tracing = False
+        self._switch_interval = sys.getswitchinterval()
+
+    # ── Dzīves cikls ──────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SWITCH_INTERVAL_S)
+        self._enter_accounting(OUTSIDE)
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._exit_accounting()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+        if self._owns_tracing:
+            tracemalloc.stop()
+
+    def enter(self, stage: str) -> None:
+        self._exit_accounting()
+        self._enter_accounting(stage)
+
+    def exit(self, stage: str) -> None:
+        self._exit_accounting()
+        self._enter_accounting(OUTSIDE)
+
+    def _enter_accounting(self, stage: str) -> None:
+        if self.trace_memory and stage != OUTSIDE:
+            # tikai šī posma alokācijas: momentuzņēmumi mazi, pīķis = posma pieaugums
+            tracemalloc.clear_traces()
+            tracemalloc.reset_peak()
+            self._mem = {"snap_size": 0, "peak_snap": None}
+        with self._lock:
+            if stage not in self.stacks:
+                self.order.append(stage)
+                self.stacks[stage] = Counter()
+            self.stage = stage
+        self._t0, self._cpu0 = time.perf_counter(), time.process_time()  # pēc clear_traces — bez sava darba
+
+    def _exit_accounting(self) -> None:
+        wall, cpu = time.perf_counter() - self._t0, time.process_time() - self._cpu0
+        with self._lock:
+            stage, self.stage = self.stage, None  # paraugi starp posmiem netiek skaitīti
+        self.wall[stage] += wall
+        self.cpu[stage] += cpu
+        mem, self._mem = self._mem, None
+        if mem is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        peak_snap = mem["peak_snap"]
+        if peak_snap is None or current >= mem["snap_size"]:
+            peak_snap = tracemalloc.take_snapshot()
+        sites = [{"site": f"{_short_path(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+                  "kb": round(s.size / 1024, 1), "count": s.count}
+                 for s in peak_snap.statistics("lineno") if s.traceback[0].filename not in OWN_FILES][:self.top]
+        prev = self.memory.get(stage)
+        if prev is None or peak > prev["peak_kb"] * 1024:
+            self.memory[stage] = {"peak_kb": round(peak / 1024, 1), "retained_kb": round(current / 1024, 1),
+                                  "sites": sites}
+
+    # ── Paraugi ───────────────────────────────────────────────────────────────
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval_s):
+            now = time.perf_counter()
+            self._sample(me, now - last)
+            last = now
+
+    def _sample(self, me: int, wall_dt: float) -> None:
+        stage = self.stage
+        frames = sys._current_frames()
+        weighted = []
+        for ident, frame in frames.items():
+            if ident == me:
+                continue
+            if self._thread_clock:
+                cpu = _thread_cpu(ident)
+                if cpu is None:
+                    continue
+                prev = self._last_cpu.get(ident)
+                self._last_cpu[ident] = cpu  # arī starp posmiem, lai profilētāja darbs neieplūst nākamajā paraugā
+                if stage is None or prev is None or cpu <= prev:
+                    continue
+                weight = cpu - prev
+            else:
+                code = frame.f_code
+                if stage is None:
+                    continue
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                weight = wall_dt
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                if frame.f_code.co_filename == __file__:
+                    break  # paša profilētāja darbs (momentuzņēmumi) posmam netiek pieskaitīts
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            else:
+                weighted.append((tuple(reversed(stack)), weight))
+        del frames
+        if stage is None:
+            return
+        with self._lock:
+            if self.stage != stage:
+                return
+            counter = self.stacks[stage]
+            for stack, weight in weighted:
+                counter[stack] += weight
+            self.samples[stage] += 1
+        mem = self._mem
+        if mem is not None:
+            current = tracemalloc.get_traced_memory()[0]
+            if current > max(1 << 20, 1.25 * mem["snap_size"]):
+                mem["snap_size"] = current
+                mem["peak_snap"] = tracemalloc.take_snapshot()
+
+    # ── Atskaite ──────────────────────────────────────────────────────────────
+
+    def report(self) -> Dict:
+        stages = {}
+        with self._lock:
+            for stage in self.order:
+                stacks = self.stacks[stage]
+                cum, own = Counter(), Counter()
+                for stack, w in stacks.items():
+                    for fn in set(stack):
+                        cum[fn] += w
+                    if stack:
+                        own[stack[-1]] += w
+                stages[stage] = {
+                    "wall_s": round(self.wall[stage], 4),
+                    "cpu_s": round(self.cpu[stage], 4),
+                    "sampled_cpu_s": round(sum(stacks.values()), 4),
+                    "samples": self.samples[stage],
+                    "top_cumulative": [{"function": f, "s": round(w, 4)} for f, w in cum.most_common(self.top)],
+                    "top_self": [{"function": f, "s": round(w, 4)} for f, w in own.most_common(self.top)],
+                    "memory": self.memory.get(stage),
+                }
+        return {"interval_s": self.interval_s, "weight": "thread_cpu" if self._thread_clock else "wall_non_idle",
+                "stages": stages}
+
+    def collapsed(self) -> str:
+        lines = []
+        with self._lock:
+            for stage in self.order:
+                for stack, w in self.stacks[stage].items():
+                    us = int(round(w * 1e6))
+                    if us > 0:
+                        lines.append(";".join((stage,) + stack) + f" {us}")
+        return "\n".join(sorted(lines)) + "\n"
+
+    @staticmethod
+    def format_report(rep: Dict) -> str:
+        out = [f"=== PROFILE (svars: {rep['weight']}, intervāls {rep['interval_s'] * 1000:.0f} ms) ==="]
+        for stage, s in rep["stages"].items():
+            if not s["samples"] and s["wall_s"] < 0.001:
+                continue
+            out.append(f"\n[{stage}] wall {s['wall_s']:.3f}s, CPU {s['cpu_s']:.3f}s "
+                       f"(paraugos {s['sampled_cpu_s']:.3f}s, {s['samples']} paraugi)")
+            if s["top_cumulative"]:
+                out.append("  kumulatīvi:")
+                out += [f"    {f['s']:8.3f}s  {f['function']}" for f in s["top_cumulative"]]
+                out.append("  pašlaiks:")
+                out += [f"    {f['s']:8.3f}s  {f['function']}" for f in s["top_self"]]
+            mem = s["memory"]
+            if mem:
+                out.append(f"  atmiņa: pīķis +{mem['peak_kb'] / 1024:.2f} MB, paliek +{mem['retained_kb'] / 1024:.2f} MB")
+                out += [f"    {m['kb']:10.1f} KB  {m['count']:>7}  {m['site']}" for m in mem["sites"]]
+        return "\n".join(out)
+
+    def write(self, directory: str) -> Dict:
+        os.makedirs(directory, exist_ok=True)
+        rep = self.report()
+        for name, content in (("profile.json", json.dumps(rep, indent=2, ensure_ascii=False)),
+                              ("profile.txt", self.format_report(rep) + "\n"),
+                              ("stacks.collapsed", self.collapsed())):
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+        return rep
+
+@contextmanager
+def profiled(directory: str, interval_s: float = 0.005, trace_memory: bool = True):
+    """Profilē bloku: METRICS posmi -> DIR/profile.txt, profile.json, stacks.collapsed; atskaiti izdrukā."""
+    prof = StageProfiler(interval_s, trace_memory)
+    METRICS.hooks.append(prof)
+    prof.start()
+    try:
+        yield prof
+    finally:
+        prof.stop()
+        METRICS.hooks.remove(prof)
+        rep = prof.write(directory)
+        print("\n" + prof.format_report(rep))
+        print(f"[profile] {directory}/profile.txt, profile.json, stacks.collapsed")
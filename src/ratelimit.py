@@ -0,0 +1,154 @@
+"""
+Pieprasījumu tempa ierobežotājs pa hostiem (token bucket).
+
+Katrs pieprasījums vispirms paņem žetonu no sava hosta spaiņa, tāpēc tempu
+ierobežo jau pirms sūtīšanas, nevis pēc 429. Atbildes galvenes koriģē budžetu:
+`Retry-After` un `*-RateLimit-Remaining: 0` aptur hostu līdz norādītajam
+laikam, 429 uz pusi samazina tempu, veiksmīgas atbildes to pamazām atjauno.
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .metrics import METRICS
+
+# (pieprasījumi sekundē, burst). Coinbase Exchange publiskie: 10 req/s;
+# Advanced Trade publiskie: 10 req/s; CoinGecko bezmaksas: ~30 req/min; Telegram: ~30 ziņas/s globāli.
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "api.exchange.coinbase.com": (8.0, 10.0),
+    "api.coinbase.com": (8.0, 10.0),
+    "api.coingecko.com": (0.5, 3.0),
+    "api.telegram.org": (25.0, 25.0),
+}
+FALLBACK_LIMIT = (5.0, 5.0)
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Retry-After: sekundes vai HTTP datums -> gaidīšanas sekundes."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError):
+        return None
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """"api.coingecko.com=0.5:3,api.exchange.coinbase.com=10:15" -> {host: (rate, burst)}"""
+    out = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        host, val = part.split("=", 1)
+        rate, _, burst = val.partition(":")
+        out[host.strip()] = (float(rate), float(burst or rate))
+    return out
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """Gaida žetonu; atgriež gaidīšanas laiku sekundēs."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                else:
+                    wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def block_for(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def throttle(self) -> None:
+        """429: temps uz pusi (ne zemāk par 1/20 no maksimuma)."""
+        with self._lock:
+            self.rate = max(self.max_rate / 20.0, self.rate / 2.0)
+
+    def recover(self) -> None:
+        """Veiksmīga atbilde: temps atgriežas pie maksimuma pa 5% solim."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+class RateLimiter:
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.enabled = True  # izslēdz atskaņošanai / lokāliem aizstājējiem
+        self._lock = threading.Lock()
+
+    def configure(self, limits: Dict[str, Tuple[float, float]]) -> None:
+        with self._lock:
+            self.limits.update(limits)
+            for host in limits:
+                self.buckets.pop(host, None)
+
+    def bucket(self, url) -> TokenBucket:
+        host = urlsplit(str(url)).hostname or ""
+        with self._lock:
+            b = self.buckets.get(host)
+            if b is None:
+                b = self.buckets[host] = TokenBucket(*self.limits.get(host, FALLBACK_LIMIT))
+            return b
+
+    def acquire(self, url) -> float:
+        if not self.enabled:
+            return 0.0
+        waited = self.bucket(url).acquire()
+        METRICS.observe("ratelimit_wait_seconds", waited)
+        return waited
+
+    def on_response(self, url, status: int, headers) -> Optional[float]:
+        """Koriģē budžetu pēc atbildes; atgriež Retry-After sekundes (ja bija)."""
+        retry_after = parse_retry_after(headers.get("retry-after"))
+        if not self.enabled:
+            return retry_after
+        b = self.bucket(url)
+        remaining = headers.get("x-ratelimit-remaining") or headers.get("ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset") or headers.get("ratelimit-reset")
+        if status == 429:
+            METRICS.inc("ratelimit_429")
+            b.throttle()
+            b.block_for(retry_after if retry_after is not None else 1.0 / b.rate)
+        elif retry_after is not None and status == 503:
+            b.block_for(retry_after)
+        else:
+            b.recover()
+        if remaining is not None and reset is not None:
+            try:
+                if float(remaining) <= 0:
+                    r = float(reset)
+                    b.block_for(r - time.time() if r > 1e9 else r)  # epoch vai sekundes
+            except ValueError:
+                pass
+        return retry_after
+
+LIMITER = RateLimiter()
@@ -0,0 +1,200 @@
+"""
+HTTP ierakstīšana / atskaņošana zem `_get` un `send_telegram_message`.
+
+    HTTP_RECORD=fixtures.json.gz python main.py   # īsts skrējiens, atbildes saglabā
+    HTTP_REPLAY=fixtures.json.gz python main.py   # tas pats skrējiens bez tīkla
+
+Arhīvs ir gzip JSON: atslēga (metode + hosts + ceļš + parametri bez start/end)
+-> atbilžu saraksts ierakstīšanas secībā. Telegram bota tokens tiek aizklāts.
+SyntheticTransport ģenerē deterministisku universu jebkurā izmērā (bench),
+LatencyTransport tam pievieno aizturi pa hostiem (hedžēšanas mērījumi).
+"""
+import base64
+import gzip
+import json
+import os
+import re
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+
+from .candle_sources import ADVANCED_GRANULARITY
+from .data_sources import set_transport
+from .ratelimit import LIMITER
+
+# Parametri, kas mainās katrā skrējienā (sveču logs pēc pulksteņa)
+VOLATILE_PARAMS = {"start", "end"}
+RECORDED_HEADERS = {"content-type", "retry-after", "etag", "last-modified",
+                    "x-ratelimit-remaining", "x-ratelimit-reset", "ratelimit-remaining", "ratelimit-reset"}
+
+def request_key(request: httpx.Request) -> str:
+    path = re.sub(r"/bot[^/]+/", "/bot<token>/", request.url.path)
+    params = sorted((k, v) for k, v in request.url.params.multi_items() if k not in VOLATILE_PARAMS)
+    query = "&".join(f"{k}={v}" for k, v in params)
+    return f"{request.method} {request.url.host}{path}?{query}"
+
+def load_archive(path: str) -> Dict[str, List[dict]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)["entries"]
+
+def save_archive(path: str, entries: Dict[str, List[dict]]) -> None:
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump({"version": 1, "entries": entries}, f)
+    os.replace(tmp, path)
+
+class RecordingTransport(httpx.BaseTransport):
+    """Laiž pieprasījumus uz tīklu un pieraksta atbildes."""
+
+    def __init__(self, inner: Optional[httpx.BaseTransport] = None):
+        self.inner = inner or httpx.HTTPTransport(http2=True)
+        self.entries: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        resp = self.inner.handle_request(request)
+        content = resp.read()
+        resp.close()
+        entry = {
+            "status": resp.status_code,
+            "headers": {k: v for k, v in resp.headers.items() if k.lower() in RECORDED_HEADERS},
+            "body": base64.b64encode(content).decode("ascii"),
+        }
+        with self._lock:
+            self.entries.setdefault(request_key(request), []).append(entry)
+        return httpx.Response(resp.status_code, headers=entry["headers"], content=content, request=request)
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            save_archive(path, self.entries)
+
+    def close(self) -> None:
+        self.inner.close()
+
+class ReplayTransport(httpx.BaseTransport):
+    """Atskaņo ierakstītās atbildes; atkārtotiem pieprasījumiem iet pa sarakstu, pēdējo atkārto."""
+
+    def __init__(self, entries: Dict[str, List[dict]]):
+        self.entries = entries
+        self.cursor: Dict[str, int] = {}
+        self.misses: List[str] = []
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        with self._lock:
+            seq = self.entries.get(key)
+            if not seq:
+                self.misses.append(key)
+                return httpx.Response(404, json={"error": f"no fixture for {key}"}, request=request)
+            i = self.cursor.get(key, 0)
+            self.cursor[key] = i + 1
+            entry = seq[min(i, len(seq) - 1)]
+        return httpx.Response(entry["status"], headers=entry["headers"],
+                              content=base64.b64decode(entry["body"]), request=request)
+
+# Sintētiskā universa pulkstenis (unix s), lai sveces un plūsma būtu deterministiskas
+SYNTHETIC_NOW = 1760000000.0
+
+class SyntheticTransport(httpx.MockTransport):
+    """
+    Lokāls aizstājējs CoinGecko / Coinbase / Telegram ar `n_symbols` sintētisku
+    universu (deterministisks pēc `seed`), lai varētu mērīt lielus universus.
+    """
+
+    def __init__(self, n_symbols: int = 100, seed: int = 0, candles: int = 300, now: float = SYNTHETIC_NOW):
+        self.n_symbols, self.seed, self.n_candles = n_symbols, seed, candles
+        self.now = now  # pēdējās sveces laiks; maina testi/harness, lai simulētu nākamo skrējienu
+        self._candles: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        rng = np.random.default_rng(seed)
+        self.markets = [{
+            "id": f"coin{i}", "symbol": f"c{i}", "name": f"Coin {i}",
+            "current_price": 1.0, "total_volume": float(rng.uniform(1e7, 5e8)),
+            "price_change_percentage_24h": float(rng.normal(2.0, 4.0)),
+        } for i in range(n_symbols)]
+        self.products = [{"id": f"C{i}-USD"} for i in range(n_symbols)]
+        super().__init__(self._handle)
+
+    def candle_rows(self, product_id: str, gran: int) -> list:
+        key = (product_id, gran)
+        with self._lock:
+            rows = self._candles.get(key)
+        if rows is None:
+            rng = np.random.default_rng([self.seed, int(re.sub(r"\D", "", product_id) or 0), gran])
+            n = self.n_candles
+            c = 100 * np.exp(np.cumsum(rng.normal(0.001, 0.015, n)))
+            h, l = c * (1 + rng.uniform(0, 0.01, n)), c * (1 - rng.uniform(0, 0.01, n))
+            end = int(self.now) // gran * gran
+            t = end - gran * np.arange(n)[::-1]
+            rows = [[int(t[i]), l[i], h[i], c[i - 1] if i else c[i], c[i], 1000.0] for i in range(n)][::-1]
+            with self._lock:
+                self._candles[key] = rows
+        return rows
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/coins/markets"):
+            q = request.url.params
+            rows = self.markets
+            if q.get("ids"):
+                ids = set(q["ids"].split(","))
+                rows = [m for m in rows if m["id"] in ids]
+            per_page, page = int(q.get("per_page", 100)), int(q.get("page", 1))
+            return httpx.Response(200, json=rows[(page - 1) * per_page: page * per_page])
+        if path.endswith("/coins/list"):
+            return httpx.Response(200, json=[{"id": m["id"], "symbol": m["symbol"], "name": m["name"]} for m in self.markets])
+        if path.endswith("/products"):
+            return httpx.Response(200, json=self.products)
+        m = re.search(r"/brokerage/market/products/([^/]+)/candles", path)
+        if m:
+            gran = {v: k for k, v in ADVANCED_GRANULARITY.items()}[request.url.params.get("granularity", "ONE_HOUR")]
+            keys = ("start", "low", "high", "open", "close", "volume")
+            return httpx.Response(200, json={"candles": [{k: str(v) for k, v in zip(keys, r)}
+                                                         for r in self.candle_rows(m.group(1), gran)]})
+        m = re.search(r"/products/([^/]+)/candles", path)
+        if m:
+            return httpx.Response(200, json=self.candle_rows(m.group(1), int(request.url.params.get("granularity", 3600))))
+        if path.endswith("/sendMessage"):
+            return httpx.Response(200, json={"ok": True, "result": {}})
+        return httpx.Response(404, json={"error": "unknown endpoint"})
+
+class LatencyTransport(httpx.BaseTransport):
+    """
+    Lokāla aizture pa hostiem: `profile[host] = (bāze_s, astes varbūtība, aste_s)`.
+    Deterministiska pēc `seed`; kļūdu/lēnu avotu simulācijai bez tīkla.
+    """
+
+    def __init__(self, inner: httpx.BaseTransport, profile: Dict[str, Tuple[float, float, float]], seed: int = 0):
+        self.inner = inner
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        base, tail_p, tail_s = self.profile.get(request.url.host, (0.0, 0.0, 0.0))
+        with self._lock:
+            slow = self.rng.random() < tail_p
+        time.sleep(base + (tail_s if slow else 0.0))
+        return self.inner.handle_request(request)
+
+def install_from_env():
+    """
+    HTTP_REPLAY=arhīvs -> atskaņošana; HTTP_RECORD=arhīvs -> ierakstīšana.
+    Atgriež funkciju, kas skrējiena beigās saglabā ierakstu (vai neko nedara).
+    """
+    replay_path = os.getenv("HTTP_REPLAY", "").strip()
+    record_path = os.getenv("HTTP_RECORD", "").strip()
+    if replay_path:
+        set_transport(ReplayTransport(load_archive(replay_path)))
+        LIMITER.enabled = False  # lokāli nav ko ierobežot
+        print(f"[replay] serving HTTP from {replay_path}")
+    elif record_path:
+        rec = RecordingTransport()
+        set_transport(rec)
+        print(f"[replay] recording HTTP to {record_path}")
+        return lambda: rec.save(record_path)
+    return lambda: None
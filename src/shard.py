@@ -0,0 +1,84 @@
+"""
+Skenēšanas sadalīšana pa mezgliem / procesiem.
+
+    python main.py --shard 1/4 --partial part1.json.gz   # ... līdz 4/4, paralēli
+    python main.py --merge part1.json.gz part2.json.gz part3.json.gz part4.json.gz
+
+Daļa apstrādā tikai tirgus, kuru simbola crc32 % N == i-1 (tirgu saraksts un ranga
+atslēgas — visiem tās pašas), un raksta daļējo rezultātu: katram profilam/TF savu
+Top-N ar ranga atslēgām un padomiem, skip iemeslus un (ja HISTORY_DB) pilno rangu.
+Merge apvieno daļas ar k-ceļu sapludināšanu tajā pašā secībā kā _rank (punkti
+dilstoši, tad kapitalizācijas atslēga), tāpēc rezultāts ir tāds pats kā viena mezgla
+skrējienā; NEW/KEEP/DROP, state/vēsture un sūtīšana notiek tikai merge solī.
+"""
+import gzip
+import heapq
+import json
+import os
+import zlib
+from typing import Dict, List, Tuple
+
+PARTIAL_VERSION = 2  # 2: rank_key (cap_rank | NO_RANK, lapa, indekss), bez Infinity
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """"2/4" -> (1, 4) (indekss no 0)."""
+    try:
+        i, n = (int(x) for x in spec.split("/", 1))
+    except ValueError:
+        raise SystemExit(f"--shard expects i/N, got {spec!r}")
+    if not 1 <= i <= n:
+        raise SystemExit(f"--shard {spec}: need 1 <= i <= N")
+    return i - 1, n
+
+def shard_of(symbol: str, n: int) -> int:
+    """Stabils (ne Python hash) simbola sadalījums: vienāds visos mezglos un skrējienos."""
+    return zlib.crc32(symbol.upper().encode("utf-8")) % n
+
+def _rank_order(c: Dict) -> tuple:
+    return -c["score"], tuple(c["rank_key"])
+
+def merge_ranked(lists: List[List[Dict]], top_n: int = None) -> List[Dict]:
+    """k-ceļu sapludināšana jau sakārtotiem sarakstiem (katra daļa sakārtota kā _rank)."""
+    merged = heapq.merge(*lists, key=_rank_order)
+    return list(merged if top_n is None else (c for _, c in zip(range(top_n), merged)))
+
+def write_partial(path: str, shard: Tuple[int, int], results: Dict[str, Dict], meta: Dict) -> None:
+    payload = {"version": PARTIAL_VERSION, "shard": list(shard), "meta": meta, "results": results}
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+    os.replace(tmp, path)
+
+def load_partials(paths: List[str]) -> List[Dict]:
+    """Nolasa un pārbauda, ka daļas ir viena sadalījuma visas N daļas tieši pa vienai."""
+    parts = []
+    for p in paths:
+        with gzip.open(p, "rt", encoding="utf-8") as f:
+            parts.append(json.load(f))
+    if not parts:
+        raise SystemExit("--merge: no partial files")
+    if any(p.get("version") != PARTIAL_VERSION for p in parts):
+        raise SystemExit("--merge: partial file version mismatch")
+    n = parts[0]["shard"][1]
+    got = sorted(p["shard"][0] for p in parts)
+    if any(p["shard"][1] != n for p in parts) or got != list(range(n)):
+        raise SystemExit(f"--merge: need shards 1..{n} exactly once, got {[i + 1 for i in got]} of {n}")
+    labels = set(parts[0]["results"])
+    if any(set(p["results"]) != labels for p in parts):
+        raise SystemExit("--merge: partial files were produced with different profiles/timeframes")
+    return parts
+
+def merge_partials(parts: List[Dict], top_n: Dict[str, int]) -> Dict[str, Dict]:
+    """{label: {"top", "skipped", "ranking"}} — Top-N pēc `top_n[label]`, pilnais rangs, ja daļās tas ir."""
+    out = {}
+    for label in parts[0]["results"]:
+        res = [p["results"][label] for p in sorted(parts, key=lambda p: p["shard"][0])]
+        ranking = None
+        if all(r.get("ranking") is not None for r in res):
+            ranking = merge_ranked([r["ranking"] for r in res])
+        out[label] = {
+            "top": merge_ranked([r["top"] for r in res], top_n[label]),
+            "skipped": [s for r in res for s in r["skipped"]],
+            "ranking": ranking,
+        }
+    return out
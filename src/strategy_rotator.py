@@ -1,30 +1,74 @@
+import heapq
 import json
 import os
-from typing import Dict, List, Tuple, Optional
-import pandas as pd
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple, Optional
+import numpy as np
 
-from .indicators import sma, rsi, atr_pct
+from .indicators import stack_right_aligned, last_values_2d, IndicatorBook
+from .candles import Candles
+from .data_sources import FEED_POS
+from .metrics import METRICS
+from .shard import shard_of
 
 STABLES = {"USDT","USDC","DAI","TUSD","USDP","FDUSD","PYUSD"}
 
-def filter_and_rank(
-    markets: List[Dict],
-    symbol_to_product: Dict[str, str],
-    ohlcv_fetcher,
-    timeframe: str,
-    ma_period: int,
-    rsi_threshold: float,
-    atr_pct_min: float,
-    min_24h_volume_usd: float,
-    min_24h_pct: float,
-    top_n: int
-) -> Tuple[List[Dict], List[Dict]]:
-    """Returns (ranked_top, skipped)"""
-    gran = {"15m": 900, "1h": 3600, "4h": 14400}[timeframe]
-    candidates, skipped = [], []
+def prefetch_ohlcv(ohlcv_fetcher, product_ids: List[str], gran: int, limit: int = 300,
+                   max_workers: int = 8) -> Dict[str, Optional[Candles]]:
+    """Ielādē sveces visiem produktiem paralēli (ierobežots pavedienu pūls)."""
+    uniq = list(dict.fromkeys(product_ids))
+    if max_workers <= 1 or len(uniq) <= 1:
+        return {pid: ohlcv_fetcher(pid, gran, limit) for pid in uniq}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(uniq))) as pool:
+        frames = pool.map(lambda pid: ohlcv_fetcher(pid, gran, limit), uniq)
+        return dict(zip(uniq, frames))
+
+def stream_indicator_values(book: IndicatorBook, product_id: str, gran: int, ma_period: int,
+                            candles: Candles, now: float) -> Dict[str, float]:
+    """
+    Ieliek stāvoklī tikai jaunās aizvērtās sveces (O(1) katra) un atgriež vērtības,
+    pēdējo neaizvērto sveci ieskaitot tikai rezultātā.
+    """
+    times = candles.times
+    rows = candles.rows()
+    closed = times + gran <= now
+    st = book.get(product_id, gran, ma_period)
+    if st.last_time is not None and st.last_time < times[0] - gran:
+        st = book.reset(product_id, gran, ma_period)  # robs starp skrējieniem
+    for row in rows[closed]:
+        st.update(row)
+    return st.values(rows[~closed][-1] if (~closed).any() else None)
 
-    for m in markets:
+RSI_MAX = 100.0
+
+def score_of(pct, rsi, atrpct, rsi_threshold: float, atr_pct_min: float,
+             atr_score_cap: Optional[float] = None):
+    """Ranga punkti; der gan skaitļiem, gan (simboli × bāri) masīviem (backtest, sweep)."""
+    atr_excess = np.maximum(0.0, (atrpct - atr_pct_min))
+    if atr_score_cap is not None:
+        atr_excess = np.minimum(atr_excess, atr_score_cap)
+    return (pct * 0.7) + np.maximum(0.0, (rsi - rsi_threshold)) * 0.2 + atr_excess * 0.1
+
+def score_upper_bound(pct: float, rsi_threshold: float, atr_score_cap: float) -> float:
+    """Lielākais iespējamais `score_of` pie dotā pct (RSI <= 100, ATR loceklis ierobežots)."""
+    return score_of(pct, RSI_MAX, float("inf"), rsi_threshold, 0.0, atr_score_cap)
+
+# Bez market_cap_rank — aiz visiem ranžētajiem; galīgs skaitlis, lai rank_key ir standarta JSON
+NO_RANK = sys.maxsize
+
+def _cheap_filter(markets, symbol_to_product, min_24h_volume_usd, min_24h_pct, skipped, on_pass=None,
+                  shard=None) -> List[tuple]:
+    """
+    Lētie filtri (bez tīkla). Atgriež [(rank_key, sym, name, vol, pct, pid)]; `on_pass(pid)` izsauc uzreiz.
+    `shard` (i, N): tikai savas daļas simboli (ranga atslēgas tās pašas, jo vieta avotā ir visu tirgu).
+    """
+    pending = []
+    for idx, m in enumerate(markets):
         sym = m.get("symbol", "").upper()
+        if shard is not None and shard_of(sym, shard[1]) != shard[0]:
+            continue
         name = m.get("name", sym)
         vol = float(m.get("total_volume", 0.0))
         pct = m.get("price_change_percentage_24h")
@@ -41,51 +85,205 @@ def filter_and_rank(
         if not pid:
             skipped.append({"symbol": sym, "reason": "not_on_coinbase_usd"}); continue
 
-        df = ohlcv_fetcher(pid, gran, 300)
-        if df is None or len(df) < max(ma_period, 50):
-            skipped.append({"symbol": sym, "reason": "no_ohlcv"}); continue
+        # kārtošana pēc kapitalizācijas, tad vietas avotā (lapa, indekss) — ne pēc lapu ienākšanas secības
+        page, pos = m.get(FEED_POS, (0, idx))
+        pending.append(((m.get("market_cap_rank") or NO_RANK, page, pos), sym, name, vol, pct, pid))
+        if on_pass is not None:
+            on_pass(pid)
+    return pending
 
-        df["ma"] = sma(df["close"], ma_period)
-        df["rsi"] = rsi(df["close"], 14)
-        df["atrpct"] = atr_pct(df, 14)
+def _evaluate(pending, frames, gran, ma_period, rsi_threshold, atr_pct_min, atr_score_cap,
+              indicator_book, skipped, indicator_memo=None) -> List[tuple]:
+    """
+    3)–4) Indikatori vienā vektorizētā piegājienā (vai no `indicator_book` stāvokļa) + sliekšņi.
+    Atgriež [(rank_key, kandidāts)].
+    `indicator_memo` {(pid, gran, ma_period): vērtības} — jau aprēķinātos neaprēķina vēlreiz.
+    """
+    ready = []
+    for key, sym, name, vol, pct, pid in pending:
+        c = frames.get(pid)
+        if c is None or len(c) < max(ma_period, 50):
+            skipped.append({"symbol": sym, "reason": "no_ohlcv"}); continue
+        ready.append((key, sym, name, vol, pct, pid, c))
+    if not ready:
+        return []
 
-        last = df.iloc[-1]
-        prev = df.iloc[-2] if len(df) >= 2 else last
-        arrow = "↑" if last["close"] > prev["close"] else ("↓" if last["close"] < prev["close"] else "=")
+    memo = indicator_memo if indicator_memo is not None else {}
+    todo = list({r[5]: r for r in ready if (r[5], gran, ma_period) not in memo}.values())
+    METRICS.inc("indicator_memo_hits", len(ready) - len(todo))
+    if todo and indicator_book is not None:
+        # straumēšana: O(1) uz jaunu sveci, pilnā loga vektorizētais piegājiens nav vajadzīgs
+        now = time.time()
+        for r in todo:
+            t1 = time.perf_counter()
+            values = stream_indicator_values(indicator_book, r[5], gran, ma_period, r[6], now)
+            memo[(r[5], gran, ma_period)] = {k: float(v) for k, v in values.items()}
+            METRICS.observe("indicator_stream_symbol_seconds", time.perf_counter() - t1)
+        METRICS.inc("indicator_symbols", len(todo))
+    elif todo:
+        t0 = time.perf_counter()
+        ind = last_values_2d(
+            stack_right_aligned([r[6].close for r in todo]),
+            stack_right_aligned([r[6].high for r in todo]),
+            stack_right_aligned([r[6].low for r in todo]),
+            ma_period,
+        )
+        for i, r in enumerate(todo):
+            memo[(r[5], gran, ma_period)] = {k: float(v[i]) for k, v in ind.items()}
+        METRICS.observe("indicator_batch_seconds", time.perf_counter() - t0)
+        METRICS.inc("indicator_symbols", len(todo))
 
-        conds = {
-            "price_above_ma": bool(last["close"] > last["ma"] if pd.notna(last["ma"]) else False),
-            "rsi_ok": bool(last["rsi"] > rsi_threshold if pd.notna(last["rsi"]) else False),
-            "atr_ok": bool(last["atrpct"] > atr_pct_min if pd.notna(last["atrpct"]) else False),
-        }
-        if not all(conds.values()):
+    out = []
+    for key, sym, name, vol, pct, pid, _ in ready:
+        last = memo[(pid, gran, ma_period)]
+        cand, conds = make_candidate(sym, name, pid, vol, pct, last, rsi_threshold, atr_pct_min, atr_score_cap)
+        if cand is None:
             skipped.append({"symbol": sym, "reason": f"indicators fail {conds}"}); continue
+        out.append((key, cand))
+    return out
 
-        score = (pct * 0.7) + max(0.0, (last["rsi"] - rsi_threshold)) * 0.2 + max(0.0, (last["atrpct"] - atr_pct_min)) * 0.1
-        candidates.append({
-            "symbol": sym, "name": name, "product_id": pid,
-            "pct24h": round(pct, 2),
-            "volume_usd": float(vol),
-            "price": float(last["close"]),
-            "ma": float(last["ma"]) if pd.notna(last["ma"]) else None,
-            "rsi": float(last["rsi"]) if pd.notna(last["rsi"]) else None,
-            "atrpct": float(last["atrpct"]) if pd.notna(last["atrpct"]) else None,
-            "arrow": arrow,
-            "score": float(score),
-        })
-
-    ranked = sorted(candidates, key=lambda x: x["score"], reverse=True)[:top_n]
-    return ranked, skipped
-
-def compute_entry_sl_tp(row: Dict, df: pd.DataFrame) -> Dict:
-    last = df.iloc[-1]
-    atr_val = (row["atrpct"] / 100.0) * last["close"]  # ATR price units
-    entry_ok = last["close"] > row["ma"] and row.get("rsi", 0) > 55
+def make_candidate(sym: str, name: str, pid: str, vol: float, pct: float, last: Dict[str, float],
+                   rsi_threshold: float, atr_pct_min: float,
+                   atr_score_cap: Optional[float] = None) -> Tuple[Optional[Dict], Dict[str, bool]]:
+    """Sliekšņi un punkti vienam tirgum no pēdējām indikatoru vērtībām. (kandidāts vai None, nosacījumi)"""
+    arrow = "↑" if last["close"] > last["prev_close"] else ("↓" if last["close"] < last["prev_close"] else "=")
+    conds = {
+        "price_above_ma": bool(last["close"] > last["ma"] if not np.isnan(last["ma"]) else False),
+        "rsi_ok": bool(last["rsi"] > rsi_threshold if not np.isnan(last["rsi"]) else False),
+        "atr_ok": bool(last["atrpct"] > atr_pct_min if not np.isnan(last["atrpct"]) else False),
+    }
+    if not all(conds.values()):
+        return None, conds
+
+    score = score_of(pct, last["rsi"], last["atrpct"], rsi_threshold, atr_pct_min, atr_score_cap)
+    return {
+        "symbol": sym, "name": name, "product_id": pid,
+        "pct24h": round(pct, 2),
+        "volume_usd": float(vol),
+        "price": last["close"],
+        "ma": last["ma"] if not np.isnan(last["ma"]) else None,
+        "rsi": last["rsi"] if not np.isnan(last["rsi"]) else None,
+        "atrpct": last["atrpct"] if not np.isnan(last["atrpct"]) else None,
+        "arrow": arrow,
+        "score": float(score),
+    }, conds
+
+def _rank(evaluated: List[tuple], top_n: int, ranking: Optional[List[Dict]] = None,
+          with_keys: bool = False) -> List[Dict]:
+    """
+    Punkti dilstoši, vienādiem — kapitalizācijas secība. `ranking` saņem pilno rangu.
+    `with_keys`: kandidātiem pievieno "rank_key" (daļu apvienošanai, src/shard.py).
+    """
+    ordered = []
+    for key, c in sorted(evaluated, key=lambda e: (-e[1]["score"], e[0])):
+        if with_keys:
+            c["rank_key"] = list(key)
+        ordered.append(c)
+    if ranking is not None:
+        ranking.extend(ordered)
+    return ordered[:top_n]
+
+def filter_and_rank(
+    markets: Iterable[Dict],
+    symbol_to_product: Dict[str, str],
+    ohlcv_fetcher,
+    timeframe: str,
+    ma_period: int,
+    rsi_threshold: float,
+    atr_pct_min: float,
+    min_24h_volume_usd: float,
+    min_24h_pct: float,
+    top_n: int,
+    max_workers: int = 8,
+    indicator_book: Optional[IndicatorBook] = None,
+    atr_score_cap: Optional[float] = None,
+    best_first: bool = False,
+    ranking: Optional[List[Dict]] = None,
+    indicator_memo: Optional[Dict] = None,
+    shard: Optional[Tuple[int, int]] = None
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Returns (ranked_top, skipped).
+    `markets` var būt jebkura plūsma (piem. MarketFeed): sveču ielāde sākas,
+    tiklīdz tirgus iziet lētos filtrus, negaidot pārējās lapas.
+    Ja dots `indicator_book`, indikatori nāk no straumēšanas stāvokļa (visa vēsture).
+    `best_first` (vajag `atr_score_cap`): skat. `_best_first`.
+    `ranking` (saraksts) saņem visus novērtētos kandidātus ranga secībā (vēsturei).
+    `indicator_memo` (dict) dala indikatoru vērtības starp izsaukumiem ar to pašu
+    MA_PERIOD (profili): katrs (produkts, granularitāte, MA_PERIOD) tiek rēķināts vienreiz.
+    `shard` (i, N): tikai daļa universa (skat. src/shard.py); kandidātiem ir "rank_key".
+    """
+    gran = {"15m": 900, "1h": 3600, "4h": 14400}[timeframe]
+    skipped: List[Dict] = []
+    if best_first:
+        if atr_score_cap is None:
+            raise ValueError("best_first requires atr_score_cap (otherwise the score has no upper bound)")
+        pending = _cheap_filter(markets, symbol_to_product, min_24h_volume_usd, min_24h_pct, skipped, shard=shard)
+        return _best_first(pending, ohlcv_fetcher, gran, ma_period, rsi_threshold, atr_pct_min, atr_score_cap,
+                           top_n, max_workers, indicator_book, skipped, ranking, indicator_memo,
+                           shard is not None), skipped
+
+    # 1) Lētie filtri; 2) izgājušajiem sveces uzreiz fonā
+    futures = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+    def submit(pid):
+        if pid not in futures:
+            futures[pid] = pool.submit(ohlcv_fetcher, pid, gran, 300)
+    try:
+        pending = _cheap_filter(markets, symbol_to_product, min_24h_volume_usd, min_24h_pct, skipped, submit, shard)
+        frames = {pid: f.result() for pid, f in futures.items()}
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    pending.sort(key=lambda p: p[0])
+
+    # 3)–4)
+    evaluated = _evaluate(pending, frames, gran, ma_period, rsi_threshold, atr_pct_min, atr_score_cap,
+                          indicator_book, skipped, indicator_memo)
+    return _rank(evaluated, top_n, ranking, shard is not None), skipped
+
+def _best_first(pending, ohlcv_fetcher, gran, ma_period, rsi_threshold, atr_pct_min, atr_score_cap,
+                top_n, max_workers, indicator_book, skipped, ranking=None, indicator_memo=None,
+                with_keys=False) -> List[Dict]:
+    """
+    Tirgi dilstošā pct24h secībā, sveces pa viļņiem (`max_workers`). Ierobežota
+    min-kaudze tur labākos `top_n`; kad nākamā tirgus augšējā robeža ir zem N-tā
+    labākā punktu skaita, arī visi atlikušie to nevar pārspēt — ielāde apstājas.
+    Rezultāts sakrīt ar pilno rangošanu (tie paši punkti, tā pati secība).
+    """
+    pending = sorted(pending, key=lambda p: (-p[4], p[0]))
+    heap: List[tuple] = []  # (score, -rank_key) — mazākais ir sliktākais pēc _rank secības
+    evaluated: List[tuple] = []
+    wave = max(1, max_workers)
+    i = 0
+    with ThreadPoolExecutor(max_workers=wave) as pool:
+        while i < len(pending):
+            if len(heap) == top_n and score_upper_bound(pending[i][4], rsi_threshold, atr_score_cap) < heap[0][0]:
+                break
+            batch = pending[i:i + wave]
+            i += len(batch)
+            pids = list(dict.fromkeys(p[5] for p in batch))
+            frames = dict(zip(pids, pool.map(lambda pid: ohlcv_fetcher(pid, gran, 300), pids)))
+            for key, cand in _evaluate(batch, frames, gran, ma_period, rsi_threshold, atr_pct_min,
+                                       atr_score_cap, indicator_book, skipped, indicator_memo):
+                evaluated.append((key, cand))
+                heapq.heappush(heap, (cand["score"], tuple(-k for k in key)))
+                if len(heap) > top_n:
+                    heapq.heappop(heap)
+    for _, sym, *_rest in pending[i:]:
+        skipped.append({"symbol": sym, "reason": "pruned (best-first bound)"})
+    METRICS.inc("ranking_pruned", len(pending) - i)
+    return _rank(evaluated, top_n, ranking, with_keys)
+
+def compute_entry_sl_tp(row: Dict, candles: Candles) -> Dict:
+    last_close = float(candles.close[-1])
+    atr_val = (row["atrpct"] / 100.0) * last_close  # ATR price units
+    entry_ok = last_close > row["ma"] and row.get("rsi", 0) > 55
     advice = "GAIDĪT"
     if entry_ok:
         advice = "VAR PIRKT (momentum)"
-    swing_high = df["high"].tail(20).max()
-    entry = float(last["close"])
+    swing_high = float(candles.high[-20:].max())
+    entry = last_close
     sl = float(entry - 1.5 * atr_val)
     tp1 = float(entry + 1.0 * atr_val)
     tp2 = float(max(entry + 2.0 * atr_val, swing_high))
@@ -123,6 +321,11 @@ def load_prev_top(state_file: str) -> Tuple[List[str], Dict[str, int]]:
     ranks = {s: i+1 for i, s in enumerate(syms)}
     return syms, ranks
 
+def timeframe_state_file(state_file: str, timeframe: str) -> str:
+    """Vairāku TF režīmā katram TF savs state: last_top.json -> last_top_4h.json"""
+    stem, ext = os.path.splitext(state_file)
+    return f"{stem}_{timeframe}{ext or '.json'}"
+
 def diff_labels(current_syms: List[str], prev_syms: List[str]) -> Dict[str, str]:
     labels = {}
     for s in current_syms:
@@ -0,0 +1,156 @@
+"""
+Sliekšņu režģa meklēšana pār vēsturiskajām svecēm.
+
+Katru atšķirīgo indikatoru sēriju (RSI, ATR%, 24h %, apjoms un katru MA periodu)
+aprēķina vienreiz, saglabā `.npy` failos un darba procesi tos atver kā
+read-only memmap. Katras kombinācijas novērtēšana ir tikai maskas + punkti +
+backtest.simulate.
+
+    python -m src.sweep --store .candles --timeframes 1h,4h --ma 20,50 --rsi 50,55,60
+"""
+import argparse
+import itertools
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+
+from .candle_store import CandleStore
+from .indicators import sma_2d
+from .backtest import load_matrices, compute_features, score_matrix, simulate, stored_products
+
+PARAMS = ("MA_PERIOD", "RSI_THRESHOLD", "ATR_PCT_MIN", "MIN_24H_PCT", "MIN_24H_VOLUME_USD")
+
+# Darba procesu koplietotie (read-only) masīvi
+_SHARED: Dict[str, np.ndarray] = {}
+_META: Dict = {}
+
+def _share(arrays: Dict[str, np.ndarray], root: str) -> None:
+    for name, arr in arrays.items():
+        np.save(os.path.join(root, f"{name}.npy"), arr)
+
+def _init_worker(root: str, meta: Dict) -> None:
+    _SHARED.clear()
+    for f in os.listdir(root):
+        if f.endswith(".npy"):
+            _SHARED[f[:-4]] = np.load(os.path.join(root, f), mmap_mode="r")
+    _META.clear()
+    _META.update(meta)
+
+def _evaluate(combos: List[tuple]) -> List[Dict]:
+    data = {k: _SHARED[k] for k in ("times", "close", "high", "low")}
+    data["products"] = _META["products"]
+    features = {k: _SHARED[k] for k in ("pct24h", "vol24h_usd", "rsi", "atrpct", "swing_high")}
+    out = []
+    for combo in combos:
+        p = dict(zip(PARAMS, combo))
+        score = score_matrix(data, features, _SHARED[f"ma_{p['MA_PERIOD']}"], p["RSI_THRESHOLD"],
+                             p["ATR_PCT_MIN"], p["MIN_24H_VOLUME_USD"], p["MIN_24H_PCT"], _META["atr_score_cap"])
+        warmup = max(max(_META["ma_periods"]), 50, _META["bars_24h"])
+        rep = simulate(data, features, score, _META["top_n"], _META["hold_bars"], warmup,
+                       _META["fee_pct"], _META["take_profit"])
+        out.append({**p, **rep})
+    return out
+
+def run_sweep(data: Dict[str, np.ndarray], granularity_s: int, grid: Dict[str, List], top_n: int,
+              hold_bars: int = 1, fee_pct: float = 0.1, take_profit: str = "tp2",
+              workers: int = 0, chunk: int = 64, atr_score_cap: Optional[float] = None) -> List[Dict]:
+    """Novērtē visas `grid` kombinācijas; atgriež rezultātus (nesakārtotus)."""
+    ma_periods = sorted(set(grid["MA_PERIOD"]))
+    features = compute_features(data, granularity_s, ma_periods[0])
+    shared = {k: data[k] for k in ("times", "close", "high", "low")}
+    shared.update({k: features[k] for k in ("pct24h", "vol24h_usd", "rsi", "atrpct", "swing_high")})
+    shared.update({f"ma_{p}": sma_2d(data["close"], p) for p in ma_periods})
+    meta = {"products": list(data["products"]), "ma_periods": ma_periods, "bars_24h": max(1, 86400 // granularity_s),
+            "top_n": top_n, "hold_bars": hold_bars, "fee_pct": fee_pct, "take_profit": take_profit,
+            "atr_score_cap": atr_score_cap}
+
+    combos = list(itertools.product(*(grid[p] for p in PARAMS)))
+    chunks = [combos[i:i + chunk] for i in range(0, len(combos), chunk)]
+    with tempfile.TemporaryDirectory(prefix="rotator-sweep-") as root:
+        _share(shared, root)
+        if workers == 1 or len(chunks) == 1:
+            _init_worker(root, meta)
+            return [r for c in chunks for r in _evaluate(c)]
+        with ProcessPoolExecutor(max_workers=workers or None, initializer=_init_worker, initargs=(root, meta)) as pool:
+            return [r for part in pool.map(_evaluate, chunks) for r in part]
+
+def rank_results(results: List[Dict], metric: str = "total_return_pct", min_trades: int = 20) -> List[Dict]:
+    ok = [r for r in results if r.get("trades", 0) >= min_trades and r.get(metric) is not None]
+    return sorted(ok, key=lambda r: r[metric], reverse=True)
+
+# Apjoms backtestā ir Coinbase volume × close, dzīvajā filtrā — CoinGecko globālais total_volume
+# (citā mērogā), tāpēc MIN_24H_VOLUME_USD netiek izdots kā gatavs env, tikai kā komentārs.
+COINBASE_SCALE_PARAMS = ("MIN_24H_VOLUME_USD",)
+
+def env_overrides(best: Dict, timeframe: str) -> List[str]:
+    """Labākā kombinācija kā TF-konkrēti env (RSI_THRESHOLD_4H=58 u.c.)."""
+    suffix = timeframe.upper()
+    fmt = lambda v: int(v) if float(v).is_integer() else v
+    lines = [f"{p}_{suffix}={fmt(best[p])}" for p in PARAMS if p not in COINBASE_SCALE_PARAMS]
+    lines += [f"# {p}_{suffix}={fmt(best[p])}  (Coinbase volume x close scale, not CoinGecko total_volume)"
+              for p in COINBASE_SCALE_PARAMS]
+    return lines
+
+def print_table(rows: List[Dict], limit: int = 15) -> None:
+    cols = list(PARAMS) + ["total_return_pct", "max_drawdown_pct", "hit_rate_pct", "trades", "avg_turnover"]
+    print("  ".join(f"{c:>18}" for c in cols))
+    for r in rows[:limit]:
+        print("  ".join(f"{str(r.get(c)):>18}" for c in cols))
+
+def _floats(s: str) -> List[float]:
+    return [float(x) for x in s.split(",") if x.strip()]
+
+def main(argv=None):
+    from .config import load_settings, resolve_thresholds
+    from .data_sources import timeframe_to_granularity_seconds
+
+    ap = argparse.ArgumentParser(description="Relative Strength Rotator threshold sweep")
+    ap.add_argument("--store", default=".candles")
+    ap.add_argument("--timeframes", default=None, help="piem. 1h,4h (noklusēti TIMEFRAME)")
+    ap.add_argument("--bars", type=int, default=24 * 365)
+    ap.add_argument("--ma", default="20,50")
+    ap.add_argument("--rsi", default="50,55,60,65")
+    ap.add_argument("--atr", default="1.0,1.5,2.0,3.0")
+    ap.add_argument("--pct", default="1,2,3,5")
+    ap.add_argument("--vol", default="10000000,50000000,100000000")
+    ap.add_argument("--hold", type=int, default=1)
+    ap.add_argument("--fee-pct", type=float, default=0.1)
+    ap.add_argument("--take-profit", choices=["tp1", "tp2"], default="tp2")
+    ap.add_argument("--metric", default="total_return_pct")
+    ap.add_argument("--min-trades", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=0, help="0 = visi CPU")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--out", default="sweep_best.env")
+    args = ap.parse_args(argv)
+
+    cfg = load_settings(require_telegram=False)
+    grid = {
+        "MA_PERIOD": [int(x) for x in _floats(args.ma)],
+        "RSI_THRESHOLD": _floats(args.rsi),
+        "ATR_PCT_MIN": _floats(args.atr),
+        "MIN_24H_PCT": _floats(args.pct),
+        "MIN_24H_VOLUME_USD": _floats(args.vol),
+    }
+    store = CandleStore(args.store)
+    lines = []
+    for tf in (args.timeframes or cfg.TIMEFRAME).lower().split(","):
+        gran = timeframe_to_granularity_seconds(tf)
+        data = load_matrices(store, stored_products(store, gran), gran, args.bars)
+        n_combos = int(np.prod([len(v) for v in grid.values()]))
+        print(f"\n=== TF={tf}: {len(data['products'])} symbols × {len(data['times'])} bars, {n_combos} combinations ===")
+        print(f"Current: {resolve_thresholds(cfg, tf)}")
+        ranked = rank_results(run_sweep(data, gran, grid, cfg.TOP_N, args.hold, args.fee_pct, args.take_profit,
+                                         args.workers, atr_score_cap=cfg.ATR_SCORE_CAP), args.metric, args.min_trades)
+        print_table(ranked, args.top)
+        if ranked:
+            lines += [f"# {tf}: {args.metric}={ranked[0][args.metric]}"] + env_overrides(ranked[0], tf)
+
+    if lines:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"\nBest per-timeframe overrides -> {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# `src` un `main` importējami, palaižot pytest no jebkuras direktorijas
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_sources import set_transport  # noqa: E402
+from src.metrics import METRICS  # noqa: E402
+from src.ratelimit import LIMITER  # noqa: E402
+
+@pytest.fixture
+def use_transport():
+    """use_transport(t): visi HTTP pieprasījumi caur `t`, LIMITER izslēgts; pēc testa — atpakaļ."""
+    enabled = LIMITER.enabled
+    METRICS.reset()
+
+    def install(transport):
+        LIMITER.enabled = False
+        set_transport(transport)
+        return transport
+
+    yield install
+    set_transport(None)
+    LIMITER.enabled = enabled
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.backtest import compute_features, download_universe, score_matrix, simulate, stored_products
+from src.candle_store import CandleStore
+from src.config import Settings
+from src.replay import SyntheticTransport
+from src.strategy_rotator import make_candidate
+
+def _data(n=6, t=400, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.001, 0.03, (n, t)), axis=1))
+    return {
+        "times": 3600 * np.arange(t), "products": [f"C{i}-USD" for i in range(n - 1)] + ["USDT-USD"],
+        "close": close, "high": close * (1 + rng.uniform(0, 0.05, (n, t))),
+        "low": close * (1 - rng.uniform(0, 0.05, (n, t))), "open": close, "volume": rng.uniform(1e4, 1e6, (n, t)),
+    }
+
+@pytest.mark.parametrize("atr_score_cap", [None, 0.5])
+def test_score_matrix_matches_live_candidates(atr_score_cap):
+    """Backtesta punkti = filter_and_rank make_candidate punkti tiem pašiem indikatoriem (arī ar ATR_SCORE_CAP)."""
+    data = _data()
+    f = compute_features(data, 3600, 20)
+    rsi_threshold, atr_pct_min = 50.0, 1.0
+    score = score_matrix(data, f, f["ma"], rsi_threshold, atr_pct_min, 0.0, -100.0, atr_score_cap)
+    checked = 0
+    for i, pid in enumerate(data["products"]):
+        for j in range(30, data["close"].shape[1]):
+            last = {"close": data["close"][i, j], "prev_close": data["close"][i, j - 1], "ma": f["ma"][i, j],
+                    "rsi": f["rsi"][i, j], "atrpct": f["atrpct"][i, j]}
+            cand, _ = make_candidate(pid, pid, pid, 0.0, f["pct24h"][i, j], last, rsi_threshold, atr_pct_min,
+                                     atr_score_cap)
+            if pid.startswith("USDT") or cand is None:
+                assert score[i, j] == -np.inf
+            else:
+                assert score[i, j] == pytest.approx(cand["score"], rel=1e-12)
+                checked += 1
+    assert checked > 100
+
+def _flat_rotation(t=12):
+    """Viens simbols vienmēr top-1, cena +1% katrā bārā; SL/TP tālu (ATR 50%)."""
+    close = 100 * 1.01 ** np.arange(t)[None, :]
+    data = {"times": 3600 * np.arange(t), "products": ["A-USD"], "close": close.copy(),
+            "high": close * 1.001, "low": close * 0.999}
+    features = {"atrpct": np.full((1, t), 50.0), "swing_high": np.full((1, t), np.nan)}
+    return data, features
+
+def _score(data):
+    return np.where(np.isfinite(data["close"]), 1.0, -np.inf)  # kā score_matrix: bez close nav kandidāta
+
+def test_missing_exit_close_is_excluded_not_zero():
+    data, features = _flat_rotation()
+    data["close"][0, 5] = data["high"][0, 5] = data["low"][0, 5] = np.nan  # robs: bārā 4 nopirktajam nav izejas
+    rep = simulate(data, features, _score(data), top_n=1, hold_bars=1, warmup=2, fee_pct=0.0)
+    assert rep["excluded_no_exit"] == 1
+    assert rep["trades"] == rep["periods"] - 2  # izslēgtā + bārs 5 bez cenas
+    assert rep["hit_rate_pct"] == 100.0  # nevis 0 % pozīcija, kas samazina trāpījumu daļu
+
+def test_missing_exit_close_exits_at_last_valid_close():
+    data, features = _flat_rotation()
+    data["close"][0, 5] = np.nan  # logā 3..5 pēdējais close trūkst -> izeja bārā 4 (+2 bāri)
+    rep = simulate(data, features, _score(data), top_n=1, hold_bars=3, warmup=2, fee_pct=0.0)
+    assert rep["early_exits"] == 1 and rep["excluded_no_exit"] == 0
+    assert rep["trades"] == 2  # bāri 2 un 8 (bārā 5 nav cenas)
+    assert rep["avg_trade_pct"] == pytest.approx(((1.01 ** 2 - 1) + (1.01 ** 3 - 1)) / 2 * 100, abs=1e-3)
+
+@pytest.mark.parametrize("mode, symbols, expected", [
+    ("TOP300", [], [f"C{i}-USD" for i in range(300)]),
+    ("MANUAL", ["C7", "C2"], ["C2-USD", "C7-USD"]),
+])
+def test_download_universe_follows_watchlist_mode(use_transport, tmp_path, mode, symbols, expected):
+    use_transport(SyntheticTransport(400, candles=50))
+    cfg = Settings(TELEGRAM_BOT_TOKEN="t", TELEGRAM_CHAT_IDS=["1"], WATCHLIST_MODE=mode, MANUAL_SYMBOLS=symbols,
+                   STATE_FILE=str(tmp_path / "last_top.json"))
+    store = CandleStore(str(tmp_path / "candles"), history=50)
+    assert sorted(download_universe(cfg, store, 3600, 50), key=lambda p: int(p[1:-4])) == expected
+    assert stored_products(store, 3600) == sorted(expected)
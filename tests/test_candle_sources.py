@@ -0,0 +1,86 @@
+import time
+
+import httpx
+import pytest
+
+from src.candle_sources import AdvancedTradeCandles, ExchangeCandles, HedgedSource
+from src.config import Settings
+from src.metrics import METRICS
+from src.replay import LatencyTransport, SyntheticTransport
+
+CFG = Settings(TELEGRAM_BOT_TOKEN="t", TELEGRAM_CHAT_IDS=["1"])
+EXCHANGE, ADVANCED = "api.exchange.coinbase.com", "api.coinbase.com"
+
+class FailingHost(httpx.BaseTransport):
+    """`host` atbild ar 503, pārējie — `inner`."""
+
+    def __init__(self, inner, host):
+        self.inner, self.host = inner, host
+
+    def handle_request(self, request):
+        if request.url.host == self.host:
+            return httpx.Response(503, json={"message": "unavailable"})
+        return self.inner.handle_request(request)
+
+@pytest.fixture
+def hedged(use_transport):
+    """hedged(profile, failing_host=None, **kw) -> HedgedSource(exchange, advanced) caur LatencyTransport."""
+    made = []
+
+    def make(profile, failing_host=None, **kw):
+        inner = SyntheticTransport(4)
+        if failing_host:
+            inner = FailingHost(inner, failing_host)
+        use_transport(LatencyTransport(inner, profile))
+        src = HedgedSource(ExchangeCandles(CFG.COINBASE_BASE), AdvancedTradeCandles(CFG.COINBASE_ADVANCED_BASE), **kw)
+        made.append(src)
+        return src
+    yield make
+    for src in made:
+        src.close()
+
+def _requests(host):
+    return sum(r["endpoint"].startswith(host) for r in METRICS.report()["requests"])
+
+def test_fast_primary_is_not_hedged(hedged):
+    src = hedged({EXCHANGE: (0.01, 0, 0), ADVANCED: (0.01, 0, 0)}, initial_delay_s=0.3)
+    for _ in range(3):
+        assert src("C1-USD", 3600)
+    assert src.stats["hedged"] == 0 and _requests(ADVANCED) == 0
+
+def test_hedge_fires_after_delay_and_secondary_wins(hedged):
+    src = hedged({EXCHANGE: (0.8, 0, 0), ADVANCED: (0.02, 0, 0)}, initial_delay_s=0.1)
+    t0 = time.perf_counter()
+    rows = src("C1-USD", 3600)
+    elapsed = time.perf_counter() - t0
+    assert 0.1 <= elapsed < 0.5
+    assert src.stats["hedged"] == 1 and src.stats["hedge_won"] == 1
+    assert rows == SyntheticTransport(4).candle_rows("C1-USD", 3600)[::-1]
+
+def test_delay_follows_primary_p95(hedged):
+    src = hedged({EXCHANGE: (0.05, 0, 0)}, initial_delay_s=5.0, min_samples=16)
+    assert src.hedge_delay() == 5.0
+    for _ in range(16):
+        src("C1-USD", 3600)
+    # pēc min_samples slieksnis = primārā p95 (spaiņa augšējā robeža, solis 1.1x), nevis initial_delay_s
+    assert src.hedge_delay() == src.primary.latency.quantile(0.95)
+    assert 0.05 <= src.hedge_delay() < 0.1
+    assert src.stats["hedged"] == 0
+
+def test_primary_error_fails_over(hedged):
+    src = hedged({}, failing_host=EXCHANGE, initial_delay_s=1.0)
+    assert src("C2-USD", 3600)
+    assert src.stats["failover"] == 1 and src.stats["hedged"] == 0
+
+def test_budget_caps_duplicate_requests(hedged):
+    src = hedged({EXCHANGE: (0.1, 0, 0), ADVANCED: (0.01, 0, 0)}, initial_delay_s=0.02, max_ratio=0.25)
+    for _ in range(8):
+        src("C1-USD", 3600)
+    assert src.stats["hedged"] == 2 and src.stats["budget_denied"] == 6
+    assert _requests(ADVANCED) == 2
+
+def test_budget_exhausted_primary_error_falls_back(hedged):
+    src = hedged({EXCHANGE: (0.1, 0, 0)}, failing_host=EXCHANGE, initial_delay_s=0.02, max_ratio=0.0)
+    assert src("C1-USD", 3600)  # vienīgais atļautais hedžs
+    assert src("C2-USD", 3600)  # budžets beidzies: gaida primāro, tas krīt -> sekundārais
+    assert src.stats["hedged"] == 1 and src.stats["budget_denied"] == 1 and src.stats["failover"] == 1
@@ -0,0 +1,38 @@
+import os
+import threading
+
+from src.http_cache import HttpCache
+
+def test_shared_dir_concurrent_put_get_evict(tmp_path):
+    """Vairāki HttpCache (kā --shard procesi) vienā direktorijā ar mazu limitu: izmešana sacenšas ar lasīšanu."""
+    caches = [HttpCache(str(tmp_path), max_bytes=2000) for _ in range(4)]
+    errors = []
+
+    def work(cache, n):
+        try:
+            for i in range(150):
+                key = f"https://api.test/markets?page={(i + n) % 12}"
+                cache.put(key, {"rows": list(range(40)), "n": n})
+                entry = cache.get(key)
+                assert entry is None or entry["key"] == key
+        except Exception as e:  # noqa: BLE001 — jebkura kļūda ir testa kļūme
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(c, n)) for n, c in enumerate(caches)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(".tmp")]
+
+def test_entry_evicted_during_get_is_a_miss(tmp_path, monkeypatch):
+    cache = HttpCache(str(tmp_path))
+    cache.put("k", {"a": 1})
+
+    def evicted(path, *args, **kwargs):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr("src.http_cache.os.utime", evicted)
+    assert cache.get("k") is None
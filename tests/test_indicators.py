@@ -0,0 +1,120 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.candles import to_candles
+from src.indicators import (sma, rsi, atr_pct, stack_right_aligned, sma_2d, rsi_2d, atr_pct_2d, last_values_2d,
+                            IndicatorBook, IndicatorState)
+from src.strategy_rotator import filter_and_rank
+
+def _frames(n=12, seed=0):
+    """Dažāda garuma sveču virknes (arī īsākas par MA logu), kā no Coinbase."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(n):
+        t = int(rng.integers(5, 300)) if i % 3 else 300
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, t)))
+        high = close * (1 + rng.uniform(0, 0.02, t))
+        low = close * (1 - rng.uniform(0, 0.02, t))
+        if i == 1:
+            close[:] = close[0]  # plakana virkne: RSI dalījums ar 0
+            high[:] = low[:] = close
+        out.append(pd.DataFrame({"high": high, "low": low, "close": close}))
+    return out
+
+def _matrices(frames):
+    return tuple(stack_right_aligned([f[c].to_numpy() for f in frames]) for c in ("close", "high", "low"))
+
+def _assert_right_aligned(batch, series_list):
+    for row, s in zip(batch, series_list):
+        expected = s.to_numpy()
+        np.testing.assert_allclose(row[len(row) - len(expected):], expected, rtol=1e-10, atol=1e-10)
+
+@pytest.mark.parametrize("period", [5, 20, 50])
+def test_sma_2d_matches_pandas(period):
+    frames = _frames()
+    close, _, _ = _matrices(frames)
+    _assert_right_aligned(sma_2d(close, period), [sma(f["close"], period) for f in frames])
+
+def test_rsi_2d_matches_pandas():
+    frames = _frames()
+    close, _, _ = _matrices(frames)
+    _assert_right_aligned(rsi_2d(close, 14), [rsi(f["close"], 14) for f in frames])
+
+def test_atr_pct_2d_matches_pandas():
+    frames = _frames()
+    close, high, low = _matrices(frames)
+    _assert_right_aligned(atr_pct_2d(high, low, close, 14), [atr_pct(f, 14) for f in frames])
+
+@pytest.mark.parametrize("ma_period", [20, 50])
+def test_last_values_2d_matches_pandas(ma_period):
+    frames = _frames(seed=1)
+    close, high, low = _matrices(frames)
+    last = last_values_2d(close, high, low, ma_period)
+    for i, f in enumerate(frames):
+        np.testing.assert_allclose(last["close"][i], f["close"].iloc[-1])
+        np.testing.assert_allclose(last["prev_close"][i], f["close"].iloc[-2])
+        np.testing.assert_allclose(last["ma"][i], sma(f["close"], ma_period).iloc[-1], rtol=1e-10, equal_nan=True)
+        np.testing.assert_allclose(last["rsi"][i], rsi(f["close"], 14).iloc[-1], rtol=1e-10, equal_nan=True)
+        np.testing.assert_allclose(last["atrpct"][i], atr_pct(f, 14).iloc[-1], rtol=1e-10)
+
+def _hourly_rows(pid_seed, n=300, gran=3600):
+    """Aizvērtas stundas sveces, pēdējā beidzas pirms pašreizējās stundas."""
+    rng = np.random.default_rng(pid_seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.002, 0.02, n)))
+    end = int(time.time()) // gran * gran - gran
+    return [[end - gran * (n - 1 - i), close[i] * 0.99, close[i] * 1.01, close[i], close[i], 1000.0] for i in range(n)]
+
+def test_indicator_book_keeps_state_per_ma_period(tmp_path):
+    """Divi profili ar dažādu MA_PERIOD, divi skrējieni: otrajā nekas netiek pārbūvēts."""
+    rows = {f"S{i}-USD": _hourly_rows(i) for i in range(3)}
+    markets = [{"symbol": f"S{i}", "name": f"S{i}", "total_volume": 1e9, "price_change_percentage_24h": 5.0}
+               for i in range(3)]
+    s2p = {f"S{i}": f"S{i}-USD" for i in range(3)}
+    path = str(tmp_path / "last_top.indicators.json")
+
+    def run(window):
+        book = IndicatorBook(path)
+        for ma_period in (20, 50):
+            filter_and_rank(markets, s2p, lambda pid, gran, lim: to_candles(window(rows[pid])), "1h", ma_period,
+                            0, 0, 0, -100, top_n=3, indicator_book=book)
+        book.save()
+        return IndicatorBook(path).states
+
+    first = run(lambda r: r[:-1])
+    assert sorted(first) == sorted(f"S{i}-USD:3600:{ma}" for i in range(3) for ma in (20, 50))
+    assert all(st.count == 299 for st in first.values())
+    # otrajā skrējienā tikai pēdējās 50 sveces: pārbūvēts stāvoklis būtu count=50
+    second = run(lambda r: r[-50:])
+    assert all(st.count == 300 and st.ma_period == int(k.rsplit(":", 1)[1]) for k, st in second.items())
+
+def test_indicator_book_loads_old_keys(tmp_path):
+    path = tmp_path / "last_top.indicators.json"
+    st = IndicatorState(20)
+    for row in _hourly_rows(0, 30):
+        st.update(row)
+    path.write_text(json.dumps({"S0-USD:3600": st.to_dict()}))
+    book = IndicatorBook(str(path))
+    assert book.get("S0-USD", 3600, 20).count == 30
+    assert book.get("S0-USD", 3600, 50).count == 0
+
+def test_streaming_mode_skips_batch_pass(tmp_path, monkeypatch):
+    """Ar indicator_book pilnā loga last_values_2d netiek rēķināts (tikai O(1) stāvokļa atjaunošana)."""
+    from src.metrics import METRICS
+
+    def no_batch(*args, **kwargs):
+        raise AssertionError("last_values_2d called in streaming mode")
+
+    monkeypatch.setattr("src.strategy_rotator.last_values_2d", no_batch)
+    METRICS.reset()
+    rows = _hourly_rows(0)
+    markets = [{"symbol": "S0", "name": "S0", "total_volume": 1e9, "price_change_percentage_24h": 5.0}]
+    book = IndicatorBook(str(tmp_path / "last_top.indicators.json"))
+    ranked, skipped = filter_and_rank(markets, {"S0": "S0-USD"}, lambda pid, gran, lim: to_candles(rows), "1h", 20,
+                                      0, 0, 0, -100, top_n=1, indicator_book=book)
+    assert len(ranked) + len(skipped) == 1
+    assert book.get("S0-USD", 3600, 20).count == 300
+    assert "indicator_batch_seconds" not in METRICS.report()["observations"]
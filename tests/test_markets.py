@@ -0,0 +1,50 @@
+import time
+
+import httpx
+
+from src.data_sources import MarketFeed, iter_top_markets, resolve_coingecko_ids
+from src.metrics import METRICS
+from src.strategy_rotator import _cheap_filter
+
+BASE = "https://api.coingecko.test/api/v3"
+
+def _markets_transport(n, slow_page=1, delay=0.2):
+    """CoinGecko /coins/markets bez market_cap_rank; `slow_page` atnāk pēdējā."""
+    rows = [{"id": f"c{i}", "symbol": f"s{i}", "name": f"C{i}", "total_volume": 1e9,
+             "price_change_percentage_24h": 5.0, "market_cap_rank": None} for i in range(n)]
+
+    def handler(request):
+        q = request.url.params
+        per_page, page = int(q["per_page"]), int(q["page"])
+        if page == slow_page:
+            time.sleep(delay)
+        return httpx.Response(200, json=rows[(page - 1) * per_page: page * per_page])
+    return httpx.MockTransport(handler)
+
+def test_rank_key_follows_source_order_not_arrival(use_transport):
+    use_transport(_markets_transport(600))
+    feed = MarketFeed(iter_top_markets(BASE, 600))
+    arrived = [m["symbol"] for m in feed]
+    assert arrived[0] != "s0"  # 1. lapa atnāca pēdējā
+    s2p = {f"S{i}": f"S{i}-USD" for i in range(600)}
+    pending = _cheap_filter(feed, s2p, 0, 0, [])
+    assert [p[1] for p in sorted(pending, key=lambda p: p[0])] == [f"S{i}" for i in range(600)]
+    assert METRICS.stages["market_fetch"] >= 0.2
+    assert METRICS.counters["markets_fetched"] == 600
+
+def test_coingecko_ids_cached_without_http_cache(use_transport, tmp_path):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json=[{"id": "bitcoin", "symbol": "btc"}, {"id": "ethereum", "symbol": "eth"}])
+
+    use_transport(httpx.MockTransport(handler))
+    path = str(tmp_path / "last_top.coingecko_ids.json")
+    first = resolve_coingecko_ids(BASE, ["btc", "ETH"], ttl_s=3600, ids_file=path)
+    again = resolve_coingecko_ids(BASE, ["ETH", "BTC"], ttl_s=3600, ids_file=path)
+    assert first == again == {"BTC": ["bitcoin"], "ETH": ["ethereum"]}
+    assert len(calls) == 1
+    resolve_coingecko_ids(BASE, ["BTC", "SOL"], ttl_s=3600, ids_file=path)  # cits saraksts
+    resolve_coingecko_ids(BASE, ["BTC", "SOL"], ttl_s=0, ids_file=path)  # novecojis
+    assert len(calls) == 3
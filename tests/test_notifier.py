@@ -0,0 +1,47 @@
+import time
+
+import httpx
+
+from src.notifier import send_telegram_message
+
+def _sender(outcomes):
+    """MockTransport, kas pēc kārtas atgriež/izmet `outcomes`; pēdējais atkārtojas."""
+    calls = []
+
+    def handler(request):
+        calls.append(time.perf_counter())
+        out = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(out, Exception):
+            raise out
+        return out
+
+    return httpx.MockTransport(handler), calls
+
+def _ok():
+    return httpx.Response(200, json={"ok": True})
+
+def test_read_timeout_is_not_retried(use_transport):
+    transport, calls = _sender([httpx.ReadTimeout("slow"), _ok()])
+    use_transport(transport)
+    [r] = send_telegram_message("T", ["1"], "hi")
+    assert not r["ok"] and r["attempts"] == 1 and len(calls) == 1
+
+def test_connect_error_and_5xx_are_retried(use_transport):
+    transport, calls = _sender([httpx.ConnectError("refused"), httpx.Response(502, json={"ok": False}), _ok()])
+    use_transport(transport)
+    [r] = send_telegram_message("T", ["1"], "hi")
+    assert r["ok"] and r["attempts"] == 3
+
+def test_client_error_is_not_retried(use_transport):
+    transport, calls = _sender([httpx.Response(403, json={"ok": False, "description": "blocked"}), _ok()])
+    use_transport(transport)
+    [r] = send_telegram_message("T", ["1"], "hi")
+    assert not r["ok"] and r["status"] == 403 and len(calls) == 1
+
+def test_429_waits_for_retry_after(use_transport):
+    limited = httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 0.3}})
+    transport, calls = _sender([limited, _ok()])
+    use_transport(transport)
+    [r] = send_telegram_message("T", ["1"], "hi")
+    assert r["ok"] and r["attempts"] == 2
+    assert calls[1] - calls[0] >= 0.25
@@ -0,0 +1,40 @@
+import collections
+import re
+from datetime import datetime
+
+import httpx
+
+from src.config import Settings
+from src.pipeline import fetch_plan, make_candle_cache
+
+NOW = 1_760_000_000
+
+def _candles_transport(calls):
+    """Coinbase Exchange sveces, kas ievēro start/end un 300 sveču lapas (jaunākās pirmās)."""
+    def handler(request):
+        pid = re.search(r"/products/([^/]+)/candles", request.url.path).group(1)
+        q = request.url.params
+        gran = int(q["granularity"])
+        ts = lambda k, default: int(datetime.fromisoformat(q[k]).timestamp()) if k in q else default
+        end = ts("end", NOW) // gran * gran
+        start = max(ts("start", 0), end - 299 * gran)
+        calls[pid] += 1
+        return httpx.Response(200, json=[[t, 1.0, 2.0, 1.5, 1.5, 10.0] for t in range(end, start - 1, -gran)])
+    return httpx.MockTransport(handler)
+
+def test_fetch_plan_groups_by_native_granularity():
+    assert fetch_plan(["15m", "1h", "4h"]) == {900: (900, 300), 3600: (3600, 1200), 14400: (3600, 1200)}
+    assert fetch_plan(["1h"]) == {3600: (3600, 300)}
+
+def test_cold_multi_timeframe_run_requests_per_product(use_transport, monkeypatch):
+    monkeypatch.setattr("time.time", lambda: NOW)
+    calls = collections.Counter()
+    use_transport(_candles_transport(calls))
+    cfg = Settings(TELEGRAM_BOT_TOKEN="t", TELEGRAM_CHAT_IDS=["1"])
+    timeframes = ["15m", "1h", "4h"]
+    candles = make_candle_cache(cfg, timeframes)
+    for pid in ("A-USD", "B-USD"):
+        for gran in (900, 3600, 14400):
+            assert len(candles(pid, gran, 300)) == 300
+    # 15m: 1 lapa; 1h + 4h: 1200 stundas sveces = 4 lapas (nevis 4800 × 15m = 16 lapas)
+    assert calls == {"A-USD": 5, "B-USD": 5}
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.candles import to_candles
+from src.strategy_rotator import filter_and_rank
+
+def _rows(seed, n=300, gran=3600):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.002, 0.02, n)))
+    t = 1_700_000_000 - gran * (n - 1 - np.arange(n))
+    return [[int(t[i]), close[i] * (1 - rng.uniform(0, 0.02)), close[i] * (1 + rng.uniform(0, 0.02)),
+             close[i], close[i], 1000.0] for i in range(n)]
+
+def _universe(seed, n):
+    """Nejaušs universs ar neizšķirtiem: pct pa 0.5 soļiem, daļai nav market_cap_rank, sveces atkārtojas."""
+    rng = np.random.default_rng(seed)
+    markets = [{"symbol": f"S{i}", "name": f"S{i}", "total_volume": 1e8,
+                "price_change_percentage_24h": float(np.round(rng.uniform(-2, 12) * 2) / 2),
+                "market_cap_rank": int(rng.integers(1, n)) if rng.random() < 0.7 else None} for i in range(n)]
+    series = int(rng.integers(n // 4, n))  # vairākiem produktiem tās pašas sveces -> vienādi punkti
+    frames = {f"S{i}-USD": to_candles(_rows(seed * 1000 + i % series)) for i in range(n)}
+    return markets, {f"S{i}": f"S{i}-USD" for i in range(n)}, frames
+
+@pytest.mark.parametrize("seed", range(12))
+def test_best_first_matches_exhaustive(seed):
+    """Best-first dod to pašu Top-N un pilno rangu (secību un punktus) kā pilnā rangošana."""
+    rng = np.random.default_rng(seed)
+    markets, s2p, frames = _universe(seed, int(rng.integers(20, 150)))
+    fetched = []
+
+    def fetch(pid, gran, limit):
+        fetched.append(pid)
+        return frames[pid]
+
+    kw = dict(markets=markets, symbol_to_product=s2p, ohlcv_fetcher=fetch, timeframe="1h",
+              ma_period=int(rng.choice([10, 20, 50])), rsi_threshold=float(rng.uniform(40, 60)),
+              atr_pct_min=float(rng.uniform(0, 2)), min_24h_volume_usd=1, min_24h_pct=0,
+              top_n=int(rng.integers(1, 12)), atr_score_cap=float(rng.choice([0.5, 2.0, 10.0])),
+              max_workers=int(rng.integers(1, 9)))
+    full, best = [], []
+    exhaustive, _ = filter_and_rank(ranking=full, **kw)
+    n_exhaustive = len(fetched)
+    fetched.clear()
+    pruned, skipped = filter_and_rank(best_first=True, ranking=best, **kw)
+    assert pruned == exhaustive
+    assert len(fetched) <= n_exhaustive
+    # novērtētie ir pilnā ranga prefikss punktu ziņā: neviens izlaistais nav labāks par N-to
+    assert best == [c for c in full if c["symbol"] in {b["symbol"] for b in best}]
+    if len(exhaustive) == kw["top_n"]:
+        kept = {b["symbol"] for b in best}
+        assert all(c["score"] <= exhaustive[-1]["score"] for c in full if c["symbol"] not in kept)
@@ -0,0 +1,19 @@
+import time
+
+import httpx
+
+from src.data_sources import _get, get_client
+
+def test_429_retry_backs_off_without_limiter(use_transport):
+    """Atskaņošanā LIMITER ir izslēgts, bet 429 atkārtojumam joprojām ir eksponenciāls minimums."""
+    calls = []
+
+    def handler(request):
+        calls.append(time.perf_counter())
+        return httpx.Response(429 if len(calls) < 3 else 200, json={"ok": True})
+
+    use_transport(httpx.MockTransport(handler))
+    assert _get(get_client(), "https://api.example.test/x") == {"ok": True}
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.2
+    assert calls[2] - calls[1] >= calls[1] - calls[0]
@@ -0,0 +1,61 @@
+import contextlib
+import gzip
+import io
+import json
+import re
+import sqlite3
+
+import pytest
+
+import main
+from src.replay import SYNTHETIC_NOW, SyntheticTransport
+
+PROFILES = {"a": {"TELEGRAM_CHAT_IDS": ["1"], "TOP_N": 5, "TIMEFRAMES": ["1h", "4h"]},
+            "b": {"TELEGRAM_CHAT_IDS": ["2"], "TOP_N": 8, "RSI_THRESHOLD": 55, "LONG_FORMAT": True},
+            "c": {"TELEGRAM_CHAT_IDS": ["3"], "TOP_N": 3, "MA_PERIOD": 50, "TIMEFRAME": "4h"}}
+
+def _run(directory, argv, monkeypatch):
+    directory.mkdir(exist_ok=True)
+    monkeypatch.chdir(directory)
+    (directory / "profiles.json").write_text(json.dumps(PROFILES))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        main.main(argv)
+    return out.getvalue()
+
+def _summaries(text):
+    return [re.sub(r"Candle cache.*", "", re.sub(r"\d\d:\d\d Rīga", "HH:MM Rīga", s)).strip()
+            for s in text.split("=== SUMMARY")[1:]]
+
+def _outputs(directory):
+    state = {p.name: p.read_text() for p in sorted(directory.glob("last_top*.json"))}
+    with sqlite3.connect(directory / "h.sqlite") as c:
+        entries = sorted(c.execute("select timeframe, symbol, rank, in_top, score, reason from entries"), key=str)
+        latest = sorted(c.execute("select * from latest"))
+    return state, entries, latest
+
+@pytest.mark.parametrize("n_shards, best_first", [(1, "false"), (3, "false"), (3, "true")])
+def test_merged_shards_match_single_node(n_shards, best_first, use_transport, monkeypatch, tmp_path):
+    """--shard 1..N + --merge: tās pašas ziņas, state faili un vēsture kā viena mezgla skrējienā (2 skrējieni)."""
+    synth = use_transport(SyntheticTransport(150))
+    for k, v in dict(TELEGRAM_BOT_TOKEN="x", TELEGRAM_CHAT_IDS="1", PROFILES_FILE="profiles.json",
+                     MIN_24H_PCT="0", MIN_24H_VOLUME_USD="0", HISTORY_DB="h.sqlite", BEST_FIRST=best_first,
+                     ATR_SCORE_CAP="5", ADVICE_ENABLED="true").items():
+        monkeypatch.setenv(k, v)
+    for k in ("HTTP_REPLAY", "HTTP_RECORD", "HTTP_CACHE_DIR", "CANDLE_STORE_DIR"):
+        monkeypatch.delenv(k, raising=False)
+    single, sharded = tmp_path / "single", tmp_path / "sharded"
+    for rnd in range(2):  # otrajā — NEW/KEEP/DROP pret pirmā state/vēsturi
+        synth.now = SYNTHETIC_NOW + rnd * 14400
+        synth._candles.clear()
+        expected = _run(single, [], monkeypatch)
+        for i in range(n_shards):
+            _run(sharded, ["--shard", f"{i + 1}/{n_shards}"], monkeypatch)
+        merged = _run(sharded, ["--merge"] + [f"partial_{i + 1}of{n_shards}.json.gz" for i in range(n_shards)],
+                      monkeypatch)
+        for i in range(n_shards):  # standarta JSON (bez Infinity/NaN) ne-Python lasītājiem
+            with gzip.open(sharded / f"partial_{i + 1}of{n_shards}.json.gz", "rt", encoding="utf-8") as f:
+                json.load(f, parse_constant=lambda c: pytest.fail(f"non-standard JSON constant {c}"))
+        assert len(_summaries(expected)) == 3
+        assert _summaries(merged) == _summaries(expected)
+        assert _outputs(sharded) == _outputs(single)